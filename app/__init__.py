@@ -1,6 +1,8 @@
-from flask import Flask
+from flask import Flask, request
 from flask_login import LoginManager
 from app.models import db, Store
+from app import search, instrumentation, money
+from werkzeug.exceptions import HTTPException
 import os
 
 
@@ -21,7 +23,33 @@ def create_app(test_config=None):
         SQLALCHEMY_TRACK_MODIFICATIONS=False,
         SQLALCHEMY_ENGINE_OPTIONS={
             'pool_pre_ping': True,
-        }
+        },
+        # ラベル用フォント（未指定の場合はシステムの日本語フォントを探す）
+        LABEL_FONT_PATH=os.environ.get('LABEL_FONT_PATH'),
+        LABEL_FONT_SUBSET_PATH=os.environ.get('LABEL_FONT_SUBSET_PATH'),
+        LABEL_FONT_WARMUP=True,
+        # この枚数以上のラベル印刷はバックグラウンドのプロセスプールで生成する
+        LABEL_ASYNC_THRESHOLD=int(os.environ.get('LABEL_ASYNC_THRESHOLD', 1000)),
+        LABEL_JOB_WORKERS=int(os.environ.get('LABEL_JOB_WORKERS', 1)),
+        LABEL_JOB_TTL=int(os.environ.get('LABEL_JOB_TTL', 3600)),  # 生成したPDFの保存期間(秒)
+        LABEL_JOB_DIR=os.environ.get('LABEL_JOB_DIR'),  # 未指定の場合は instance/label_jobs
+        # 生成済みラベルPDFのキャッシュ容量(バイト)。0でキャッシュしない
+        LABEL_CACHE_MAX_BYTES=int(os.environ.get('LABEL_CACHE_MAX_BYTES', 256 * 1024 * 1024)),
+        LABEL_CACHE_DIR=os.environ.get('LABEL_CACHE_DIR'),  # 未指定の場合は instance/label_cache
+        # 一覧のページネーション方式: 'offset'(ページ番号) / 'keyset'(前へ・次へのみ、件数の多い店舗向け)
+        LISTING_PAGINATION=os.environ.get('LISTING_PAGINATION', 'offset'),
+        # 店舗の原価設定のキャッシュ（ワーカーごと）の件数上限と有効期限(秒)
+        STORE_CONFIG_CACHE_SIZE=int(os.environ.get('STORE_CONFIG_CACHE_SIZE', 256)),
+        STORE_CONFIG_CACHE_TTL=int(os.environ.get('STORE_CONFIG_CACHE_TTL', 300)),
+        # 想定外の遅延ロード(app.loading)をエラーにする。未指定ならデバッグ・テスト時のみ
+        RAISE_ON_LAZY_LOAD=None,
+        # リクエストごとのクエリ数・処理時間の計測（app.instrumentation）
+        INSTRUMENTATION_ENABLED=os.environ.get('INSTRUMENTATION_ENABLED', '').lower() in ('1', 'true', 'yes'),
+        METRICS_PATH=os.environ.get('METRICS_PATH', '/metrics'),
+        METRICS_TOKEN=os.environ.get('METRICS_TOKEN'),  # 未指定なら /metrics は 404。指定した場合は Authorization: Bearer が必要
+        # ブループリント（またはエンドポイント、'*' で全体）ごとのクエリ数の上限 例: {'recipes': 10}
+        QUERY_BUDGETS={},
+        QUERY_BUDGET_ACTION=os.environ.get('QUERY_BUDGET_ACTION', 'log'),  # 'log' / 'raise'
     )
 
     if test_config:
@@ -55,24 +83,39 @@ def create_app(test_config=None):
     app.register_blueprint(labels.bp)
     app.register_blueprint(custom_costs.bp)
 
+    # 金額の表示（端数処理は app.money.DISPLAY_ROUNDING）
+    app.add_template_filter(money.format_yen, 'yen')
+
     # エラーハンドラー
     @app.errorhandler(500)
     def internal_error(error):
-        import traceback
-        print("[ERROR] Internal Server Error:")
-        print(traceback.format_exc())
+        app.logger.error('Internal Server Error: %s %s', request.method, request.path,
+                         exc_info=getattr(error, 'original_exception', None) or error)
         db.session.rollback()
         return "Internal Server Error - Please check the logs", 500
 
     @app.errorhandler(Exception)
     def handle_exception(e):
-        import traceback
-        print(f"[ERROR] Unhandled exception: {e}")
-        print(traceback.format_exc())
+        # 404などのHTTPエラーはそのまま返す（500にしない）
+        if isinstance(e, HTTPException):
+            return e
+        app.logger.exception('Unhandled exception: %s %s', request.method, request.path)
+        db.session.rollback()
         return f"An error occurred: {str(e)}", 500
 
+    # クエリ数・処理時間の計測
+    if app.config['INSTRUMENTATION_ENABLED']:
+        instrumentation.init_instrumentation(app)
+
     # データベーステーブル作成
     with app.app_context():
         db.create_all()
 
+    # 名前の部分一致検索用の索引（pg_trgm / FTS5）
+    search.init_search(app)
+
+    # ラベル用フォントを起動時に解決しておく（リクエストごとのフォント解析を避ける）
+    if app.config['LABEL_FONT_WARMUP']:
+        labels.warm_up_fonts(app)
+
     return app
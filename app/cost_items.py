@@ -0,0 +1,138 @@
+"""
+カスタム原価項目の一括更新（並べ替え・有効/無効の切り替え）
+
+対象項目の所有者確認と現在の状態の取得を1回のクエリで行い、
+書き込みは UPDATE ... SET 列 = CASE id WHEN ... END の1文で行います。
+
+楽観的排他制御:
+画面の表示時に items_version() の値を渡しておき、更新時に送り返してもらいます。
+その間に別のタブなどで項目が変更されていれば ConcurrentUpdateError になります。
+UPDATE文の条件にも読み込んだ時点の値を含めるため、確認から更新までの間に
+他の更新が割り込んだ場合も検出できます（更新件数が一致しなければ取り消し）。
+"""
+import hashlib
+from sqlalchemy import case, func, update
+from app.models import db, CustomCostItem
+from app.costing import refresh_cost_snapshots, invalidate_store_context
+from app.store_config import bump_config_version
+
+
+class ConcurrentUpdateError(Exception):
+    """他の操作で項目が変更されていた"""
+
+    def __init__(self, version):
+        super().__init__('他の画面で原価項目が変更されています。ページを再読み込みしてください。')
+        self.version = version  # 現在の版（再読み込み後の値）
+
+
+def _load_rows(store_id):
+    return db.session.execute(
+        db.select(CustomCostItem.id, CustomCostItem.display_order, CustomCostItem.is_active)
+        .where(CustomCostItem.store_id == store_id)
+        .order_by(CustomCostItem.id)
+    ).all()
+
+
+def _version(rows):
+    state = ';'.join(f'{row.id}:{row.display_order}:{int(bool(row.is_active))}' for row in rows)
+    return hashlib.sha1(state.encode('ascii')).hexdigest()[:16]
+
+
+def items_version(store_id):
+    """店舗のカスタム原価項目の並び順・有効状態を表す版"""
+    return _version(_load_rows(store_id))
+
+
+def _check(store_id, item_ids, version):
+    """所有者と版を確認し、{id: 行} を返す"""
+    rows = _load_rows(store_id)
+    if version is not None and version != _version(rows):
+        raise ConcurrentUpdateError(_version(rows))
+
+    by_id = {row.id: row for row in rows}
+    unknown = [item_id for item_id in item_ids if item_id not in by_id]
+    if unknown:
+        raise ValueError('登録されていない原価項目が含まれています')
+    if len(set(item_ids)) != len(item_ids):
+        raise ValueError('同じ原価項目が重複しています')
+    return by_id
+
+
+def _bulk_set(store_id, column, new_values, old_values, null_value):
+    """
+    1文の UPDATE で複数の項目の列を更新する
+
+    Args:
+        column: 更新する列
+        new_values: {id: 新しい値}
+        old_values: {id: 読み込んだ時点の値}（他の更新が割り込んでいれば更新件数が減る）
+        null_value: 値がNULLの場合に比較に使う値
+    """
+    ids = list(new_values)
+    expected = {item_id: null_value if value is None else value for item_id, value in old_values.items()}
+    statement = update(CustomCostItem)\
+        .where(CustomCostItem.store_id == store_id,
+               CustomCostItem.id.in_(ids),
+               func.coalesce(column, null_value) == case(expected, value=CustomCostItem.id))\
+        .values({column.key: case(new_values, value=CustomCostItem.id)})\
+        .execution_options(synchronize_session=False)
+
+    result = db.session.execute(statement)
+    if result.rowcount != len(ids):
+        db.session.rollback()
+        raise ConcurrentUpdateError(items_version(store_id))
+
+    # 一括UPDATEはセッションイベントを通らないため、版番号を上げてリクエスト中に読み込んだ項目を破棄する
+    bump_config_version([store_id])
+    invalidate_store_context(store_id)
+
+    # 読み込み済みの項目があれば読み直させる
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, CustomCostItem) and obj.id in new_values:
+            db.session.expire(obj, [column.key])
+
+
+def bulk_reorder(store_id, ordered_ids, version=None):
+    """
+    表示順序をまとめて変更する（ordered_ids の並びが 0, 1, 2, ... になる）
+
+    Returns:
+        str: 更新後の版
+
+    Raises:
+        ValueError: 他店舗の項目・存在しない項目が含まれる場合
+        ConcurrentUpdateError: 版が一致しない場合
+    """
+    by_id = _check(store_id, ordered_ids, version)
+
+    new_values = {item_id: index for index, item_id in enumerate(ordered_ids)
+                  if by_id[item_id].display_order != index}
+    if new_values:
+        old_values = {item_id: by_id[item_id].display_order for item_id in new_values}
+        _bulk_set(store_id, CustomCostItem.display_order, new_values, old_values, -1)
+    return items_version(store_id)
+
+
+def bulk_set_active(store_id, item_ids, active, version=None):
+    """
+    複数の項目をまとめて有効/無効にする
+
+    有効な項目が変わると店舗の全レシピの原価が変わるため、原価スナップショットも再計算する。
+
+    Returns:
+        (int, str): 状態を変更した項目数, 更新後の版
+
+    Raises:
+        ValueError: 他店舗の項目・存在しない項目が含まれる場合
+        ConcurrentUpdateError: 版が一致しない場合
+    """
+    by_id = _check(store_id, item_ids, version)
+
+    new_values = {item_id: bool(active) for item_id in item_ids
+                  if bool(by_id[item_id].is_active) != bool(active)}
+    if new_values:
+        old_values = {item_id: by_id[item_id].is_active for item_id in new_values}
+        _bulk_set(store_id, CustomCostItem.is_active, new_values, old_values, False)
+        # 一括UPDATEはセッションイベントを通らないため、原価スナップショットを明示的に再計算する
+        refresh_cost_snapshots(store_ids=[store_id])
+    return len(new_values), items_version(store_id)
@@ -0,0 +1,574 @@
+"""
+店舗単位の原価計算エンジン
+
+レシピごとに recipe_ingredients を遅延ロードし、カスタム原価項目を
+毎回問い合わせる代わりに、店舗の原価設定・有効なカスタム原価項目・
+対象レシピの材料行を固定回数のクエリでまとめて読み込み、
+複数レシピの原価を一括で計算します。
+金額は app.money の整数（1/10000円単位）で計算します。
+
+計算結果は Recipe の原価スナップショット列(cost_*)に保存され、
+材料・レシピ材料・カスタム原価項目・利益率が変更されたときだけ
+セッションイベントで影響を受けるレシピ分を再計算します。
+"""
+from flask import g, has_request_context
+from sqlalchemy import event, func, bindparam, inspect as sa_inspect
+from sqlalchemy.orm.attributes import set_committed_value
+from app.models import db, CostSetting, CustomCostItem, Ingredient, Recipe, RecipeIngredient
+from app.store_config import load_store_config
+from app import money
+
+# 原価に影響する項目（これ以外の変更ではスナップショットを再計算しない）
+INGREDIENT_COST_FIELDS = ('purchase_price', 'purchase_quantity', 'purchase_unit', 'usage_unit', 'density', 'unit_price')
+RECIPE_COST_FIELDS = ('production_quantity', 'production_time', 'custom_profit_margin')
+RECIPE_INGREDIENT_COST_FIELDS = ('recipe_id', 'ingredient_id', 'quantity')
+CUSTOM_COST_FIELDS = ('calculation_type', 'amount', 'is_active')
+COST_SETTING_FIELDS = ('profit_margin',)
+
+
+class RecipeCost:
+    """1レシピ分の原価計算結果"""
+
+    def __init__(self, recipe, cost_setting, material_cost, total_cost, unit_cost,
+                 suggested_price, selling_price, profit_margin, lines, custom_costs,
+                 ingredient_count=None, amounts=None):
+        self.recipe = recipe
+        self.cost_setting = cost_setting  # 計算に使用した原価計算設定(未設定ならNone)
+        self.material_cost = material_cost  # 材料費
+        self.total_cost = total_cost  # 総原価(カスタム原価項目を含む)
+        self.unit_cost = unit_cost  # 1個あたりの原価
+        self.suggested_price = suggested_price  # 販売推奨価格
+        self.selling_price = selling_price  # 販売価格(手動設定があればそれ)
+        self.profit_margin = profit_margin  # 使用している利益率(%)
+        self.lines = lines  # 材料ごとの明細 [(RecipeIngredient, Ingredient, 単価, 金額)]
+        self.custom_costs = custom_costs  # カスタム原価項目ごとの明細 [(CustomCostItem, 金額)]
+        # 使用材料の種類数（スナップショットから作る場合は明細なしで件数のみ）
+        self.ingredient_count = ingredient_count if ingredient_count is not None else len(lines)
+        # サブ円単位の金額（app.money.RecipeAmounts、スナップショットから作る場合はNone）
+        self.amounts = amounts
+
+    @property
+    def display_price(self):
+        """
+        画面・エクスポートに表示する販売価格（レシピ詳細・ラベルプレビューと共通）
+
+        手動設定の販売価格があればそれ（Recipe.get_selling_price と同じ）。
+        なければ販売推奨価格、原価計算設定が未作成の場合は1個あたりの原価。
+        """
+        if self.recipe.selling_price is not None or self.cost_setting:
+            return self.selling_price
+        return self.unit_cost
+
+    def __repr__(self):
+        return f'<RecipeCost recipe_id={self.recipe.id} unit_cost={self.unit_cost:.2f}>'
+
+
+class RecipeCostDelta:
+    """材料価格などの変更によるレシピ原価の変化"""
+
+    def __init__(self, recipe, old_unit_cost, old_suggested_price, cost):
+        self.recipe = recipe
+        self.old_unit_cost = old_unit_cost  # 変更前の1個あたり原価(未計算ならNone)
+        self.old_suggested_price = old_suggested_price  # 変更前の販売推奨価格(未計算ならNone)
+        self.cost = cost  # 変更後のRecipeCost
+
+    @property
+    def unit_cost_delta(self):
+        """1個あたり原価の増減"""
+        if self.old_unit_cost is None:
+            return 0.0
+        return self.cost.unit_cost - self.old_unit_cost
+
+    @property
+    def suggested_price_delta(self):
+        """販売推奨価格の増減"""
+        if self.old_suggested_price is None:
+            return 0.0
+        return self.cost.suggested_price - self.old_suggested_price
+
+    def to_dict(self):
+        return {
+            'recipe_id': self.recipe.id,
+            'product_name': self.recipe.product_name,
+            'old_unit_cost': self.old_unit_cost,
+            'new_unit_cost': self.cost.unit_cost,
+            'unit_cost_delta': self.unit_cost_delta,
+            'old_suggested_price': self.old_suggested_price,
+            'new_suggested_price': self.cost.suggested_price,
+            'suggested_price_delta': self.suggested_price_delta,
+        }
+
+    def __repr__(self):
+        return f'<RecipeCostDelta recipe_id={self.recipe.id} delta={self.unit_cost_delta:+.2f}>'
+
+
+class StoreCostEngine:
+    """店舗単位でレシピの原価をまとめて計算する"""
+
+    def __init__(self, store_id, cost_setting=None, custom_items=None):
+        self.store_id = store_id
+        self.cost_setting = cost_setting
+        self.custom_items = custom_items if custom_items is not None else []
+
+    @classmethod
+    def for_store(cls, store_id):
+        """店舗の原価設定と有効なカスタム原価項目を読み込んでエンジンを作成"""
+        cost_setting = CostSetting.query.filter_by(store_id=store_id).first()
+        custom_items = CustomCostItem.query.filter_by(
+            store_id=store_id,
+            is_active=True
+        ).order_by(CustomCostItem.display_order, CustomCostItem.id).all()
+        return cls(store_id, cost_setting, custom_items)
+
+    def load_lines(self, recipe_ids):
+        """
+        対象レシピの材料行を1回のクエリで読み込む
+
+        Returns:
+            dict: {recipe_id: [(RecipeIngredient, Ingredient), ...]}
+        """
+        lines = {recipe_id: [] for recipe_id in recipe_ids}
+        if not recipe_ids:
+            return lines
+
+        rows = db.session.query(RecipeIngredient, Ingredient)\
+            .join(Ingredient, RecipeIngredient.ingredient_id == Ingredient.id)\
+            .filter(RecipeIngredient.recipe_id.in_(recipe_ids))\
+            .order_by(RecipeIngredient.recipe_id, RecipeIngredient.id)\
+            .all()
+
+        for ri, ingredient in rows:
+            lines[ri.recipe_id].append((ri, ingredient))
+        return lines
+
+    @staticmethod
+    def loaded_lines(recipes):
+        """
+        ロードプロファイル(app.loading)で読み込み済みの材料行を返す
+
+        Returns:
+            dict: {recipe_id: [(RecipeIngredient, Ingredient), ...]}
+                  読み込まれていないレシピ・材料行がある場合はNone
+        """
+        lines = {}
+        for recipe in recipes:
+            if 'recipe_ingredients' not in recipe.__dict__:
+                return None
+            rows = []
+            for ri in recipe.recipe_ingredients:
+                # 削除済み・未保存の行を含む場合は読み直す
+                if 'ingredient' not in ri.__dict__ or not sa_inspect(ri).persistent:
+                    return None
+                rows.append((ri, ri.ingredient))
+            rows.sort(key=lambda row: row[0].id)
+            lines[recipe.id] = rows
+        return lines
+
+    def price(self, recipes, unit_price_overrides=None, use_loaded=False):
+        """
+        複数レシピの原価をまとめて計算
+
+        Args:
+            recipes: Recipeオブジェクトのリスト(同じ店舗のもの)
+            unit_price_overrides: {ingredient_id: 使用単位あたりの単価(app.money.usage_price の整数)}
+                                  試算用に単価を差し替える
+            use_loaded: ロードプロファイルで読み込み済みの材料行があればクエリせずに使う
+
+        Returns:
+            dict: {recipe_id: RecipeCost}
+        """
+        recipes = list(recipes)
+        lines_by_recipe = self.loaded_lines(recipes) if use_loaded else None
+        if lines_by_recipe is None:
+            lines_by_recipe = self.load_lines([recipe.id for recipe in recipes])
+
+        # 同じ材料の単価は1回だけ求める {ingredient_id: 内部精度の整数の単価}
+        unit_prices = dict(unit_price_overrides or {})
+        results = {}
+        for recipe in recipes:
+            lines = []
+            material = 0
+            for ri, ingredient in lines_by_recipe.get(recipe.id, []):
+                if ingredient.id not in unit_prices:
+                    unit_prices[ingredient.id] = ingredient.get_usage_price()
+                price = unit_prices[ingredient.id]
+                line_cost = money.line_cost(price, ri.quantity)
+                material += line_cost
+                lines.append((ri, ingredient, money.price_to_float(price), money.to_float(line_cost)))
+
+            results[recipe.id] = self._summarize(recipe, material, lines)
+        return results
+
+    def price_one(self, recipe, use_loaded=False):
+        """1レシピの原価を計算"""
+        return self.price([recipe], use_loaded=use_loaded)[recipe.id]
+
+    def count_lines(self, recipe_ids):
+        """レシピごとの材料行数を1回のクエリで取得"""
+        if not recipe_ids:
+            return {}
+        rows = db.session.query(RecipeIngredient.recipe_id, func.count(RecipeIngredient.id))\
+            .filter(RecipeIngredient.recipe_id.in_(recipe_ids))\
+            .group_by(RecipeIngredient.recipe_id)\
+            .all()
+        return dict(rows)
+
+    def price_snapshots(self, recipes):
+        """
+        原価スナップショット列から原価を取得（一覧表示用）
+
+        スナップショットが未計算のレシピだけ材料行から計算します。
+        明細(lines, custom_costs)は含みません。
+
+        Returns:
+            dict: {recipe_id: RecipeCost}
+        """
+        recipes = list(recipes)
+        stale = [recipe for recipe in recipes if recipe.cost_version is None]
+        results = self.price(stale) if stale else {}
+
+        counts = self.count_lines([recipe.id for recipe in recipes if recipe.id not in results])
+        for recipe in recipes:
+            if recipe.id in results:
+                continue
+            results[recipe.id] = self._from_snapshot(recipe, counts.get(recipe.id, 0))
+        return results
+
+    def _from_snapshot(self, recipe, ingredient_count):
+        """スナップショット列からRecipeCostを作成"""
+        suggested_price = float(recipe.cost_suggested_price)
+        if recipe.selling_price is not None:
+            selling_price = float(recipe.selling_price)
+        else:
+            selling_price = suggested_price
+
+        return RecipeCost(
+            recipe=recipe,
+            cost_setting=self.cost_setting,
+            material_cost=float(recipe.cost_material),
+            total_cost=float(recipe.cost_total),
+            unit_cost=float(recipe.cost_unit),
+            suggested_price=suggested_price,
+            selling_price=selling_price,
+            profit_margin=recipe.get_profit_margin(self.cost_setting),
+            lines=[],
+            custom_costs=[],
+            ingredient_count=ingredient_count
+        )
+
+    def _summarize(self, recipe, material, lines):
+        """材料費（サブ円）から総原価・推奨価格などを求める（app.money の整数計算）"""
+        amounts = money.price_recipe(recipe, material, self.cost_setting, self.custom_items)
+
+        return RecipeCost(
+            recipe=recipe,
+            cost_setting=self.cost_setting,
+            material_cost=money.to_float(amounts.material),
+            total_cost=money.to_float(amounts.total),
+            unit_cost=money.to_float(amounts.unit),
+            suggested_price=money.to_float(amounts.suggested),
+            selling_price=money.to_float(amounts.selling),
+            profit_margin=recipe.get_profit_margin(self.cost_setting),
+            lines=lines,
+            custom_costs=[(item, money.to_float(item_cost)) for item, item_cost in amounts.custom],
+            amounts=amounts
+        )
+
+
+def store_context(store_id):
+    """
+    リクエスト中の店舗の原価計算エンジン
+
+    原価設定と有効なカスタム原価項目はリクエストごとに1回だけ取得し、
+    同じリクエスト内の画面・モデルの原価計算で使い回す（flask.g に保持）。
+    取得には app.store_config のプロセス内キャッシュを使うため、返される原価設定・原価項目は
+    セッション外の複製である（変更には使わないこと）。
+    リクエスト外（CLIなど）では毎回データベースから読み込む。
+    """
+    if not has_request_context():
+        return StoreCostEngine.for_store(store_id)
+
+    engines = g.setdefault('store_cost_engines', {})
+    engine = engines.get(store_id)
+    if engine is None:
+        # 原価設定はワーカーごとのキャッシュから取得（版番号で変更を検知）
+        engine = engines[store_id] = StoreCostEngine(store_id, *load_store_config(store_id))
+    return engine
+
+
+def invalidate_store_context(store_id=None):
+    """原価設定・カスタム原価項目の変更後に、リクエスト中に読み込んだ内容を破棄する"""
+    if not has_request_context():
+        return
+    engines = g.get('store_cost_engines')
+    if not engines:
+        return
+    if store_id is None:
+        engines.clear()
+    else:
+        engines.pop(store_id, None)
+
+
+def recipe_ids_using_ingredients(ingredient_ids):
+    """
+    指定した材料を使用しているレシピIDを取得（材料→レシピの逆引き）
+
+    recipe_ingredients の (ingredient_id, recipe_id) インデックスだけで解決するため、
+    何百件の材料を渡しても1回のクエリで済みます。
+    """
+    if not ingredient_ids:
+        return set()
+    rows = db.session.query(RecipeIngredient.recipe_id)\
+        .filter(RecipeIngredient.ingredient_id.in_(ingredient_ids))\
+        .distinct()\
+        .all()
+    return {row[0] for row in rows}
+
+
+def recipes_using_ingredients(ingredient_ids):
+    """指定した材料を使用しているレシピを取得"""
+    recipe_ids = recipe_ids_using_ingredients(set(ingredient_ids))
+    if not recipe_ids:
+        return []
+    return Recipe.query.filter(Recipe.id.in_(recipe_ids)).order_by(Recipe.id).all()
+
+
+def preview_price_changes(store_id, changes):
+    """
+    材料価格の変更がどのレシピにどれだけ影響するかを試算（データベースは変更しない）
+
+    Args:
+        store_id: 店舗ID
+        changes: {ingredient_id: {'purchase_price': ..., 'purchase_quantity': ...,
+                                  'purchase_unit': ..., 'usage_unit': ...}}
+                 指定しなかった項目は現在の値を使用
+
+    Returns:
+        list: 影響を受けるレシピのRecipeCostDelta（原価の増減が大きい順）
+    """
+    ingredients = Ingredient.query.filter(
+        Ingredient.id.in_(list(changes)),
+        Ingredient.store_id == store_id
+    ).all()
+    if not ingredients:
+        return []
+
+    # 変更後の単価は、セッションに追加しない一時的なIngredientで計算する
+    overrides = {}
+    for ingredient in ingredients:
+        proposed = Ingredient(
+            purchase_price=ingredient.purchase_price,
+            purchase_quantity=ingredient.purchase_quantity,
+            purchase_unit=ingredient.purchase_unit,
+            usage_unit=ingredient.usage_unit,
+            density=ingredient.density,
+            unit_price=ingredient.unit_price
+        )
+        for key, value in changes[ingredient.id].items():
+            if key in INGREDIENT_COST_FIELDS:
+                setattr(proposed, key, value)
+        overrides[ingredient.id] = proposed.calculate_usage_price()
+
+    recipes = [recipe for recipe in recipes_using_ingredients(overrides) if recipe.store_id == store_id]
+    engine = StoreCostEngine.for_store(store_id)
+    before = engine.price(recipes)
+    after = engine.price(recipes, unit_price_overrides=overrides)
+
+    deltas = [
+        RecipeCostDelta(recipe, before[recipe.id].unit_cost, before[recipe.id].suggested_price, after[recipe.id])
+        for recipe in recipes
+    ]
+    deltas.sort(key=lambda delta: abs(delta.unit_cost_delta), reverse=True)
+    return deltas
+
+
+def pop_cost_changes():
+    """
+    このセッションで再計算されたレシピ原価の変化を取り出す
+
+    Returns:
+        list: RecipeCostDelta（原価の増減が大きい順）
+    """
+    changes = db.session.info.pop('cost_snapshot_changes', {})
+    deltas = list(changes.values())
+    deltas.sort(key=lambda delta: abs(delta.unit_cost_delta), reverse=True)
+    return deltas
+
+
+def refresh_cost_snapshots(recipe_ids=(), ingredient_ids=(), store_ids=()):
+    """
+    原価スナップショットを再計算して保存
+
+    Args:
+        recipe_ids: 再計算するレシピID
+        ingredient_ids: 変更された材料ID（使用しているレシピを再計算）
+        store_ids: 店舗全体の再計算が必要な店舗ID（カスタム原価項目・利益率の変更時）
+
+    材料IDは何件渡しても1回の逆引きでまとめて対象レシピを求めるため、
+    複数の材料を使うレシピも1回だけ再計算されます。
+
+    Returns:
+        dict: {recipe_id: RecipeCostDelta} 再計算したレシピの原価の変化
+    """
+    recipe_ids = set(recipe_ids) | recipe_ids_using_ingredients(set(ingredient_ids))
+    store_ids = set(store_ids)
+    if not recipe_ids and not store_ids:
+        return {}
+
+    query = Recipe.query
+    if recipe_ids and store_ids:
+        query = query.filter(db.or_(Recipe.id.in_(recipe_ids), Recipe.store_id.in_(store_ids)))
+    elif recipe_ids:
+        query = query.filter(Recipe.id.in_(recipe_ids))
+    else:
+        query = query.filter(Recipe.store_id.in_(store_ids))
+
+    recipes_by_store = {}
+    for recipe in query.all():
+        recipes_by_store.setdefault(recipe.store_id, []).append(recipe)
+
+    results = {}
+    rows = []
+    for store_id, recipes in recipes_by_store.items():
+        costs = StoreCostEngine.for_store(store_id).price(recipes)
+        for recipe in recipes:
+            cost = costs[recipe.id]
+            results[recipe.id] = RecipeCostDelta(
+                recipe,
+                float(recipe.cost_unit) if recipe.cost_version is not None else None,
+                float(recipe.cost_suggested_price) if recipe.cost_version is not None else None,
+                cost
+            )
+            values = {
+                'cost_material': money.to_decimal(cost.amounts.material),
+                'cost_total': money.to_decimal(cost.amounts.total),
+                'cost_unit': money.to_decimal(cost.amounts.unit),
+                'cost_suggested_price': money.to_decimal(cost.amounts.suggested),
+            }
+            rows.append(dict(values, b_id=recipe.id))
+
+            # 読み込み済みのオブジェクトも変更扱いにせず最新値にする
+            for key, value in values.items():
+                set_committed_value(recipe, key, value)
+            set_committed_value(recipe, 'cost_version', (recipe.cost_version or 0) + 1)
+
+    if rows:
+        table = Recipe.__table__
+        statement = table.update()\
+            .where(table.c.id == bindparam('b_id'))\
+            .values(
+                cost_material=bindparam('cost_material'),
+                cost_total=bindparam('cost_total'),
+                cost_unit=bindparam('cost_unit'),
+                cost_suggested_price=bindparam('cost_suggested_price'),
+                cost_version=func.coalesce(table.c.cost_version, 0) + 1,
+                # 原価の再計算ではレシピの更新日時を変えない
+                updated_at=table.c.updated_at
+            )
+        db.session.connection().execute(statement, rows)
+
+    return results
+
+
+def _has_changes(obj, fields):
+    """指定した属性のいずれかが変更されているか"""
+    state = sa_inspect(obj)
+    return any(state.attrs[field].history.has_changes() for field in fields)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_cost_changes(session, flush_context, instances):
+    """フラッシュ前に原価へ影響する変更を集める"""
+    pending = session.info.setdefault('cost_snapshot_pending', {
+        'recipes': [],
+        'recipe_ids': set(),
+        'recipe_ingredients': [],
+        'ingredient_ids': set(),
+        'store_ids': set(),
+        'deleted_recipe_ids': set(),
+    })
+
+    for obj in session.new:
+        if isinstance(obj, Recipe):
+            pending['recipes'].append(obj)
+        elif isinstance(obj, RecipeIngredient):
+            pending['recipe_ingredients'].append(obj)
+        elif isinstance(obj, (CustomCostItem, CostSetting)):
+            pending['store_ids'].add(obj.store_id)
+
+    for obj in session.dirty:
+        if isinstance(obj, Ingredient):
+            if _has_changes(obj, INGREDIENT_COST_FIELDS):
+                pending['ingredient_ids'].add(obj.id)
+        elif isinstance(obj, Recipe):
+            if _has_changes(obj, RECIPE_COST_FIELDS):
+                pending['recipes'].append(obj)
+        elif isinstance(obj, RecipeIngredient):
+            if _has_changes(obj, RECIPE_INGREDIENT_COST_FIELDS):
+                # 別のレシピへ付け替えられた場合は元のレシピも再計算する
+                pending['recipe_ids'].update(sa_inspect(obj).attrs.recipe_id.history.deleted)
+                pending['recipe_ingredients'].append(obj)
+        elif isinstance(obj, CustomCostItem):
+            if _has_changes(obj, CUSTOM_COST_FIELDS):
+                pending['store_ids'].add(obj.store_id)
+        elif isinstance(obj, CostSetting):
+            if _has_changes(obj, COST_SETTING_FIELDS):
+                pending['store_ids'].add(obj.store_id)
+
+    for obj in session.deleted:
+        if isinstance(obj, Recipe):
+            pending['deleted_recipe_ids'].add(obj.id)
+        elif isinstance(obj, RecipeIngredient):
+            pending['recipe_ingredients'].append(obj)
+        elif isinstance(obj, CustomCostItem):
+            pending['store_ids'].add(obj.store_id)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _invalidate_changed_store_contexts(session, flush_context, instances):
+    """原価設定・カスタム原価項目が変更された店舗の store_context を破棄する"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (CustomCostItem, CostSetting)):
+            invalidate_store_context(obj.store_id)
+
+
+@event.listens_for(db.session, 'after_flush_postexec')
+def _refresh_changed_snapshots(session, flush_context):
+    """フラッシュ後、影響を受けるレシピの原価スナップショットだけを再計算する"""
+    pending = session.info.pop('cost_snapshot_pending', None)
+    if not pending:
+        return
+
+    recipe_ids = set(pending['recipe_ids'])
+    recipe_ids.update(recipe.id for recipe in pending['recipes'])
+    for ri in pending['recipe_ingredients']:
+        recipe_id = ri.recipe_id if ri.recipe_id is not None else (ri.recipe.id if ri.recipe else None)
+        recipe_ids.add(recipe_id)
+    recipe_ids.discard(None)
+    recipe_ids -= pending['deleted_recipe_ids']
+
+    if not (recipe_ids or pending['ingredient_ids'] or pending['store_ids']):
+        return
+
+    with session.no_autoflush:
+        deltas = refresh_cost_snapshots(
+            recipe_ids=recipe_ids,
+            ingredient_ids=pending['ingredient_ids'],
+            store_ids=pending['store_ids']
+        )
+
+    # 変化を記録（同じレシピが複数回再計算された場合は最初の変更前の値を残す）
+    changes = session.info.setdefault('cost_snapshot_changes', {})
+    for recipe_id, delta in deltas.items():
+        if recipe_id in changes:
+            delta.old_unit_cost = changes[recipe_id].old_unit_cost
+            delta.old_suggested_price = changes[recipe_id].old_suggested_price
+        changes[recipe_id] = delta
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_pending_changes(session):
+    """ロールバック時は集めた変更を破棄する"""
+    session.info.pop('cost_snapshot_pending', None)
+    session.info.pop('cost_snapshot_changes', None)
+    invalidate_store_context()
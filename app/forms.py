@@ -1,7 +1,9 @@
+from decimal import Decimal
 from flask_wtf import FlaskForm
 from wtforms import StringField, PasswordField, DecimalField, IntegerField, BooleanField, SelectField, TextAreaField, FieldList, FormField
 from wtforms.validators import DataRequired, Length, EqualTo, ValidationError, NumberRange, Optional
 from app.models import Store
+from app import money
 
 
 class RegistrationForm(FlaskForm):
@@ -50,11 +52,13 @@ class IngredientForm(FlaskForm):
     # 購入情報
     purchase_price = DecimalField('購入価格', validators=[
         Optional(),
-        NumberRange(min=0, message='購入価格は0以上で入力してください')
+        NumberRange(min=0, message='購入価格は0以上で入力してください'),
+        NumberRange(max=Decimal('99999999.99'), message='購入価格は99,999,999.99以下で入力してください')
     ], places=2)
     purchase_quantity = DecimalField('購入数量', validators=[
         Optional(),
-        NumberRange(min=0.001, message='購入数量は0より大きい値で入力してください')
+        NumberRange(min=Decimal('0.001'), message='購入数量は0より大きい値で入力してください'),
+        NumberRange(max=Decimal('9999999.999'), message='購入数量は9,999,999.999以下で入力してください')
     ], places=3, default=1)
     purchase_unit = SelectField('購入単位', choices=[
         ('', '選択してください'),
@@ -76,8 +80,16 @@ class IngredientForm(FlaskForm):
         ('L', 'L'),
         ('個', '個'),
         ('枚', '枚'),
-        ('本', '本')
+        ('本', '本'),
+        ('大さじ', '大さじ'),
+        ('小さじ', '小さじ'),
+        ('カップ', 'カップ')
     ], validators=[Optional()])
+    density = DecimalField('密度(g/ml)', validators=[
+        Optional(),
+        NumberRange(min=Decimal('0.001'), message='密度は0より大きい値で入力してください'),
+        NumberRange(max=Decimal('9999.9999'), message='密度は9,999.9999以下で入力してください')
+    ], places=4)
 
     supplier = StringField('仕入先', validators=[
         Optional(),
@@ -96,6 +108,18 @@ class IngredientForm(FlaskForm):
         ('その他', 'その他')
     ], validators=[Optional()])
 
+    def validate(self, extra_validators=None):
+        """使用単位あたりの単価が保存できる範囲（app.money.MAX_USAGE_PRICE）かも確認する"""
+        if not super().validate(extra_validators):
+            return False
+        try:
+            money.usage_price(self.purchase_price.data, self.purchase_quantity.data or 1,
+                              self.purchase_unit.data, self.usage_unit.data, self.density.data)
+        except ValueError as e:
+            self.purchase_quantity.errors.append(str(e))
+            return False
+        return True
+
 
 class RecipeIngredientForm(FlaskForm):
     """レシピ材料フォーム(FieldListで使用)"""
@@ -0,0 +1,239 @@
+"""
+リクエストごとのクエリ数・処理時間の計測（設定 INSTRUMENTATION_ENABLED で有効化）
+
+SQLAlchemyの before/after_cursor_execute イベントと Flask のシグナル
+（request_started / before_render_template / template_rendered / request_finished）で
+エンドポイントごとに次の値を集計します。
+  - 実行したSQLの数とデータベースの処理時間
+  - テンプレートの描画時間
+  - リクエスト全体の処理時間（ヒストグラム）
+
+集計結果は METRICS_PATH（既定 /metrics）から Prometheus のテキスト形式で取得でき
+（METRICS_TOKEN を設定し Authorization: Bearer で指定した場合のみ。未設定なら 404）、
+各レスポンスには Server-Timing ヘッダーを付けます（ブラウザの開発者ツールで確認できます）。
+集計はワーカープロセスごとです（gunicornの各ワーカーをそれぞれ収集してください）。
+
+QUERY_BUDGETS にブループリントごとのクエリ数の上限を設定すると、超えたリクエストを
+ログに記録します（QUERY_BUDGET_ACTION = 'raise' の場合は QueryBudgetExceeded を送出し、テストを失敗させます）。
+"""
+import hmac
+import logging
+import threading
+import time
+from flask import (Response, abort, before_render_template, current_app, g, has_request_context, request,
+                   request_finished, request_started, template_rendered)
+from sqlalchemy import event
+from app.models import db
+
+logger = logging.getLogger(__name__)
+
+# リクエスト全体の処理時間のヒストグラムの区切り(秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# エンドポイントに一致しなかったリクエスト（404など）の集計名
+UNMATCHED_ENDPOINT = '<unmatched>'
+
+
+class QueryBudgetExceeded(Exception):
+    """リクエストのクエリ数がブループリントの上限を超えた"""
+
+    def __init__(self, endpoint, queries, budget):
+        super().__init__(f'{endpoint} executed {queries} queries (budget {budget})')
+        self.endpoint = endpoint
+        self.queries = queries
+        self.budget = budget
+
+
+class RequestStats:
+    """1リクエスト分の計測値"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self._template_starts = []
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class EndpointMetrics:
+    """エンドポイントごとの累計（プロセス内）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._budget_exceeded = {}
+
+    def observe(self, endpoint, stats, elapsed):
+        with self._lock:
+            entry = self._endpoints.get(endpoint)
+            if entry is None:
+                entry = self._endpoints[endpoint] = {
+                    'requests': 0, 'queries': 0, 'db_seconds': 0.0, 'template_seconds': 0.0,
+                    'latency_seconds': 0.0, 'latency_buckets': [0] * len(LATENCY_BUCKETS),
+                }
+            entry['requests'] += 1
+            entry['queries'] += stats.queries
+            entry['db_seconds'] += stats.db_time
+            entry['template_seconds'] += stats.template_time
+            entry['latency_seconds'] += elapsed
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if elapsed <= bound:
+                    entry['latency_buckets'][index] += 1
+
+    def budget_exceeded(self, endpoint):
+        with self._lock:
+            self._budget_exceeded[endpoint] = self._budget_exceeded.get(endpoint, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            endpoints = {endpoint: dict(entry, latency_buckets=list(entry['latency_buckets']))
+                         for endpoint, entry in self._endpoints.items()}
+            return endpoints, dict(self._budget_exceeded)
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+            self._budget_exceeded.clear()
+
+    def render(self):
+        """Prometheus のテキスト形式で出力する"""
+        endpoints, exceeded = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(samples)
+
+        def label(endpoint, **extra):
+            labels = {'endpoint': endpoint, **extra}
+            escaped = ','.join('{}="{}"'.format(key, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                               for key, value in labels.items())
+            return '{' + escaped + '}'
+
+        names = sorted(endpoints)
+        metric('bakery_requests_total', 'counter', 'Requests handled.',
+               [f'bakery_requests_total{label(name)} {endpoints[name]["requests"]}' for name in names])
+        metric('bakery_request_queries_total', 'counter', 'SQL statements executed.',
+               [f'bakery_request_queries_total{label(name)} {endpoints[name]["queries"]}' for name in names])
+        metric('bakery_request_db_seconds_total', 'counter', 'Time spent executing SQL.',
+               [f'bakery_request_db_seconds_total{label(name)} {endpoints[name]["db_seconds"]:.6f}'
+                for name in names])
+        metric('bakery_request_template_seconds_total', 'counter', 'Time spent rendering templates.',
+               [f'bakery_request_template_seconds_total{label(name)} {endpoints[name]["template_seconds"]:.6f}'
+                for name in names])
+
+        samples = []
+        for name in names:
+            entry = endpoints[name]
+            for bound, count in zip(LATENCY_BUCKETS, entry['latency_buckets']):
+                samples.append(f'bakery_request_duration_seconds_bucket{label(name, le=bound)} {count}')
+            samples.append(f'bakery_request_duration_seconds_bucket{label(name, le="+Inf")} {entry["requests"]}')
+            samples.append(f'bakery_request_duration_seconds_sum{label(name)} {entry["latency_seconds"]:.6f}')
+            samples.append(f'bakery_request_duration_seconds_count{label(name)} {entry["requests"]}')
+        metric('bakery_request_duration_seconds', 'histogram', 'Request latency.', samples)
+
+        metric('bakery_query_budget_exceeded_total', 'counter', 'Requests over their query budget.',
+               [f'bakery_query_budget_exceeded_total{label(name)} {exceeded[name]}' for name in sorted(exceeded)])
+        return '\n'.join(lines) + '\n'
+
+
+metrics = EndpointMetrics()
+
+
+def _current_stats():
+    if not has_request_context():
+        return None
+    return g.get('request_stats')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_stats() is not None:
+        conn.info['query_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current_stats()
+    started = conn.info.pop('query_started', None)
+    if stats is None or started is None:
+        return
+    stats.queries += 1
+    stats.db_time += time.perf_counter() - started
+
+
+def _request_started(app, **extra):
+    g.request_stats = RequestStats()
+
+
+def _before_render_template(app, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None:
+        stats._template_starts.append(time.perf_counter())
+
+
+def _template_rendered(app, template, context, **extra):
+    stats = _current_stats()
+    if stats is not None and stats._template_starts:
+        stats.template_time += time.perf_counter() - stats._template_starts.pop()
+
+
+def _request_finished(app, response, **extra):
+    # エラーハンドラーの応答で再度呼ばれても二重に集計しない
+    stats = g.pop('request_stats', None)
+    if stats is None:
+        return
+    elapsed = stats.elapsed
+    endpoint = request.endpoint or UNMATCHED_ENDPOINT
+    metrics.observe(endpoint, stats, elapsed)
+
+    response.headers.add('Server-Timing',
+                         f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+                         f'tmpl;dur={stats.template_time * 1000:.1f}, '
+                         f'total;dur={elapsed * 1000:.1f}')
+
+    _check_budget(app, endpoint, stats.queries)
+
+
+def _check_budget(app, endpoint, queries):
+    """ブループリントのクエリ数の上限を確認する"""
+    budgets = app.config.get('QUERY_BUDGETS') or {}
+    blueprint = endpoint.rpartition('.')[0]
+    budget = budgets.get(endpoint, budgets.get(blueprint, budgets.get('*')))
+    if budget is None or queries <= budget:
+        return
+
+    metrics.budget_exceeded(endpoint)
+    if app.config.get('QUERY_BUDGET_ACTION') == 'raise':
+        raise QueryBudgetExceeded(endpoint, queries, budget)
+    logger.warning('Query budget exceeded: %s executed %d queries (budget %d) %s %s',
+                   endpoint, queries, budget, request.method, request.path)
+
+
+def metrics_view():
+    """Prometheus 形式の計測値（METRICS_TOKEN 未設定の場合は公開しない）"""
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        abort(403)
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_instrumentation(app):
+    """計測用のイベント・シグナルを登録し、計測値の取得用URLを追加する"""
+    with app.app_context():
+        for engine in db.engines.values():
+            if not event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+                event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    request_started.connect(_request_started, app)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+    request_finished.connect(_request_finished, app)
+
+    app.add_url_rule(app.config['METRICS_PATH'], 'metrics', metrics_view)
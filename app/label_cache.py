@@ -0,0 +1,127 @@
+"""
+生成済みラベルPDFのキャッシュ
+
+印刷内容（商品名・材料名・アレルゲン・価格・店舗名）、ラベルの配置、表示オプション、
+製造日、枚数、フォントから求めたハッシュをキーとして、生成したPDFをディスクに保存します。
+レシピや材料を編集すると印刷内容が変わるためキーも自動的に変わり、古いPDFは使われません。
+保存容量が上限を超えた場合は最後に使われた日時が古いものから削除します(LRU)。
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 描画処理を変更した場合はこの値を上げて既存のキャッシュを無効にする
+RENDER_VERSION = 2
+
+CACHE_KEY_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+_evict_lock = threading.Lock()
+
+
+def cache_key(runs, geometry, font_name):
+    """出力に影響するすべての値からキャッシュキー(SHA-256)を求める"""
+    payload = {
+        'version': RENDER_VERSION,
+        'font': font_name,
+        'geometry': geometry,
+        'runs': runs,
+    }
+    # Decimal・日付などは文字列として扱い、辞書のキー順に依存しないようにする
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def cache_dir(app):
+    """キャッシュの保存先ディレクトリ"""
+    path = app.config.get('LABEL_CACHE_DIR') or os.path.join(app.instance_path, 'label_cache')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def cache_path(app, key):
+    """キーに対応するPDFのパス"""
+    return os.path.join(cache_dir(app), f'{key}.pdf')
+
+
+def get_cached(app, key):
+    """キャッシュ済みPDFのパスを返す（なければNone）"""
+    if not CACHE_KEY_PATTERN.match(key):
+        return None
+
+    path = cache_path(app, key)
+    try:
+        # 最終利用日時を更新（LRUの判定に使用）
+        os.utime(path)
+    except OSError:
+        return None
+    return path
+
+
+def store(app, key, render):
+    """
+    PDFを生成してキャッシュに保存する
+
+    Args:
+        app: Flaskアプリケーション
+        key: cache_key で求めたキー
+        render: 書き込み先のファイルを受け取ってPDFを描画する関数
+
+    Returns:
+        str: 保存したPDFのパス
+    """
+    path = cache_path(app, key)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            render(f)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    evict(app, keep=path)
+    return path
+
+
+def evict(app, keep=None):
+    """保存容量が上限を超えていれば、最後に使われた日時が古いものから削除する（keep は残す）"""
+    evict_directory(cache_dir(app), app.config['LABEL_CACHE_MAX_BYTES'], keep)
+
+
+def evict_directory(directory, max_bytes, keep=None):
+    """evict の本体（アプリケーションのないラベル生成のワーカープロセスからも呼べるようにディレクトリを指定）"""
+    with _evict_lock:
+        entries = []
+        total = 0
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('.pdf'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        if total <= max_bytes:
+            return
+
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                # 他のワーカーが先に削除した場合など
+                pass
+            total -= size
+            logger.debug('Evicted label cache entry %s', os.path.basename(path))
@@ -0,0 +1,263 @@
+"""
+ラベルPDFのバックグラウンド生成
+
+枚数の多いラベル印刷はリクエスト内で描画せず、プロセスプールで生成します。
+ジョブの状態と生成したPDFはインスタンスフォルダ内の一時ディレクトリに保存するため、
+外部のキューやブローカーは不要で、どのgunicornワーカーからでも状態を確認できます。
+保存期間(TTL)を過ぎた完了済みのジョブのファイルは、新しいジョブの登録時や状態確認時に
+（一定間隔で）削除されます。
+ワーカープロセスが異常終了した場合（メモリ不足など）は、そのジョブを失敗として記録し、
+プロセスプールを作り直して次のジョブを受け付けます。
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app import label_cache
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# 期限切れのファイルを確認する間隔(秒)。状態確認のたびにディレクトリを走査しない
+CLEANUP_INTERVAL = 60
+
+# 待機中・生成中のまま状態がこの秒数更新されていないジョブは止まったとみなす
+STALE_JOB_AGE = 24 * 3600
+
+_executor = None
+_executor_lock = threading.Lock()
+
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+
+def _get_executor(max_workers):
+    """このプロセス用のプロセスプールを返す（最初の利用時に作成）"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=max_workers)
+    return _executor
+
+
+def _discard_executor(executor):
+    """壊れたプロセスプールを使わないようにする（次の利用時に作り直す）"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+
+
+def _watch_job(executor, directory, job_id, status):
+    """ワーカープロセスの異常終了などでジョブが完了しなかった場合に失敗として記録する"""
+    def done(future):
+        if future.cancelled():
+            error = 'ジョブが取り消されました'
+        elif future.exception() is not None:
+            # _render_job は描画のエラーを自分で記録するため、ここに来るのはプロセスの異常終了など
+            error = f'ラベル生成のプロセスが異常終了しました: {future.exception()}'
+        else:
+            return
+        logger.error('Label job %s failed: %s', job_id, error)
+        _write_status(directory, job_id, dict(status, status='failed', finished_at=time.time(), error=error))
+        if isinstance(future.exception(), BrokenProcessPool):
+            # プールの管理スレッドから呼ばれるため shutdown はせず、参照を外すだけにする
+            _discard_executor(executor)
+    return done
+
+
+def job_dir(app):
+    """ジョブの保存先ディレクトリ"""
+    path = app.config.get('LABEL_JOB_DIR') or os.path.join(app.instance_path, 'label_jobs')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _status_path(directory, job_id):
+    return os.path.join(directory, f'{job_id}.json')
+
+
+def _pdf_path(directory, job_id):
+    return os.path.join(directory, f'{job_id}.pdf')
+
+
+def _write_status(directory, job_id, status):
+    """状態ファイルを書き換える（途中の状態を読まれないよう置き換えで更新）"""
+    path = _status_path(directory, job_id)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(status, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _render_job(directory, job_id, status, runs, geometry, font_path, subset_font_path,
+                cache_path=None, cache_max_bytes=0):
+    """ワーカープロセスでPDFを生成する"""
+    from app.routes.labels import register_fonts, render_label_pdf
+
+    started = time.time()
+    _write_status(directory, job_id, dict(status, status='running', started_at=started))
+    try:
+        font_name = register_fonts(font_path, subset_font_path)
+        tmp_path = f'{_pdf_path(directory, job_id)}.tmp'
+        with open(tmp_path, 'wb') as f:
+            render_label_pdf(f, runs, geometry, font_name)
+        os.replace(tmp_path, _pdf_path(directory, job_id))
+        if cache_path:
+            _copy_to_cache(_pdf_path(directory, job_id), cache_path, cache_max_bytes)
+        _write_status(directory, job_id, dict(status, status='done', started_at=started,
+                                              finished_at=time.time()))
+    except Exception as e:
+        logger.exception('Label job %s failed', job_id)
+        _write_status(directory, job_id, dict(status, status='failed', started_at=started,
+                                              finished_at=time.time(), error=str(e)))
+
+
+def _copy_to_cache(pdf_path, cache_path, max_bytes):
+    """
+    生成したPDFをラベルキャッシュにも保存する（失敗してもジョブは成功とする）
+
+    label_cache.store と同じく保存後に容量の上限を確認し、古いものから削除する。
+    """
+    tmp_path = f'{cache_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        shutil.copyfile(pdf_path, tmp_path)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        logger.warning('Could not store label job result in cache: %s', cache_path)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return
+    label_cache.evict_directory(os.path.dirname(cache_path), max_bytes, keep=cache_path)
+
+
+def submit_job(app, store_id, runs, geometry, filename, cache_path=None):
+    """
+    ラベル生成ジョブを登録する
+
+    Args:
+        app: Flaskアプリケーション
+        store_id: ジョブを登録した店舗ID（状態確認・ダウンロード時の所有者確認に使用）
+        runs, geometry: render_label_pdf に渡す印刷内容と配置
+        filename: ダウンロード時のファイル名
+        cache_path: 指定した場合は生成したPDFをラベルキャッシュのこのパスにも保存する
+
+    Returns:
+        str: ジョブID
+    """
+    directory = job_dir(app)
+    cleanup_expired(app)
+
+    job_id = uuid.uuid4().hex
+    status = {
+        'job_id': job_id,
+        'store_id': store_id,
+        'status': 'queued',
+        'total_labels': sum(run['count'] for run in runs),
+        'filename': filename,
+        'created_at': time.time(),
+    }
+    _write_status(directory, job_id, status)
+
+    args = (_render_job, directory, job_id, status, runs, geometry,
+            app.config.get('LABEL_FONT_PATH'), app.config.get('LABEL_FONT_SUBSET_PATH'),
+            cache_path, app.config['LABEL_CACHE_MAX_BYTES'])
+    executor = _get_executor(app.config['LABEL_JOB_WORKERS'])
+    try:
+        future = executor.submit(*args)
+    except BrokenProcessPool:
+        # 以前のジョブでワーカーが異常終了していた場合はプールを作り直して登録し直す
+        logger.warning('Label job process pool was broken; recreating it')
+        _discard_executor(executor)
+        executor.shutdown(wait=False)
+        executor = _get_executor(app.config['LABEL_JOB_WORKERS'])
+        future = executor.submit(*args)
+    future.add_done_callback(_watch_job(executor, directory, job_id, status))
+    logger.info('Label job %s queued (%d labels)', job_id, status['total_labels'])
+    return job_id
+
+
+def get_job(app, job_id, store_id):
+    """ジョブの状態を返す（存在しない・他店舗のジョブはNone）"""
+    if not JOB_ID_PATTERN.match(job_id):
+        return None
+
+    cleanup_expired(app)
+    try:
+        with open(_status_path(job_dir(app), job_id), encoding='utf-8') as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if status.get('store_id') != store_id:
+        return None
+    return status
+
+
+def job_pdf_path(app, job_id):
+    """生成済みPDFのパス"""
+    return _pdf_path(job_dir(app), job_id)
+
+
+def cleanup_expired(app):
+    """
+    保存期間を過ぎたジョブのファイルを削除する（同じプロセスでは CLEANUP_INTERVAL 秒に1回だけ確認）
+
+    完了・失敗したジョブは終了時刻(finished_at)から数え、待機中・生成中のジョブは削除しない
+    （ただし STALE_JOB_AGE 以上状態が更新されていないものはサーバーの再起動などで
+    止まったとみなして削除する）。
+    """
+    global _last_cleanup
+    now = time.time()
+    with _cleanup_lock:
+        if now - _last_cleanup < CLEANUP_INTERVAL:
+            return
+        _last_cleanup = now
+
+    directory = job_dir(app)
+    expires_before = now - app.config['LABEL_JOB_TTL']
+    active = set()
+    expired = set()
+    kept = set()
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        job_id = name[:-len('.json')]
+        path = os.path.join(directory, name)
+        try:
+            modified = os.path.getmtime(path)
+            with open(path, encoding='utf-8') as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            # 他のワーカーが先に削除した・書き込み途中など
+            continue
+        if status.get('status') in ('queued', 'running'):
+            if modified >= now - STALE_JOB_AGE:
+                active.add(job_id)
+                continue
+            expired.add(job_id)
+        elif (status.get('finished_at') or modified) < expires_before:
+            expired.add(job_id)
+        else:
+            kept.add(job_id)
+
+    for name in os.listdir(directory):
+        job_id = name.split('.', 1)[0]
+        if job_id in active or job_id in kept:
+            continue
+        path = os.path.join(directory, name)
+        try:
+            # 状態ファイルのない一時ファイルなどは更新日時から保存期間を判定する
+            if job_id in expired or os.path.getmtime(path) < expires_before:
+                os.remove(path)
+        except OSError:
+            # 他のワーカーが先に削除した場合など
+            continue
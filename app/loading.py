@@ -0,0 +1,88 @@
+"""
+Recipe のリレーションの読み込み方（ロードプロファイル）
+
+recipe_ingredients / ingredient / store は lazy=True（最初にアクセスしたときに1件ずつ読み込み）のため、
+画面ごとに必要なリレーションを名前つきのプロファイルで selectinload / joinedload します。
+  - listing: 一覧（原価はスナップショット列から取得するためリレーションは読み込まない）
+  - detail: 詳細・材料編集（材料行と材料）
+  - label: ラベル（材料行と材料、店舗）
+
+設定 RAISE_ON_LAZY_LOAD が有効な場合（未指定ならデバッグ・テスト時に有効）は、
+プロファイルにないリレーションへのアクセスでSQLが発行されると sqlalchemy.exc.InvalidRequestError になり、
+想定外の遅延ロードをテストで検出できます。
+"""
+from flask import current_app, has_app_context
+from sqlalchemy import inspect
+from sqlalchemy.orm import defaultload, joinedload, raiseload, selectinload
+from app.models import Recipe
+
+# プロファイルごとに Recipe から読み込むリレーションの経路（一対多は selectinload、多対一は joinedload）
+# backref で定義されたリレーションもあるため、属性名で指定してマッパーの設定後に解決する
+LOAD_PROFILES = {
+    'listing': [],
+    'detail': [
+        ('recipe_ingredients', 'ingredient'),
+    ],
+    'label': [
+        ('recipe_ingredients', 'ingredient'),
+        ('store',),
+    ],
+}
+
+
+def _resolve(path):
+    """属性名の経路をリレーション属性のリストにする"""
+    attributes = []
+    mapper = inspect(Recipe)
+    for name in path:
+        relationship = mapper.relationships[name]
+        attributes.append(relationship.class_attribute)
+        mapper = relationship.mapper
+    return attributes
+
+
+def raise_on_lazy_load():
+    """想定外の遅延ロードをエラーにするか"""
+    if not has_app_context():
+        return False
+    enabled = current_app.config.get('RAISE_ON_LAZY_LOAD')
+    if enabled is None:
+        return current_app.debug or current_app.testing
+    return bool(enabled)
+
+
+def _eager(path):
+    first, *rest = path
+    loader = (selectinload if first.property.uselist else joinedload)(first)
+    for attribute in rest:
+        loader = loader.selectinload(attribute) if attribute.property.uselist else loader.joinedload(attribute)
+    return loader
+
+
+def _raise_below(path):
+    """経路の先のエンティティの、指定していないリレーションをエラーにする"""
+    loader = defaultload(path[0])
+    for attribute in path[1:]:
+        loader = loader.defaultload(attribute)
+    return loader.raiseload('*', sql_only=True)
+
+
+def load_profile(name):
+    """
+    プロファイルのローダーオプションを返す（Recipe のクエリの .options() に渡す）
+
+    Raises:
+        KeyError: 登録されていないプロファイル名の場合
+    """
+    paths = [_resolve(path) for path in LOAD_PROFILES[name]]
+    options = [_eager(path) for path in paths]
+
+    if raise_on_lazy_load():
+        # 識別子マップから取り出せる多対一（SQLを発行しないもの）はエラーにしない
+        options.append(raiseload('*', sql_only=True))
+        prefixes = {}
+        for names, path in zip(LOAD_PROFILES[name], paths):
+            for length in range(1, len(path) + 1):
+                prefixes.setdefault(names[:length], path[:length])
+        options.extend(_raise_below(prefix) for prefix in prefixes.values())
+    return options
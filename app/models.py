@@ -2,6 +2,9 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from app import money, units
 
 db = SQLAlchemy()
 
@@ -14,6 +17,8 @@ class Store(UserMixin, db.Model):
     login_id = db.Column(db.String(50), unique=True, nullable=False, index=True)
     password_hash = db.Column(db.String(255), nullable=False)
     store_name = db.Column(db.String(100), nullable=False)
+    search_name = db.Column(db.String(100))  # 検索用に正規化した店舗名（app.search で自動更新）
+    config_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # 原価設定の版番号（app.store_config で自動更新）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # リレーション
@@ -51,10 +56,21 @@ class CostSetting(db.Model):
 class Ingredient(db.Model):
     """材料マスタテーブル"""
     __tablename__ = 'ingredients'
+    __table_args__ = (
+        # 店舗ごとの一覧（登録日・更新日順、キーセット方式のページネーション）用
+        db.Index('ix_ingredients_store_created', 'store_id', 'created_at', 'id'),
+        db.Index('ix_ingredients_store_updated', 'store_id', 'updated_at', 'id'),
+        # 材料名の前方一致検索（レシピ編集画面の候補表示）用
+        db.Index('ix_ingredients_store_search_name', 'store_id', 'search_name', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
     name = db.Column(db.String(100), nullable=False)
+    # 検索用に正規化した材料名（app.search で自動更新）
+    # 前方一致の範囲条件・並べ替えで (store_id, search_name, id) の索引を使えるよう、
+    # PostgreSQLでは文字コード順(COLLATE "C")で比較する（SQLiteは既定で文字コード順）
+    search_name = db.Column(db.String(100).with_variant(postgresql.VARCHAR(100, collation='C'), 'postgresql'))
 
     # 購入情報
     purchase_price = db.Column(db.Numeric(10, 2))  # 購入価格
@@ -63,6 +79,11 @@ class Ingredient(db.Model):
 
     # 使用情報
     usage_unit = db.Column(db.String(20))  # 使用単位(g, ml, 個など)
+    density = db.Column(db.Numeric(8, 4))  # 密度(g/ml)、重さと体積の換算用(オプション)
+
+    # 使用単位あたりの単価（1/10^8円単位の整数、app.money.PRICE_SCALE）
+    # 保存時に計算し、Noneの場合は未計算。原価計算はすべてこの値を使う
+    usage_price = db.Column(db.BigInteger)
 
     # 後方互換性のための計算フィールド（非推奨）
     unit_price = db.Column(db.Numeric(10, 2))  # 旧単価フィールド
@@ -78,87 +99,68 @@ class Ingredient(db.Model):
     recipe_ingredients = db.relationship('RecipeIngredient', backref='ingredient', lazy=True, cascade='all, delete-orphan')
 
     def get_usage_unit_price(self):
-        """使用単位あたりの単価を計算"""
-        # 新しいフィールドが存在する場合
-        if self.purchase_price is not None and self.purchase_quantity and self.purchase_unit and self.usage_unit:
-            if self.purchase_quantity == 0:
-                return 0
-
-            # 購入単位を使用単位に換算
-            conversion_factor = self._get_conversion_factor(self.purchase_unit, self.usage_unit)
-
-            # 購入単位あたりの価格
-            price_per_purchase_unit = float(self.purchase_price) / float(self.purchase_quantity)
-
-            # 使用単位あたりの価格
-            usage_unit_price = price_per_purchase_unit / conversion_factor
-
-            return usage_unit_price
+        """使用単位あたりの単価（表示用）"""
+        return money.price_to_float(self.get_usage_price())
 
-        # 後方互換性: 旧フィールドを使用
-        elif self.unit_price is not None:
-            return float(self.unit_price)
+    def get_usage_price(self):
+        """使用単位あたりの単価（1/10^8円単位の整数、原価計算用）"""
+        # 保存済みの単価があれば換算せずにそのまま使う
+        if self.usage_price is not None:
+            return self.usage_price
+        return self.calculate_usage_price()
 
-        return 0
+    def calculate_usage_price(self):
+        """購入情報から使用単位あたりの単価を計算"""
+        return money.usage_price(self.purchase_price, self.purchase_quantity, self.purchase_unit,
+                                 self.usage_unit, self.density, self.unit_price)
 
     @staticmethod
-    def _get_conversion_factor(from_unit, to_unit):
+    def _get_conversion_factor(from_unit, to_unit, strict=False, density=None):
         """
-        単位変換係数を取得
+        単位変換係数を取得（app.units.conversion_factor を参照）
         例: kg -> g なら 1000, L -> ml なら 1000
+
+        strict=True の場合、変換できない単位の組み合わせで ValueError を送出する
         """
-        # 単位を小文字に統一
-        from_unit = from_unit.lower()
-        to_unit = to_unit.lower()
-
-        # 同じ単位の場合
-        if from_unit == to_unit:
-            return 1.0
-
-        # 重量変換
-        weight_conversions = {
-            ('kg', 'g'): 1000,
-            ('g', 'kg'): 0.001,
-            ('kg', 'kg'): 1,
-            ('g', 'g'): 1,
-        }
-
-        # 容量変換
-        volume_conversions = {
-            ('l', 'ml'): 1000,
-            ('ml', 'l'): 0.001,
-            ('l', 'l'): 1,
-            ('ml', 'ml'): 1,
-        }
-
-        # 個数（変換なし）
-        count_units = {'個', '枚', '本', 'ヶ', 'コ'}
-        if from_unit in count_units and to_unit in count_units:
-            return 1.0
-
-        # 変換テーブルから検索
-        conversion_key = (from_unit, to_unit)
-
-        if conversion_key in weight_conversions:
-            return weight_conversions[conversion_key]
-
-        if conversion_key in volume_conversions:
-            return volume_conversions[conversion_key]
-
-        # 変換できない場合は1.0を返す（同じ単位として扱う）
-        return 1.0
+        return units.conversion_factor(from_unit, to_unit, density, strict)
 
     def __repr__(self):
         return f'<Ingredient {self.name}>'
 
 
+# 単価の計算に使う項目
+INGREDIENT_PRICE_FIELDS = ('purchase_price', 'purchase_quantity', 'purchase_unit', 'usage_unit',
+                           'density', 'unit_price')
+
+
+def _clear_usage_price(target, value, oldvalue, initiator):
+    """購入情報が変わったら保存済みの単価を使わない（保存時に再計算）"""
+    target.usage_price = None
+
+
+def _store_usage_price(_mapper, _connection, target):
+    target.usage_price = target.calculate_usage_price()
+
+
+for _field in INGREDIENT_PRICE_FIELDS:
+    event.listen(getattr(Ingredient, _field), 'set', _clear_usage_price)
+event.listen(Ingredient, 'before_insert', _store_usage_price)
+event.listen(Ingredient, 'before_update', _store_usage_price)
+
+
 class Recipe(db.Model):
     """レシピテーブル"""
     __tablename__ = 'recipes'
+    __table_args__ = (
+        # 店舗ごとの一覧（更新日・登録日順、キーセット方式のページネーション）用
+        db.Index('ix_recipes_store_updated', 'store_id', 'updated_at', 'id'),
+        db.Index('ix_recipes_store_created', 'store_id', 'created_at', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
     product_name = db.Column(db.String(100), nullable=False)
+    search_name = db.Column(db.String(100))  # 検索用に正規化した商品名（app.search で自動更新）
     category = db.Column(db.String(50))  # 商品カテゴリー
     production_quantity = db.Column(db.Integer, nullable=False, default=1)  # 製造個数
     production_time = db.Column(db.Integer, default=0)  # 製造時間(分)
@@ -168,63 +170,70 @@ class Recipe(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    # 原価スナップショット（app.costing のセッションイベントで自動更新）
+    cost_material = db.Column(db.Numeric(12, 4))  # 材料費
+    cost_total = db.Column(db.Numeric(12, 4))  # 総原価
+    cost_unit = db.Column(db.Numeric(12, 4), index=True)  # 1個あたりの原価
+    cost_suggested_price = db.Column(db.Numeric(12, 4))  # 販売推奨価格
+    cost_version = db.Column(db.Integer)  # 再計算のたびに増える版番号、Noneの場合は未計算
+
     # リレーション
     recipe_ingredients = db.relationship('RecipeIngredient', backref='recipe', lazy=True, cascade='all, delete-orphan')
 
-    def calculate_material_cost(self):
-        """材料費の計算"""
-        total_cost = 0
-        for ri in self.recipe_ingredients:
-            # RecipeIngredientのcalculate_costメソッドを使用
-            total_cost += ri.calculate_cost()
-        return float(total_cost)
-
-    def calculate_total_cost(self, cost_setting=None):
-        """総原価の計算(固定費含む)"""
-        material_cost = self.calculate_material_cost()
+    def calculate_amounts(self, cost_setting=None, store_context=None):
+        """
+        金額をまとめて計算（app.money.RecipeAmounts、原価計算エンジンと同じ整数計算）
 
-        if not cost_setting:
-            return material_cost
+        store_context（app.costing.store_context）を渡すと、読み込み済みの原価設定と
+        有効なカスタム原価項目を使い、カスタム原価項目を問い合わせない
+        """
+        if cost_setting is None and store_context is not None:
+            cost_setting = store_context.cost_setting
 
-        total_cost = material_cost
+        material = 0
+        for ri in self.recipe_ingredients:
+            material += ri.calculate_line_cost()
 
         # カスタム原価項目の追加（人件費・光熱費を含むすべての原価項目）
-        custom_items = CustomCostItem.query.filter_by(
-            store_id=self.store_id,
-            is_active=True
-        ).all()
+        custom_items = []
+        if cost_setting:
+            if store_context is not None:
+                custom_items = store_context.custom_items
+            else:
+                custom_items = CustomCostItem.query.filter_by(
+                    store_id=self.store_id,
+                    is_active=True
+                ).all()
+
+        return money.price_recipe(self, material, cost_setting, custom_items)
 
-        for item in custom_items:
-            total_cost += item.calculate_cost(self)
+    def calculate_material_cost(self):
+        """材料費の計算"""
+        return money.to_float(self.calculate_amounts().material)
 
-        return total_cost
+    def calculate_total_cost(self, cost_setting=None, store_context=None):
+        """総原価の計算(固定費含む)"""
+        return money.to_float(self.calculate_amounts(cost_setting, store_context).total)
 
-    def calculate_unit_cost(self, cost_setting=None):
+    def calculate_unit_cost(self, cost_setting=None, store_context=None):
         """1個あたりの原価"""
-        total_cost = self.calculate_total_cost(cost_setting)
-        return total_cost / self.production_quantity if self.production_quantity > 0 else 0
-
-    def calculate_suggested_price(self, cost_setting):
-        """販売推奨価格の計算"""
-        unit_cost = self.calculate_unit_cost(cost_setting)
+        return money.to_float(self.calculate_amounts(cost_setting, store_context).unit)
 
-        # 商品ごとの利益率があればそれを使用、なければ基本設定を使用
-        profit_margin = self.custom_profit_margin if self.custom_profit_margin is not None else (cost_setting.profit_margin if cost_setting else 0)
+    def calculate_suggested_price(self, cost_setting=None, store_context=None):
+        """販売推奨価格の計算（商品ごとの利益率があればそれを使用、なければ基本設定を使用）"""
+        return money.to_float(self.calculate_amounts(cost_setting, store_context).suggested)
 
-        if profit_margin > 0:
-            margin_multiplier = 1 + (float(profit_margin) / 100)
-            return unit_cost * margin_multiplier
-        return unit_cost
-
-    def get_profit_margin(self, cost_setting):
+    def get_profit_margin(self, cost_setting=None, store_context=None):
         """使用している利益率を取得"""
+        if cost_setting is None and store_context is not None:
+            cost_setting = store_context.cost_setting
         return self.custom_profit_margin if self.custom_profit_margin is not None else (cost_setting.profit_margin if cost_setting else 0)
 
-    def get_selling_price(self, cost_setting):
+    def get_selling_price(self, cost_setting=None, store_context=None):
         """販売価格を取得（手動設定があればそれを、なければ推奨価格を返す）"""
         if self.selling_price is not None:
             return float(self.selling_price)
-        return self.calculate_suggested_price(cost_setting)
+        return self.calculate_suggested_price(cost_setting, store_context)
 
     def get_allergens(self):
         """アレルゲン情報の取得"""
@@ -243,16 +252,23 @@ class Recipe(db.Model):
 class RecipeIngredient(db.Model):
     """レシピ材料中間テーブル"""
     __tablename__ = 'recipe_ingredients'
+    __table_args__ = (
+        # 材料→レシピの逆引き（材料価格の変更が影響するレシピの特定）用
+        db.Index('ix_recipe_ingredients_ingredient_recipe', 'ingredient_id', 'recipe_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey('recipes.id'), nullable=False, index=True)
     ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=False)
     quantity = db.Column(db.Numeric(10, 3), nullable=False)  # 使用量（使用単位での数量）
 
     def calculate_cost(self):
         """この材料の使用コストを計算"""
-        usage_unit_price = self.ingredient.get_usage_unit_price()
-        return float(self.quantity) * usage_unit_price
+        return money.to_float(self.calculate_line_cost())
+
+    def calculate_line_cost(self):
+        """この材料の使用コスト（サブ円の整数、app.money.line_cost）"""
+        return money.line_cost(self.ingredient.get_usage_price(), self.quantity)
 
     def __repr__(self):
         return f'<RecipeIngredient recipe_id={self.recipe_id} ingredient_id={self.ingredient_id}>'
@@ -263,7 +279,7 @@ class CustomCostItem(db.Model):
     __tablename__ = 'custom_cost_items'
 
     id = db.Column(db.Integer, primary_key=True)
-    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False)
+    store_id = db.Column(db.Integer, db.ForeignKey('stores.id'), nullable=False, index=True)
     name = db.Column(db.String(100), nullable=False)  # 項目名（例: 包装費、減価償却費など）
     calculation_type = db.Column(db.String(20), nullable=False)  # 計算方法: 'fixed', 'per_unit', 'per_time'
     amount = db.Column(db.Numeric(10, 2), nullable=False, default=0.0)  # 金額
@@ -280,27 +296,13 @@ class CustomCostItem(db.Model):
         Args:
             recipe: Recipeオブジェクト
 
+        固定費はレシピ全体に対して固定金額、個数あたりは製造個数 × 単価、
+        時間あたりは製造時間(分) × 分単価（app.money.custom_item_cost）
+
         Returns:
             float: 計算された原価
         """
-        if not self.is_active:
-            return 0.0
-
-        if self.calculation_type == 'fixed':
-            # 固定費: レシピ全体に対して固定金額
-            return float(self.amount)
-
-        elif self.calculation_type == 'per_unit':
-            # 個数あたり: 製造個数 × 単価
-            return float(self.amount) * recipe.production_quantity
-
-        elif self.calculation_type == 'per_time':
-            # 時間あたり: 製造時間(分) × 分単価
-            if recipe.production_time > 0:
-                return float(self.amount) * recipe.production_time
-            return 0.0
-
-        return 0.0
+        return money.to_float(money.custom_item_cost(self, recipe))
 
     def __repr__(self):
         return f'<CustomCostItem {self.name}>'
@@ -0,0 +1,203 @@
+"""
+整数による金額計算（1/10000円単位）
+
+原価計算の内部では金額を 1/10000 円単位の整数（サブ円）で扱い、Decimal(Numeric列)から
+floatへの変換を繰り返さずに計算します。端数処理は次の場所だけで行います。
+  - 材料行の金額・カスタム原価項目の金額: サブ円単位に丸める（偶数丸め）
+  - 1個あたり原価・推奨価格: 割り算・利益率の掛け算の結果をサブ円単位に丸める（偶数丸め）
+  - 画面・ラベルの表示: round_yen / format_yen（DISPLAY_ROUNDING、既定は四捨五入）
+
+使用単位あたりの単価は割り切れないことが多いため（例: 800円/450g）、1/10^8 円単位の整数で
+Ingredient.usage_price 列(BIGINT)に保存し、材料行の金額にするときに1回だけ丸めます。
+計算は整数と入力のDecimalだけで行うため、SQLiteとPostgreSQLのどちらでも同じ結果になり、
+原価スナップショット(Numeric(12,4))にそのまま保存できます。
+
+原価計算エンジン(app.costing)・材料価格変更の試算・Recipe / RecipeIngredient / CustomCostItem の
+各メソッドはすべてこのモジュールで計算するため、画面ごとに端数が異なることはありません
+（メソッドの戻り値のfloatはサブ円の整数を円にしたもの）。
+"""
+from decimal import Decimal, ROUND_HALF_EVEN, ROUND_HALF_UP
+from app import units
+
+# 1円あたりのサブ円
+SUBUNITS = 10000
+
+# 使用単位あたり単価の内部精度（1円 = PRICE_SCALE）
+# 材料行の金額の誤差は使用量 1000万単位でも0.05円以内
+PRICE_SCALE = 10 ** 8
+
+# 使用単位あたり単価の上限（Ingredient.usage_price の BIGINT に収まる範囲、約922億円）
+MAX_USAGE_PRICE = 2 ** 63 - 1
+
+# RecipeIngredient.quantity の小数桁（Numeric(10,3)）
+QUANTITY_SCALE = 1000
+
+# 表示・ラベル印字時の端数処理
+DISPLAY_ROUNDING = ROUND_HALF_UP
+
+_LINE_DIVISOR = PRICE_SCALE * QUANTITY_SCALE // SUBUNITS
+
+
+def _decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    if isinstance(value, float):
+        return Decimal(repr(value))
+    return Decimal(value)
+
+
+def _scaled(value, scale):
+    """値を scale 倍した整数（偶数丸め）"""
+    return int((_decimal(value) * scale).to_integral_value(ROUND_HALF_EVEN))
+
+
+def divide(numerator, denominator):
+    """整数の割り算（偶数丸め）"""
+    if denominator < 0:
+        numerator, denominator = -numerator, -denominator
+    quotient, remainder = divmod(numerator, denominator)
+    twice = remainder * 2
+    if twice > denominator or (twice == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def to_subunits(value):
+    """円(Decimal / float / int)をサブ円の整数にする"""
+    if value is None:
+        return 0
+    return _scaled(value, SUBUNITS)
+
+
+def to_decimal(subunits):
+    """サブ円を円のDecimalにする（小数4桁、スナップショット列の精度）"""
+    return Decimal(subunits).scaleb(-4)
+
+
+def to_float(subunits):
+    """サブ円を円のfloatにする（RecipeCost など既存の呼び出し側向け）"""
+    return subunits / SUBUNITS
+
+
+def usage_price(purchase_price, purchase_quantity, purchase_unit, usage_unit,
+                density=None, legacy_unit_price=None):
+    """
+    使用単位あたりの単価（1/PRICE_SCALE 円単位の整数）
+
+    材料の保存時に Ingredient.usage_price 列へ保存し、原価計算では使用量を掛けるだけにする。
+    一括INSERT/UPDATEなどモデルのイベントを通らない場合も、この関数で計算して保存すること。
+
+    Raises:
+        ValueError: 単価が MAX_USAGE_PRICE を超える場合（購入数量が極端に小さいなど）
+    """
+    if purchase_price is not None and purchase_quantity and purchase_unit and usage_unit:
+        factor = units.exact_conversion_factor(purchase_unit, usage_unit, density)
+        per_usage_unit = _decimal(purchase_price) / (_decimal(purchase_quantity) * factor)
+        price = _scaled(per_usage_unit, PRICE_SCALE)
+    elif legacy_unit_price is not None:
+        # 後方互換性: 旧フィールドを使用
+        price = _scaled(legacy_unit_price, PRICE_SCALE)
+    else:
+        return 0
+
+    if abs(price) > MAX_USAGE_PRICE:
+        raise ValueError('使用単位あたりの単価が大きすぎます。購入価格・購入数量・単位を確認してください')
+    return price
+
+
+def price_to_float(price):
+    """使用単位あたり単価（内部精度の整数）を円のfloatにする（表示用）"""
+    return price / PRICE_SCALE
+
+
+def line_cost(price, quantity):
+    """材料行の金額（サブ円）: 使用単位あたり単価 × 使用量"""
+    return divide(price * _scaled(quantity, QUANTITY_SCALE), _LINE_DIVISOR)
+
+
+def custom_item_cost(item, recipe):
+    """カスタム原価項目の金額（サブ円、CustomCostItem.calculate_cost と同じ計算）"""
+    if not item.is_active:
+        return 0
+
+    amount = to_subunits(item.amount)
+    if item.calculation_type == 'fixed':
+        return amount
+    if item.calculation_type == 'per_unit':
+        return amount * recipe.production_quantity
+    if item.calculation_type == 'per_time':
+        if recipe.production_time and recipe.production_time > 0:
+            return amount * recipe.production_time
+    return 0
+
+
+class RecipeAmounts:
+    """1レシピ分の金額（すべてサブ円の整数）"""
+
+    __slots__ = ('material', 'custom', 'total', 'unit', 'suggested', 'selling')
+
+    def __init__(self, material, custom, total, unit, suggested, selling):
+        self.material = material  # 材料費
+        self.custom = custom  # カスタム原価項目ごとの金額 [(CustomCostItem, 金額)]
+        self.total = total  # 総原価
+        self.unit = unit  # 1個あたりの原価
+        self.suggested = suggested  # 販売推奨価格
+        self.selling = selling  # 販売価格(手動設定があればそれ)
+
+    def __repr__(self):
+        return f'<RecipeAmounts unit={to_decimal(self.unit)} suggested={to_decimal(self.suggested)}>'
+
+
+def price_recipe(recipe, material, cost_setting, custom_items):
+    """
+    材料費（サブ円）からレシピの金額を求める
+
+    Args:
+        recipe: Recipeオブジェクト
+        material: 材料費（line_cost の合計）
+        cost_setting: 原価計算設定（Noneの場合はカスタム原価項目を加算しない）
+        custom_items: 有効なカスタム原価項目
+    """
+    custom = []
+    total = material
+
+    # カスタム原価項目は原価計算設定がある場合のみ加算する
+    if cost_setting:
+        for item in custom_items:
+            item_cost = custom_item_cost(item, recipe)
+            custom.append((item, item_cost))
+            total += item_cost
+
+    unit = divide(total, recipe.production_quantity) if recipe.production_quantity > 0 else 0
+
+    profit_margin = recipe.get_profit_margin(cost_setting)
+    if profit_margin > 0:
+        # 利益率(%)は小数2桁（Numeric(5,2)）のため 1/10000 単位の整数で掛ける
+        margin = _scaled(profit_margin, 100)
+        suggested = divide(unit * (10000 + margin), 10000)
+    else:
+        suggested = unit
+
+    selling = to_subunits(recipe.selling_price) if recipe.selling_price is not None else suggested
+    return RecipeAmounts(material, custom, total, unit, suggested, selling)
+
+
+def round_yen(value, places=0):
+    """
+    表示・ラベル印字用に金額を丸める（DISPLAY_ROUNDING）
+
+    Args:
+        value: 円(float / Decimal / int)
+        places: 小数桁数
+    """
+    if value is None:
+        return None
+    return _decimal(value).quantize(Decimal(1).scaleb(-places), rounding=DISPLAY_ROUNDING)
+
+
+def format_yen(value, places=0):
+    """表示用の金額の文字列（テンプレートの yen フィルター）"""
+    if value is None:
+        return ''
+    rounded = round_yen(value, places)
+    return f'{rounded + 0:.{places}f}'
@@ -0,0 +1,139 @@
+"""
+キーセット（カーソル）方式のページネーション
+
+OFFSET方式では深いページほど読み飛ばす行が増えますが、キーセット方式は
+「前のページの最後の行より後」を索引で直接検索するため、何ページ目でも1ページ分の読み込みで済みます。
+件数(COUNT)も取得しないため、ページ番号の代わりに前へ・次へのカーソルを返します。
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from sqlalchemy import and_, or_, tuple_
+
+
+class KeysetPagination:
+    """キーセット方式の1ページ分（Flask-SQLAlchemyのPaginationと同じく items / has_prev / has_next を持つ）"""
+
+    def __init__(self, items, per_page, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def _dump_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'dec': str(value)}
+    return value
+
+
+def _load_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'dec' in value:
+            return Decimal(value['dec'])
+        raise ValueError('不正なカーソルです')
+    return value
+
+
+def encode_cursor(values, direction='next'):
+    """並び順の列の値と方向からカーソル文字列を作る"""
+    payload = json.dumps({'d': direction, 'v': [_dump_value(value) for value in values]},
+                         separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """
+    カーソル文字列を (列の値のリスト, 方向) に戻す
+
+    Raises:
+        ValueError: カーソルの形式が正しくない場合
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        values = [_load_value(value) for value in payload['v']]
+        direction = payload['d']
+    except (ValueError, TypeError, KeyError, UnicodeError) as e:
+        raise ValueError('不正なカーソルです') from e
+
+    if direction not in ('next', 'prev') or len(values) != size:
+        raise ValueError('不正なカーソルです')
+    return values, direction
+
+
+def _seek_condition(order_by, values, backwards):
+    """カーソルの行より後（backwards の場合は前）の行を表す条件"""
+    descending = {desc != backwards for _column, desc in order_by}
+    columns = [column for column, _desc in order_by]
+
+    if len(descending) == 1:
+        # 並び順の向きが揃っていれば行値の比較にまとめ、複合索引をそのまま使えるようにする
+        if descending.pop():
+            return tuple_(*columns) < tuple_(*values)
+        return tuple_(*columns) > tuple_(*values)
+
+    # 向きが混在する場合は (a > x) OR (a = x AND b > y) ... に展開する
+    conditions = []
+    for index, (column, desc) in enumerate(order_by):
+        comparison = column < values[index] if desc != backwards else column > values[index]
+        equals = [prior == values[prior_index] for prior_index, (prior, _d) in enumerate(order_by[:index])]
+        conditions.append(and_(*equals, comparison))
+    return or_(*conditions)
+
+
+def keyset_paginate(query, order_by, cursor=None, per_page=20):
+    """
+    キーセット方式でクエリの1ページ分を取得する
+
+    Args:
+        query: 絞り込み済みのクエリ（order_by はこの関数で指定する）
+        order_by: [(列, 降順ならTrue)] 最後は主キーなど一意な列にすること。値がNULLの列は使えない
+        cursor: 前回のページが返した next_cursor / prev_cursor（Noneの場合は先頭ページ）
+        per_page: 1ページの件数
+
+    Returns:
+        KeysetPagination
+
+    Raises:
+        ValueError: カーソルの形式が正しくない場合
+    """
+    values, direction = decode_cursor(cursor, len(order_by)) if cursor else (None, 'next')
+    backwards = direction == 'prev'
+
+    if values is not None:
+        query = query.filter(_seek_condition(order_by, values, backwards))
+
+    # 前のページは並び順を逆にして取得し、取得後に元の順に戻す
+    ordering = [column.desc() if desc != backwards else column.asc() for column, desc in order_by]
+    rows = query.order_by(*ordering).limit(per_page + 1).all()
+
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(row, row_direction):
+        return encode_cursor([getattr(row, column.key) for column, _desc in order_by], row_direction)
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if has_more if not backwards else values is not None:
+            next_cursor = cursor_for(rows[-1], 'next')
+        if has_more if backwards else values is not None:
+            prev_cursor = cursor_for(rows[0], 'prev')
+
+    return KeysetPagination(rows, per_page, next_cursor=next_cursor, prev_cursor=prev_cursor)
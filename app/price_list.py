@@ -0,0 +1,325 @@
+"""
+仕入先価格表の一括取り込み
+
+CSV(またはXLSX)の価格表を1行ずつ読み込み、材料名・仕入先で既存の材料と照合して
+購入価格・購入数量・単位を更新します（該当がなければ新規登録）。
+仕入先が一致しない場合は仕入先が未登録の同名の材料を更新し、別の仕入先の材料しかなければその行をエラーにします。
+同じ既存の材料が複数行ある場合は後の行の内容で更新します。
+書き込みは一定件数ごとの executemany でまとめて行い、全体を1つのトランザクションで処理します。
+"""
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from sqlalchemy import insert, update
+from app.models import db, Ingredient
+from app.costing import refresh_cost_snapshots
+from app.money import usage_price
+from app.search import search_key
+from app.units import conversion_factor
+
+try:
+    from openpyxl import load_workbook
+except ImportError:  # XLSXの取り込みは openpyxl がある場合のみ
+    load_workbook = None
+
+# 1回の executemany で書き込む行数
+BATCH_SIZE = 500
+
+# 購入価格・購入数量の上限（Ingredient の Numeric(10, 2) / Numeric(10, 3)）
+MAX_PRICE = Decimal('99999999.99')
+MAX_QUANTITY = Decimal('9999999.999')
+
+# 記録するエラーの上限（件数は上限を超えても数える）
+MAX_REPORTED_ERRORS = 1000
+
+# 見出し行の列名（日本語・英語どちらでも可）
+COLUMN_ALIASES = {
+    'name': ('name', '材料名'),
+    'supplier': ('supplier', '仕入先'),
+    'purchase_price': ('purchase_price', '購入価格', '価格'),
+    'purchase_quantity': ('purchase_quantity', '購入数量', '数量'),
+    'purchase_unit': ('purchase_unit', '購入単位'),
+    'usage_unit': ('usage_unit', '使用単位'),
+}
+
+
+class PriceListError(Exception):
+    """価格表全体を処理できないエラー（見出し不正・形式未対応など）"""
+
+
+class ImportResult:
+    """取り込み結果"""
+
+    def __init__(self):
+        self.total_rows = 0  # 処理したデータ行数
+        self.updated = 0  # 更新した材料数
+        self.created = 0  # 新規登録した材料数
+        self.error_count = 0  # エラー行数
+        self.errors = []  # [(行番号, メッセージ)] 最大 MAX_REPORTED_ERRORS 件
+        self.affected_recipes = 0  # 原価を再計算したレシピ数
+        self.dry_run = False
+
+    def add_error(self, line_no, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, message))
+
+    def __repr__(self):
+        return (f'<ImportResult rows={self.total_rows} updated={self.updated} '
+                f'created={self.created} errors={self.error_count}>')
+
+
+def iter_csv_rows(stream, encoding='utf-8-sig'):
+    """バイナリストリームからCSVの行を1行ずつ返す"""
+    text_stream = io.TextIOWrapper(stream, encoding=encoding, newline='')
+    try:
+        yield from csv.reader(text_stream)
+    finally:
+        # 元のストリームは呼び出し側で閉じる
+        text_stream.detach()
+
+
+def iter_xlsx_rows(stream):
+    """XLSXの最初のシートの行を1行ずつ返す（読み取り専用モード）"""
+    if load_workbook is None:
+        raise PriceListError('XLSXの取り込みには openpyxl が必要です。CSVで保存して取り込んでください。')
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield ['' if value is None else str(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def iter_price_list_rows(stream, filename, encoding='utf-8-sig'):
+    """ファイル名の拡張子に応じて行を返す"""
+    if filename.lower().endswith('.xlsx'):
+        return iter_xlsx_rows(stream)
+    return iter_csv_rows(stream, encoding)
+
+
+def _resolve_columns(header):
+    """見出し行から列名→列番号の対応を作る"""
+    normalized = [str(cell).strip().lower() for cell in header]
+    columns = {}
+    for key, aliases in COLUMN_ALIASES.items():
+        for alias in aliases:
+            if alias.lower() in normalized:
+                columns[key] = normalized.index(alias.lower())
+                break
+
+    missing = [key for key in ('name', 'purchase_price') if key not in columns]
+    if missing:
+        raise PriceListError(f'見出し行に必須の列がありません: {", ".join(missing)}')
+    return columns
+
+
+def _parse_decimal(value, label, minimum, maximum, places):
+    """数値の検証（列の精度 Numeric(10, places) に丸めて範囲を確認する）"""
+    try:
+        number = Decimal(str(value).replace(',', '').strip())
+    except InvalidOperation:
+        raise ValueError(f'{label}が数値ではありません: {value}')
+    if not number.is_finite() or number < minimum:
+        raise ValueError(f'{label}は{minimum}以上で入力してください: {value}')
+    number = number.quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+    if number > maximum:
+        raise ValueError(f'{label}は{maximum:,}以下で入力してください: {value}')
+    return number
+
+
+class PriceListImporter:
+    """1店舗分の価格表取り込み"""
+
+    def __init__(self, store_id, create_missing=True):
+        self.store_id = store_id
+        self.create_missing = create_missing
+        self.result = ImportResult()
+        self._updates = {}  # {材料ID: 更新内容} 同じ材料が複数行ある場合は後の行で上書き
+        self._inserts = []
+        self._updated_ids = set()
+        self._new_keys = set()
+        self._by_key, self._by_name = self._load_index()
+
+    def _load_index(self):
+        """既存材料の照合用インデックス（列の値のみを読み込む）"""
+        rows = db.session.query(
+            Ingredient.id, Ingredient.name, Ingredient.supplier,
+            Ingredient.purchase_quantity, Ingredient.purchase_unit, Ingredient.usage_unit,
+            Ingredient.density, Ingredient.unit_price
+        ).filter(Ingredient.store_id == self.store_id).all()
+
+        by_key = {}
+        by_name = {}
+        for row in rows:
+            by_key[(row.name, row.supplier or '')] = row
+            by_name.setdefault(row.name, []).append(row)
+        return by_key, by_name
+
+    def _match(self, name, supplier):
+        """
+        材料名・仕入先で既存の材料を探す
+
+        仕入先が一致しない場合は、仕入先が未登録の同名の材料があればそれを更新する。
+        別の仕入先で登録された同名の材料しかない場合は、重複登録を避けるためエラーにする。
+        """
+        candidates = self._by_name.get(name, [])
+        if supplier:
+            existing = self._by_key.get((name, supplier))
+            if existing is not None:
+                return existing
+            blank = [row for row in candidates if not row.supplier]
+            if len(blank) == 1:
+                return blank[0]
+            if candidates:
+                suppliers = '、'.join(sorted({row.supplier or '未登録' for row in candidates}))
+                raise ValueError(f'材料「{name}」は仕入先「{suppliers}」で登録されています'
+                                 f'（価格表の仕入先: {supplier}）')
+            return None
+        if len(candidates) > 1:
+            raise ValueError(f'材料名「{name}」が複数あります。仕入先を指定してください')
+        return candidates[0] if candidates else None
+
+    def run(self, rows, dry_run=False):
+        """
+        価格表を取り込む
+
+        Args:
+            rows: 行(セルのリスト)のイテレータ。先頭行は見出し
+            dry_run: Trueの場合は検証のみでデータベースを変更しない
+
+        Returns:
+            ImportResult
+        """
+        self.result.dry_run = dry_run
+        rows = iter(rows)
+        try:
+            columns = _resolve_columns(next(rows))
+        except StopIteration:
+            raise PriceListError('価格表が空です')
+
+        try:
+            for line_no, row in enumerate(rows, start=2):
+                if not any(str(cell).strip() for cell in row):
+                    continue
+                self.result.total_rows += 1
+                try:
+                    self._handle_row(columns, row)
+                except ValueError as e:
+                    self.result.add_error(line_no, str(e))
+
+                if len(self._updates) >= BATCH_SIZE:
+                    self._flush_updates()
+                if len(self._inserts) >= BATCH_SIZE:
+                    self._flush_inserts()
+
+            self._flush_updates()
+            self._flush_inserts()
+
+            # 主キー指定の一括UPDATEは読み込み済みのオブジェクトに反映されないため破棄する
+            db.session.expire_all()
+
+            # 一括更新はセッションイベントを通らないため、影響するレシピをまとめて再計算する
+            deltas = refresh_cost_snapshots(ingredient_ids=self._updated_ids)
+            self.result.affected_recipes = len(deltas)
+
+            if dry_run:
+                db.session.rollback()
+            else:
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return self.result
+
+    def _cell(self, columns, row, key):
+        index = columns.get(key)
+        if index is None or index >= len(row):
+            return ''
+        return str(row[index]).strip()
+
+    def _handle_row(self, columns, row):
+        """1行を検証して書き込み待ちに追加"""
+        name = self._cell(columns, row, 'name')
+        supplier = self._cell(columns, row, 'supplier')
+        if not name:
+            raise ValueError('材料名が空です')
+
+        price = _parse_decimal(self._cell(columns, row, 'purchase_price'), '購入価格', 0, MAX_PRICE, 2)
+        quantity_text = self._cell(columns, row, 'purchase_quantity')
+
+        existing = self._match(name, supplier)
+        if existing is None and (name, supplier) in self._new_keys:
+            raise ValueError(f'材料「{name}」が価格表内で重複しています')
+
+        quantity = _parse_decimal(quantity_text, '購入数量', Decimal('0.001'), MAX_QUANTITY, 3) \
+            if quantity_text else None
+        purchase_unit = self._cell(columns, row, 'purchase_unit') or (existing.purchase_unit if existing else '')
+        usage_unit = self._cell(columns, row, 'usage_unit') or (existing.usage_unit if existing else '')
+
+        density = existing.density if existing else None
+        if purchase_unit and usage_unit:
+            conversion_factor(purchase_unit, usage_unit, density, strict=True)
+
+        now = datetime.utcnow()
+        if existing is not None:
+            quantity = quantity if quantity is not None else (existing.purchase_quantity or 1)
+            self._updates[existing.id] = {
+                'id': existing.id,
+                'purchase_price': price,
+                'purchase_quantity': quantity,
+                'purchase_unit': purchase_unit or None,
+                'usage_unit': usage_unit or None,
+                # 一括UPDATEはモデルのイベントを通らないため明示的に計算
+                'usage_price': usage_price(price, quantity, purchase_unit, usage_unit,
+                                           density, existing.unit_price),
+                'updated_at': now,
+            }
+            # 同じ材料が価格表に複数行あっても更新数は1件と数える
+            if existing.id not in self._updated_ids:
+                self._updated_ids.add(existing.id)
+                self.result.updated += 1
+            return
+
+        if not self.create_missing:
+            raise ValueError(f'材料「{name}」が見つかりません')
+        if not purchase_unit or not usage_unit:
+            raise ValueError(f'新規の材料「{name}」には購入単位と使用単位が必要です')
+
+        self._inserts.append({
+            'store_id': self.store_id,
+            'name': name,
+            'search_name': search_key(name),  # 一括INSERTはモデルのイベントを通らないため明示的に設定
+            'supplier': supplier or None,
+            'purchase_price': price,
+            'purchase_quantity': quantity if quantity is not None else 1,
+            'purchase_unit': purchase_unit,
+            'usage_unit': usage_unit,
+            'usage_price': usage_price(price, quantity if quantity is not None else 1,
+                                       purchase_unit, usage_unit),
+            'is_allergen': False,
+            'created_at': now,
+            'updated_at': now,
+        })
+        self._new_keys.add((name, supplier))
+        self.result.created += 1
+
+    def _flush_updates(self):
+        """主キー指定の一括UPDATE（executemany）"""
+        if self._updates:
+            db.session.execute(update(Ingredient), list(self._updates.values()))
+            self._updates = {}
+
+    def _flush_inserts(self):
+        """一括INSERT（executemany）"""
+        if self._inserts:
+            db.session.execute(insert(Ingredient), self._inserts)
+            self._inserts = []
+
+
+def import_price_list(store_id, stream, filename, encoding='utf-8-sig', dry_run=False, create_missing=True):
+    """価格表ファイルを取り込む"""
+    importer = PriceListImporter(store_id, create_missing=create_missing)
+    return importer.run(iter_price_list_rows(stream, filename, encoding), dry_run=dry_run)
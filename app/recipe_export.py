@@ -0,0 +1,108 @@
+"""
+レシピ原価の一括エクスポート（CSV / JSON Lines）
+
+店舗の全レシピをサーバーサイドカーソル(yield_per)で少しずつ読み込み、
+一定件数ごとに StoreCostEngine で原価を計算して1行ずつ出力します。
+処理済みのレシピはセッションから切り離すため、レシピ数が多くてもメモリ使用量は一定です。
+"""
+import csv
+import io
+import json
+from app.models import db, Recipe
+from app.costing import StoreCostEngine
+from app.money import round_yen
+
+# 1回に読み込んで原価を計算するレシピ数
+CHUNK_SIZE = 500
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson; charset=utf-8', 'jsonl'),
+}
+
+# 出力する列（キー, CSV見出し）
+EXPORT_COLUMNS = [
+    ('recipe_id', 'レシピID'),
+    ('product_name', '商品名'),
+    ('category', 'カテゴリー'),
+    ('production_quantity', '製造個数'),
+    ('material_cost', '材料費'),
+    ('total_cost', '総原価'),
+    ('unit_cost', '1個あたり原価'),
+    ('profit_margin', '利益率'),
+    ('suggested_price', '販売推奨価格'),
+    ('selling_price', '販売価格'),
+]
+
+
+def iter_recipe_costs(store_id, chunk_size=CHUNK_SIZE):
+    """店舗の全レシピの原価を1件ずつ返す（dict）"""
+    engine = StoreCostEngine.for_store(store_id)
+    statement = db.select(Recipe)\
+        .filter_by(store_id=store_id)\
+        .order_by(Recipe.id)\
+        .execution_options(yield_per=chunk_size)
+
+    chunk = []
+    for recipe in db.session.execute(statement).scalars():
+        chunk.append(recipe)
+        if len(chunk) >= chunk_size:
+            yield from _price_chunk(engine, chunk)
+            chunk = []
+    if chunk:
+        yield from _price_chunk(engine, chunk)
+
+
+def _price_chunk(engine, recipes):
+    """チャンク単位で原価を計算し、処理後はセッションから切り離す"""
+    costs = engine.price(recipes)
+    for recipe in recipes:
+        cost = costs[recipe.id]
+        yield {
+            'recipe_id': recipe.id,
+            'product_name': recipe.product_name,
+            'category': recipe.category or '',
+            'production_quantity': recipe.production_quantity,
+            'material_cost': float(round_yen(cost.material_cost, 2)),
+            'total_cost': float(round_yen(cost.total_cost, 2)),
+            'unit_cost': float(round_yen(cost.unit_cost, 2)),
+            'profit_margin': float(cost.profit_margin),
+            'suggested_price': float(round_yen(cost.suggested_price, 2)),
+            'selling_price': float(round_yen(cost.display_price, 2)),
+        }
+
+    # 材料は次のチャンクでも使うため残し、レシピと材料行だけを切り離す
+    for recipe in recipes:
+        for ri, _ingredient, _price, _line_cost in costs[recipe.id].lines:
+            db.session.expunge(ri)
+        db.session.expunge(recipe)
+
+
+def iter_csv(rows):
+    """CSVとして1行ずつ文字列を返す（Excelで開けるようBOM付き）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    buffer.write('\ufeff')
+    writer.writerow([label for _key, label in EXPORT_COLUMNS])
+    yield buffer.getvalue()
+
+    for row in rows:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([row[key] for key, _label in EXPORT_COLUMNS])
+        yield buffer.getvalue()
+
+
+def iter_jsonl(rows):
+    """JSON Linesとして1行ずつ文字列を返す"""
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def iter_export(store_id, export_format):
+    """指定形式でエクスポートする"""
+    rows = iter_recipe_costs(store_id)
+    if export_format == 'jsonl':
+        return iter_jsonl(rows)
+    return iter_csv(rows)
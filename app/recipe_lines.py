@@ -0,0 +1,137 @@
+"""
+レシピ材料の差分保存
+
+レシピ材料編集画面から送信された行を既存の行と比較し、追加・変更・削除の必要な行だけを
+それぞれ1回の一括INSERT / UPDATE / DELETEで書き込みます。
+変更のない行はIDも含めてそのまま残るため、全削除→再登録に比べて書き込み量と不要行（PostgreSQLの不要タプル）が減ります。
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import delete, insert, update
+from app.models import db, Ingredient, RecipeIngredient
+from app.costing import refresh_cost_snapshots
+
+# 使用量の精度（RecipeIngredient.quantity の小数桁数）
+QUANTITY_QUANTUM = Decimal('0.001')
+
+
+class RecipeLineChanges:
+    """保存で変更された材料行"""
+
+    def __init__(self):
+        self.inserted = []  # [(ingredient_id, 使用量)]
+        self.updated = []  # [(ingredient_id, 変更前の使用量, 変更後の使用量)]
+        self.deleted = []  # [(ingredient_id, 使用量)]
+        self.cost_delta = None  # 原価の変化（RecipeCostDelta、変更がない場合はNone）
+
+    @property
+    def changed(self):
+        return bool(self.inserted or self.updated or self.deleted)
+
+    def to_dict(self):
+        return {
+            'inserted': [{'ingredient_id': ingredient_id, 'quantity': float(quantity)}
+                         for ingredient_id, quantity in self.inserted],
+            'updated': [{'ingredient_id': ingredient_id, 'old_quantity': float(old), 'quantity': float(new)}
+                        for ingredient_id, old, new in self.updated],
+            'deleted': [{'ingredient_id': ingredient_id, 'quantity': float(quantity)}
+                        for ingredient_id, quantity in self.deleted],
+            'cost': self.cost_delta.to_dict() if self.cost_delta else None,
+        }
+
+    def __repr__(self):
+        return (f'<RecipeLineChanges inserted={len(self.inserted)} '
+                f'updated={len(self.updated)} deleted={len(self.deleted)}>')
+
+
+def parse_submitted_lines(ingredient_ids, quantities):
+    """
+    フォームの ingredient_id[] / quantity[] を [(ingredient_id, 使用量)] にする
+
+    空欄や数値でない行は従来どおり読み飛ばす。
+    """
+    lines = []
+    for ingredient_id, quantity in zip(ingredient_ids, quantities):
+        if not ingredient_id or not quantity:
+            continue
+        try:
+            value = Decimal(str(quantity)).quantize(QUANTITY_QUANTUM)
+            lines.append((int(ingredient_id), value))
+        except (ValueError, TypeError, InvalidOperation):
+            continue
+    return lines
+
+
+def save_recipe_lines(recipe, lines):
+    """
+    レシピの材料行を送信された内容に合わせる（差分のみ書き込み）
+
+    同じ材料の行が複数ある場合は、既存の行と送信された行を並び順で対応させる。
+
+    Args:
+        recipe: Recipeオブジェクト
+        lines: [(ingredient_id, 使用量)]
+
+    Returns:
+        RecipeLineChanges
+
+    Raises:
+        ValueError: 他店舗の材料・存在しない材料が含まれる場合
+    """
+    changes = RecipeLineChanges()
+
+    # 材料の所有者確認（1回のクエリ）
+    requested_ids = {ingredient_id for ingredient_id, _quantity in lines}
+    if requested_ids:
+        owned_ids = set(db.session.scalars(
+            db.select(Ingredient.id).where(Ingredient.store_id == recipe.store_id,
+                                           Ingredient.id.in_(requested_ids))
+        ))
+        if owned_ids != requested_ids:
+            raise ValueError('登録されていない材料が含まれています')
+
+    # 既存の行（ID順）を材料ごとにまとめる
+    existing = defaultdict(list)
+    for row in db.session.execute(
+        db.select(RecipeIngredient.id, RecipeIngredient.ingredient_id, RecipeIngredient.quantity)
+        .where(RecipeIngredient.recipe_id == recipe.id)
+        .order_by(RecipeIngredient.id)
+    ):
+        existing[row.ingredient_id].append(row)
+
+    inserts = []
+    updates = []
+    for ingredient_id, quantity in lines:
+        rows = existing.get(ingredient_id)
+        if rows:
+            row = rows.pop(0)
+            if row.quantity != quantity:
+                updates.append({'id': row.id, 'quantity': quantity})
+                changes.updated.append((ingredient_id, row.quantity, quantity))
+        else:
+            inserts.append({'recipe_id': recipe.id, 'ingredient_id': ingredient_id, 'quantity': quantity})
+            changes.inserted.append((ingredient_id, quantity))
+
+    delete_ids = []
+    for rows in existing.values():
+        for row in rows:
+            delete_ids.append(row.id)
+            changes.deleted.append((row.ingredient_id, row.quantity))
+
+    if not changes.changed:
+        return changes
+
+    if delete_ids:
+        db.session.execute(delete(RecipeIngredient).where(RecipeIngredient.id.in_(delete_ids)))
+    if updates:
+        db.session.execute(update(RecipeIngredient), updates)
+    if inserts:
+        db.session.execute(insert(RecipeIngredient), inserts)
+
+    # 一括書き込みは読み込み済みの材料行に反映されないため読み直させる
+    db.session.expire(recipe, ['recipe_ingredients'])
+
+    # 一括書き込みはセッションイベントを通らないため、原価スナップショットを明示的に再計算する
+    deltas = refresh_cost_snapshots(recipe_ids=[recipe.id])
+    changes.cost_delta = deltas.get(recipe.id)
+    return changes
@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import db, Store, CostSetting
 from app.forms import RegistrationForm, LoginForm, PasswordChangeForm, PasswordResetForm, ForgotLoginIDForm
+from app.search import apply_search
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -119,7 +120,7 @@ def forgot_login_id():
 
     if form.validate_on_submit():
         # 店舗名で検索（部分一致）
-        found_stores = Store.query.filter(Store.store_name.like(f'%{form.store_name.data}%')).all()
+        found_stores = apply_search(Store.query, Store, form.store_name.data).all()
 
         if not found_stores:
             flash('該当する店舗が見つかりませんでした', 'warning')
@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required, current_user
 from app.models import db, CustomCostItem
+from app.cost_items import ConcurrentUpdateError, bulk_reorder, bulk_set_active, items_version
 
 bp = Blueprint('custom_costs', __name__, url_prefix='/custom-costs')
 
@@ -13,7 +14,8 @@ def index():
         .order_by(CustomCostItem.display_order, CustomCostItem.id)\
         .all()
 
-    return render_template('custom_costs/index.html', items=items)
+    return render_template('custom_costs/index.html', items=items,
+                         version=items_version(current_user.id))
 
 
 @bp.route('/create', methods=['POST'])
@@ -122,20 +124,65 @@ def delete(id):
 @bp.route('/reorder', methods=['POST'])
 @login_required
 def reorder():
-    """表示順序の変更"""
-    order_data = request.json.get('order', [])
+    """
+    表示順序の変更
 
-    try:
-        for index, item_id in enumerate(order_data):
-            item = CustomCostItem.query.filter_by(
-                id=item_id,
-                store_id=current_user.id
-            ).first()
-            if item:
-                item.display_order = index
+    JSON: {"order": [項目ID, ...], "version": 表示時の版(省略可)}
+    """
+    data = request.get_json(silent=True) or {}
 
+    try:
+        order_data = [int(item_id) for item_id in data.get('order', [])]
+        version = bulk_reorder(current_user.id, order_data, data.get('version'))
         db.session.commit()
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'version': version})
+    except ConcurrentUpdateError as e:
+        return jsonify({'success': False, 'error': str(e), 'version': e.version}), 409
+    except (ValueError, TypeError) as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@bp.route('/bulk-toggle', methods=['POST'])
+@login_required
+def bulk_toggle():
+    """
+    複数の項目の有効/無効をまとめて切り替え
+
+    JSON: {"ids": [項目ID, ...], "active": true/false, "version": 表示時の版(省略可)}
+    フォーム: item_id[] / active / version
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = {
+            'ids': request.form.getlist('item_id[]'),
+            'active': request.form.get('active') in ('1', 'true', 'on'),
+            'version': request.form.get('version'),
+        }
+
+    try:
+        item_ids = [int(item_id) for item_id in data.get('ids', [])]
+        changed, version = bulk_set_active(current_user.id, item_ids, bool(data.get('active')),
+                                           data.get('version'))
+        db.session.commit()
+    except ConcurrentUpdateError as e:
+        if request.is_json:
+            return jsonify({'success': False, 'error': str(e), 'version': e.version}), 409
+        flash(str(e), 'warning')
+        return redirect(url_for('custom_costs.index'))
+    except (ValueError, TypeError) as e:
+        db.session.rollback()
+        if request.is_json:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        flash(str(e), 'danger')
+        return redirect(url_for('custom_costs.index'))
+
+    if request.is_json:
+        return jsonify({'success': True, 'changed': changed, 'version': version})
+
+    status = '有効' if data.get('active') else '無効'
+    flash(f'{changed}件の原価項目を{status}にしました', 'info')
+    return redirect(url_for('custom_costs.index'))
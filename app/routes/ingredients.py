@@ -1,10 +1,27 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+import hashlib
+import click
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
 from flask_login import login_required, current_user
-from app.models import db, Ingredient
+from sqlalchemy import func
+from app.models import db, Ingredient, Store
 from app.forms import IngredientForm
+from app.costing import preview_price_changes, pop_cost_changes
+from app.price_list import import_price_list, PriceListError
+from app.pagination import keyset_paginate
+from app.search import apply_search, apply_prefix_search
+from app.money import format_yen
 
 bp = Blueprint('ingredients', __name__, url_prefix='/ingredients')
 
+# キーセット方式のページネーションの並び順（登録日の新しい順）
+KEYSET_ORDER = [(Ingredient.created_at, True), (Ingredient.id, True)]
+
+# 候補検索APIの並び順（正規化した材料名順、前方一致の索引と同じ順）
+LOOKUP_ORDER = [(Ingredient.search_name, False), (Ingredient.id, False)]
+LOOKUP_MAX_LIMIT = 50
+LOOKUP_MAX_AGE = 30  # ブラウザでキャッシュする秒数（以降はETagで再検証）
+LOOKUP_FORMAT = 2  # 応答の項目を変えたら上げる（ブラウザのキャッシュをETagで無効にする）
+
 
 @bp.route('/')
 @login_required
@@ -12,18 +29,82 @@ def index():
     """材料一覧"""
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str)
+    cursor = request.args.get('cursor', type=str)
 
     query = Ingredient.query.filter_by(store_id=current_user.id)
 
     if search:
-        query = query.filter(Ingredient.name.like(f'%{search}%'))
+        query = apply_search(query, Ingredient, search)
 
-    ingredients = query.order_by(Ingredient.created_at.desc())\
-        .paginate(page=page, per_page=20, error_out=False)
+    # cursor 指定時（または設定でキーセット方式を既定にした場合）は深いページでも1ページ分だけ読む
+    keyset = cursor is not None or current_app.config['LISTING_PAGINATION'] == 'keyset'
+    if keyset:
+        try:
+            ingredients = keyset_paginate(query, KEYSET_ORDER, cursor or None, per_page=20)
+        except ValueError:
+            ingredients = keyset_paginate(query, KEYSET_ORDER, None, per_page=20)
+    else:
+        ingredients = query.order_by(Ingredient.created_at.desc(), Ingredient.id.desc())\
+            .paginate(page=page, per_page=20, error_out=False)
 
     return render_template('ingredients/index.html',
                          ingredients=ingredients,
-                         search=search)
+                         search=search,
+                         keyset=keyset)
+
+
+@bp.route('/lookup')
+@login_required
+def lookup():
+    """
+    材料の候補検索API(JSON)
+
+    q: 検索語（正規化した材料名の前方一致。match=contains の場合は部分一致）
+    cursor: 前回の応答の next_cursor（続きの候補を取得する場合）
+    limit: 取得件数（最大 LOOKUP_MAX_LIMIT）
+    """
+    term = request.args.get('q', '', type=str)
+    match = request.args.get('match', 'prefix', type=str)
+    cursor = request.args.get('cursor', type=str)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), LOOKUP_MAX_LIMIT)
+
+    query = Ingredient.query.filter_by(store_id=current_user.id)
+
+    # 材料の追加・更新・削除で変わる値からETagを作り、変更がなければ候補を読み込まずに304を返す
+    last_updated, count = db.session.query(func.max(Ingredient.updated_at), func.count(Ingredient.id))\
+        .filter(Ingredient.store_id == current_user.id).one()
+    etag = hashlib.sha1(
+        f'{LOOKUP_FORMAT}:{current_user.id}:{last_updated}:{count}:{term}:{match}:{cursor}:{limit}'.encode('utf-8')
+    ).hexdigest()
+    if etag in request.if_none_match:
+        response = current_app.response_class(status=304)
+    else:
+        if match == 'contains':
+            query = apply_search(query, Ingredient, term)
+        else:
+            query = apply_prefix_search(query, Ingredient, term)
+
+        try:
+            page = keyset_paginate(query, LOOKUP_ORDER, cursor, per_page=limit)
+        except ValueError:
+            return jsonify({'error': '不正なカーソルです'}), 400
+
+        response = jsonify({
+            'items': [{
+                'id': ingredient.id,
+                'name': ingredient.name,
+                'usage_unit': ingredient.usage_unit,
+                'unit_price': round(ingredient.get_usage_unit_price(), 4),
+                'unit_price_label': format_yen(ingredient.get_usage_unit_price(), 2),  # 画面と同じ端数処理
+            } for ingredient in page.items],
+            'next_cursor': page.next_cursor,
+        })
+
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = LOOKUP_MAX_AGE
+    response.vary.add('Cookie')
+    return response
 
 
 @bp.route('/create', methods=['GET', 'POST'])
@@ -40,6 +121,7 @@ def create():
             purchase_quantity=form.purchase_quantity.data if form.purchase_quantity.data else 1,
             purchase_unit=form.purchase_unit.data if form.purchase_unit.data else None,
             usage_unit=form.usage_unit.data if form.usage_unit.data else None,
+            density=form.density.data,
             supplier=form.supplier.data,
             is_allergen=form.is_allergen.data,
             allergen_type=form.allergen_type.data if form.is_allergen.data else None
@@ -70,6 +152,13 @@ def edit(id):
         db.session.commit()
 
         flash(f'材料「{ingredient.name}」を更新しました', 'success')
+
+        # 価格・単位の変更で原価が変わったレシピを通知
+        changed = [delta for delta in pop_cost_changes() if abs(delta.unit_cost_delta) >= 0.005]
+        if changed:
+            largest = changed[0]
+            flash(f'{len(changed)}件のレシピの原価が変わりました'
+                  f'（最大: {largest.recipe.product_name} {largest.unit_cost_delta:+.2f}円/個）', 'info')
         return redirect(url_for('ingredients.index'))
 
     return render_template('ingredients/form.html',
@@ -78,6 +167,95 @@ def edit(id):
                          title='材料編集')
 
 
+@bp.route('/<int:id>/impact')
+@login_required
+def impact(id):
+    """材料価格変更の影響試算API(JSON)"""
+    ingredient = Ingredient.query.filter_by(id=id, store_id=current_user.id).first_or_404()
+
+    change = {}
+    for key in ('purchase_price', 'purchase_quantity'):
+        value = request.args.get(key, type=float)
+        if value is not None:
+            change[key] = value
+    for key in ('purchase_unit', 'usage_unit'):
+        value = request.args.get(key, type=str)
+        if value:
+            change[key] = value
+
+    deltas = preview_price_changes(current_user.id, {ingredient.id: change})
+
+    return jsonify({
+        'ingredient_id': ingredient.id,
+        'affected_recipes': [delta.to_dict() for delta in deltas]
+    })
+
+
+@bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_prices():
+    """仕入先価格表の一括取り込み"""
+    result = None
+
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        encoding = request.form.get('encoding', 'utf-8-sig')
+        dry_run = request.form.get('dry_run') == 'on'
+        create_missing = request.form.get('create_missing') == 'on'
+
+        if encoding not in ('utf-8-sig', 'cp932'):
+            encoding = 'utf-8-sig'
+
+        if not upload or not upload.filename:
+            flash('価格表ファイルを選択してください', 'danger')
+            return redirect(url_for('ingredients.import_prices'))
+
+        try:
+            result = import_price_list(current_user.id, upload.stream, upload.filename,
+                                       encoding=encoding, dry_run=dry_run,
+                                       create_missing=create_missing)
+        except (PriceListError, UnicodeDecodeError) as e:
+            flash(f'価格表を読み込めませんでした: {e}', 'danger')
+            return redirect(url_for('ingredients.import_prices'))
+
+        if result.dry_run:
+            flash(f'検証のみ実行しました（{result.total_rows}行）。データは変更されていません', 'info')
+        else:
+            flash(f'価格表を取り込みました（更新 {result.updated}件・新規 {result.created}件・'
+                  f'原価再計算 {result.affected_recipes}件）', 'success')
+
+    return render_template('ingredients/import.html', result=result)
+
+
+@bp.cli.command('import-prices')
+@click.argument('login_id')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--encoding', default='utf-8-sig', help='CSVの文字コード（Excel出力の場合は cp932）')
+@click.option('--dry-run', is_flag=True, help='検証のみ行いデータベースを変更しない')
+@click.option('--no-create', is_flag=True, help='一致しない材料を新規登録しない')
+def import_prices_command(login_id, path, encoding, dry_run, no_create):
+    """仕入先価格表(CSV/XLSX)を店舗の材料に取り込む"""
+    store = Store.query.filter_by(login_id=login_id).first()
+    if not store:
+        raise click.ClickException(f'店舗が見つかりません: {login_id}')
+
+    with open(path, 'rb') as f:
+        try:
+            result = import_price_list(store.id, f, path, encoding=encoding,
+                                       dry_run=dry_run, create_missing=not no_create)
+        except PriceListError as e:
+            raise click.ClickException(str(e))
+
+    for line_no, message in result.errors:
+        click.echo(f'{line_no}行目: {message}', err=True)
+    if result.error_count > len(result.errors):
+        click.echo(f'...ほか{result.error_count - len(result.errors)}件のエラー', err=True)
+
+    click.echo(f'{"[検証のみ] " if dry_run else ""}{result.total_rows}行: '
+               f'更新 {result.updated}件 / 新規 {result.created}件 / エラー {result.error_count}件 / '
+               f'原価再計算 {result.affected_recipes}件')
+
+
 @bp.route('/<int:id>/delete', methods=['POST'])
 @login_required
 def delete(id):
@@ -1,6 +1,10 @@
-from flask import Blueprint, render_template, send_file, request
+from flask import Blueprint, render_template, send_file, request, current_app, jsonify, abort, url_for
 from flask_login import login_required, current_user
-from app.models import Recipe, CostSetting
+from app.models import Recipe
+from app.costing import store_context
+from app.loading import load_profile
+from app.money import format_yen
+from app import label_cache, label_jobs
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from reportlab.pdfgen import canvas
@@ -8,62 +12,126 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.utils import simpleSplit
 from datetime import datetime, timedelta
-import io
+from functools import lru_cache
+import logging
 import os
+import tempfile
+import threading
+import time
 
 bp = Blueprint('labels', __name__, url_prefix='/labels')
 
+logger = logging.getLogger(__name__)
 
-def split_text_by_width(canvas_obj, text, font_name, font_size, max_width):
-    """
-    テキストを指定した幅に収まるように1文字ずつ分割する（商品名用）
+# 一括印刷のPDFをメモリ上に保持する上限（超えた分は一時ファイルに書き出す）
+BATCH_SPOOL_SIZE = 8 * 1024 * 1024
 
-    Args:
-        canvas_obj: ReportLabのCanvasオブジェクト
-        text: 分割するテキスト
-        font_name: フォント名
-        font_size: フォントサイズ
-        max_width: 最大幅（ポイント単位）
 
-    Returns:
-        分割された行のリスト
+# 折り返し結果のキャッシュ件数（商品名・材料一覧など）
+WRAP_CACHE_SIZE = 1024
+
+# フォント・サイズごとの1文字あたりの幅 {(font_name, font_size): {char: width}}
+_glyph_widths = {}
+
+
+def _glyph_width_table(font_name, font_size):
+    """フォント・サイズごとの文字幅テーブルを返す"""
+    key = (font_name, font_size)
+    table = _glyph_widths.get(key)
+    if table is None:
+        table = _glyph_widths.setdefault(key, {})
+    return table
+
+
+def text_width(text, font_name, font_size):
     """
-    if not text:
-        return []
+    文字幅をキャッシュしながらテキストの幅を求める
+
+    ReportLabの文字列幅は各文字の送り幅の合計なので、1文字ずつの幅を足し合わせれば
+    文字列全体を毎回計測し直す必要はない。
+    """
+    table = _glyph_width_table(font_name, font_size)
+    width = 0.0
+    for char in text:
+        char_width = table.get(char)
+        if char_width is None:
+            char_width = table[char] = pdfmetrics.stringWidth(char, font_name, font_size)
+        width += char_width
+    return width
+
 
+@lru_cache(maxsize=WRAP_CACHE_SIZE)
+def wrap_by_char(text, font_name, font_size, max_width):
+    """1文字単位で折り返す（結果はテキスト・フォント・サイズ・幅ごとにキャッシュ）"""
+    table = _glyph_width_table(font_name, font_size)
     lines = []
-    current_line = ""
+    current_line = []
+    current_width = 0.0
 
     for char in text:
-        test_line = current_line + char
-        text_width = canvas_obj.stringWidth(test_line, font_name, font_size)
+        char_width = table.get(char)
+        if char_width is None:
+            char_width = table[char] = pdfmetrics.stringWidth(char, font_name, font_size)
 
-        if text_width <= max_width:
+        if current_width + char_width <= max_width:
             # 幅内に収まる場合は追加
-            current_line = test_line
-        else:
+            current_line.append(char)
+            current_width += char_width
+        elif current_line:
             # 幅を超える場合、現在の行を確定して次の行へ
-            if current_line:
-                lines.append(current_line)
-                current_line = char
-            else:
-                # 1文字だけで幅を超える場合（通常はありえない）
-                lines.append(char)
-                current_line = ""
+            lines.append(''.join(current_line))
+            current_line = [char]
+            current_width = char_width
+        else:
+            # 1文字だけで幅を超える場合（通常はありえない）
+            lines.append(char)
+
+    # 最後の行を追加
+    if current_line:
+        lines.append(''.join(current_line))
+
+    return tuple(lines)
+
+
+@lru_cache(maxsize=WRAP_CACHE_SIZE)
+def wrap_by_separator(text, font_name, font_size, max_width, separator='、'):
+    """区切り文字の単位で折り返す（結果はテキスト・フォント・サイズ・幅ごとにキャッシュ）"""
+    items = text.split(separator)
+    lines = []
+    current_line = ''
+    current_width = 0.0
+
+    for i, item in enumerate(items):
+        # 最後の項目以外は区切り文字を付ける
+        piece = item if i == len(items) - 1 else item + separator
+        piece_width = text_width(piece, font_name, font_size)
+
+        if current_width + piece_width <= max_width:
+            # 幅内に収まる場合は現在の行に追加
+            current_line += piece
+            current_width += piece_width
+        elif current_line:
+            # 現在の行を確定して次の行へ
+            lines.append(current_line)
+            current_line = piece
+            current_width = piece_width
+        else:
+            # 1つの項目だけで幅を超える場合は強制的に追加
+            lines.append(piece)
 
     # 最後の行を追加
     if current_line:
         lines.append(current_line)
 
-    return lines
+    return tuple(lines)
 
 
-def split_japanese_text(canvas_obj, text, font_name, font_size, max_width):
+def split_text_by_width(canvas_obj, text, font_name, font_size, max_width):
     """
-    日本語テキストを指定した幅に収まるように分割する（材料用）
+    テキストを指定した幅に収まるように1文字ずつ分割する（商品名用）
 
     Args:
-        canvas_obj: ReportLabのCanvasオブジェクト
+        canvas_obj: ReportLabのCanvasオブジェクト（互換性のため。幅の計測には使わない）
         text: 分割するテキスト
         font_name: フォント名
         font_size: フォントサイズ
@@ -74,39 +142,27 @@ def split_japanese_text(canvas_obj, text, font_name, font_size, max_width):
     """
     if not text:
         return []
+    return list(wrap_by_char(text, font_name, font_size, max_width))
 
-    # 材料を「、」で分割
-    ingredients = text.split('、')
-    lines = []
-    current_line = ""
-
-    for i, ingredient in enumerate(ingredients):
-        # 最後の材料以外は「、」を追加
-        test_text = ingredient if i == len(ingredients) - 1 else ingredient + '、'
-
-        # 現在の行に追加した場合の幅をチェック
-        test_full_line = current_line + test_text if current_line else test_text
-        text_width = canvas_obj.stringWidth(test_full_line, font_name, font_size)
 
-        if text_width <= max_width:
-            # 幅内に収まる場合は現在の行に追加
-            current_line = test_full_line
-        else:
-            # 幅を超える場合
-            if current_line:
-                # 現在の行を確定して次の行へ
-                lines.append(current_line)
-                current_line = test_text
-            else:
-                # 1つの材料だけで幅を超える場合は強制的に追加
-                lines.append(test_text)
-                current_line = ""
+def split_japanese_text(canvas_obj, text, font_name, font_size, max_width):
+    """
+    日本語テキストを指定した幅に収まるように分割する（材料用）
 
-    # 最後の行を追加
-    if current_line:
-        lines.append(current_line)
+    Args:
+        canvas_obj: ReportLabのCanvasオブジェクト（互換性のため。幅の計測には使わない）
+        text: 分割するテキスト
+        font_name: フォント名
+        font_size: フォントサイズ
+        max_width: 最大幅（ポイント単位）
 
-    return lines
+    Returns:
+        分割された行のリスト
+    """
+    if not text:
+        return []
+    # 材料を「、」で分割
+    return list(wrap_by_separator(text, font_name, font_size, max_width))
 
 # A-ONE製品ラベルサイズプリセット
 LABEL_PRESETS = {
@@ -220,14 +276,26 @@ LABEL_PRESETS = {
 }
 
 
-def register_fonts():
-    """日本語フォントの登録"""
+# 登録済みフォント名（プロセス内で1回だけ解決する）
+_registered_font = None
+_font_lock = threading.Lock()
+
+
+def _font_candidates(font_path=None, subset_font_path=None):
+    """試すフォントの候補（パス, TTCのサブフォント番号）を優先順に返す"""
+    candidates = []
+
+    # 設定で指定されたフォント（サブセット化済みのフォントを最優先）
+    for path in (subset_font_path, font_path):
+        if path:
+            candidates.append((path, 0 if path.lower().endswith('.ttc') else None))
+
     # プロジェクト内のフォントパス（本番環境用）
     app_font_path = os.path.join(os.path.dirname(__file__), '..', 'static', 'fonts', 'NotoSansJP-Regular.ttf')
     app_font_path = os.path.abspath(app_font_path)
 
     # Windows/Linux両方で利用可能な日本語フォントを順に試す
-    font_candidates = [
+    candidates += [
         # Windows で利用可能なフォント（ローカル環境優先）
         ('C:/Windows/Fonts/msgothic.ttc', 0),  # MSゴシック（TTCの0番目）
         ('C:/Windows/Fonts/msmincho.ttc', 0),  # MS明朝（TTCの0番目）
@@ -243,59 +311,83 @@ def register_fonts():
         ('/usr/share/fonts/opentype/noto/NotoSansJP-Regular.otf', None),  # 個別言語版
         ('/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf', None),  # DejaVu (日本語は限定的)
     ]
+    return candidates
+
 
-    print(f"[Font] Starting font registration, checking {len(font_candidates)} candidates")
-
-    # 利用可能なフォントディレクトリを確認（デバッグ用）
-    font_dirs = ['/usr/share/fonts/opentype/noto', '/usr/share/fonts/truetype/noto',
-                 '/usr/share/fonts/truetype/dejavu', 'C:/Windows/Fonts']
-    for font_dir in font_dirs:
-        if os.path.exists(font_dir):
-            print(f"[Font] Available directory: {font_dir}")
-            try:
-                files = os.listdir(font_dir)
-                print(f"[Font] Files in {font_dir}: {files[:10]}")  # 最初の10ファイルを表示
-            except Exception as e:
-                print(f"[Font] Could not list {font_dir}: {e}")
-
-    for font_path, subfont_index in font_candidates:
+def _resolve_font(candidates):
+    """候補を順に試して最初に登録できたフォント名を返す"""
+    for font_path, subfont_index in candidates:
+        if not os.path.exists(font_path):
+            logger.debug('[Font] Not found: %s', font_path)
+            continue
         try:
-            print(f"[Font] Checking: {font_path}")
-            if os.path.exists(font_path):
-                print(f"[Font] Found: {font_path}")
-                if subfont_index is not None:
-                    # TTCファイルの特定のサブフォントを指定
-                    pdfmetrics.registerFont(TTFont('Japanese', font_path, subfontIndex=subfont_index))
-                    print(f"[Font] Successfully registered: {font_path} (subfontIndex={subfont_index})")
-                else:
-                    # 通常のTTFまたはTTC全体
-                    pdfmetrics.registerFont(TTFont('Japanese', font_path))
-                    print(f"[Font] Successfully registered: {font_path}")
-                return 'Japanese'
+            if subfont_index is not None:
+                # TTCファイルの特定のサブフォントを指定
+                pdfmetrics.registerFont(TTFont('Japanese', font_path, subfontIndex=subfont_index))
             else:
-                print(f"[Font] Not found: {font_path}")
-        except Exception as e:
+                # 通常のTTFまたはTTC全体
+                pdfmetrics.registerFont(TTFont('Japanese', font_path))
+            logger.info('[Font] Registered: %s (subfontIndex=%s)', font_path, subfont_index)
+            return 'Japanese'
+        except Exception:
             # このフォントが使えない場合は次を試す
-            print(f"[Font] Failed to register {font_path}: {e}")
-            import traceback
-            traceback.print_exc()
-            continue
+            logger.warning('[Font] Failed to register %s', font_path, exc_info=True)
 
     # すべてのフォントが使えない場合はHelveticaを使用（文字化けする）
-    print("[Font] WARNING: No Japanese font available, using Helvetica (text will be garbled)")
+    logger.warning('[Font] No Japanese font available, using Helvetica (text will be garbled)')
     return 'Helvetica'
 
 
+def register_fonts(font_path=None, subset_font_path=None):
+    """
+    日本語フォントの登録
+
+    フォントの解決とTTFの解析はプロセス内で1回だけ行い、以降は登録済みのフォント名を返す。
+
+    Args:
+        font_path: 優先して使うフォントファイル（LABEL_FONT_PATH）
+        subset_font_path: ラベルで使う文字だけにサブセット化したフォント（LABEL_FONT_SUBSET_PATH）
+
+    Returns:
+        ReportLabに登録したフォント名
+    """
+    global _registered_font
+    if _registered_font is not None:
+        return _registered_font
+
+    with _font_lock:
+        if _registered_font is None:
+            started = time.perf_counter()
+            _registered_font = _resolve_font(_font_candidates(font_path, subset_font_path))
+            logger.info('[Font] Font resolution took %.1f ms (font=%s)',
+                        (time.perf_counter() - started) * 1000, _registered_font)
+    return _registered_font
+
+
+def label_font():
+    """アプリの設定に従って登録済みのラベル用フォント名を返す"""
+    return register_fonts(current_app.config.get('LABEL_FONT_PATH'),
+                          current_app.config.get('LABEL_FONT_SUBSET_PATH'))
+
+
+def warm_up_fonts(app):
+    """create_app 時にフォントを解決しておき、最初のリクエストで解析しないようにする"""
+    register_fonts(app.config.get('LABEL_FONT_PATH'), app.config.get('LABEL_FONT_SUBSET_PATH'))
+
+
 @bp.route('/<int:id>')
 @login_required
 def preview(id):
     """ラベルプレビュー"""
-    recipe = Recipe.query.filter_by(id=id, store_id=current_user.id).first_or_404()
-    cost_setting = CostSetting.query.filter_by(store_id=current_user.id).first()
+    recipe = Recipe.query.options(*load_profile('label'))\
+        .filter_by(id=id, store_id=current_user.id).first_or_404()
 
     # 原価情報
-    unit_cost = recipe.calculate_unit_cost(cost_setting)
-    suggested_price = recipe.get_selling_price(cost_setting) if cost_setting else unit_cost
+    engine = store_context(current_user.id)
+    cost = engine.price_one(recipe, use_loaded=True)
+    cost_setting = engine.cost_setting
+    unit_cost = cost.unit_cost
+    suggested_price = cost.display_price
 
     return render_template('labels/preview.html',
                          recipe=recipe,
@@ -309,81 +401,366 @@ def preview(id):
 @login_required
 def generate(id):
     """ラベルPDF生成"""
-    recipe = Recipe.query.filter_by(id=id, store_id=current_user.id).first_or_404()
-    cost_setting = CostSetting.query.filter_by(store_id=current_user.id).first()
+    recipe = Recipe.query.options(*load_profile('label'))\
+        .filter_by(id=id, store_id=current_user.id).first_or_404()
+
+    # 原価・材料・アレルゲンはラベル枚数に関係なく1回だけ取得する
+    engine = store_context(current_user.id)
+    cost = engine.price_one(recipe, use_loaded=True)
+    content = build_label_content(recipe, cost)
 
     # オプションの取得
-    show_cost = request.form.get('show_cost') == 'on'
-    show_price = request.form.get('show_price') == 'on'
-    show_consume_message = request.form.get('show_consume_message') == 'on'
-    production_date = request.form.get('production_date', datetime.now().strftime('%Y-%m-%d'))
-    label_count = int(request.form.get('label_count', 1))
+    run = label_run_from_form(request.form, content)
+    geometry = label_geometry_from_form(request.form)
+
+    # ファイル名
+    filename = f"label_{recipe.product_name}_{datetime.now().strftime('%Y%m%d')}.pdf"
+
+    return respond_label_pdf([run], geometry, filename)
+
+
+@bp.route('/batch', methods=['GET', 'POST'])
+@login_required
+def batch():
+    """複数レシピのラベル一括印刷"""
+    if request.method == 'GET':
+        recipes = Recipe.query.options(*load_profile('listing'))\
+            .filter_by(store_id=current_user.id)\
+            .order_by(Recipe.category, Recipe.product_name)\
+            .all()
+        return render_template('labels/batch.html',
+                             recipes=recipes,
+                             label_presets=LABEL_PRESETS,
+                             today=datetime.now().strftime('%Y-%m-%d'))
+
+    # JSON: {"label_preset": "31531", "entries": [{"recipe_id": 1, "count": 10, "production_date": "2025-01-01"}], ...}
+    # フォーム: recipe_id[], count[], production_date[] と各オプション
+    data = request.get_json(silent=True)
+    if data is not None:
+        options = {key: value for key, value in data.items() if key != 'entries'}
+        entries = data.get('entries', [])
+    else:
+        options = request.form
+        entries = [
+            {'recipe_id': recipe_id, 'count': count, 'production_date': production_date}
+            for recipe_id, count, production_date in zip(request.form.getlist('recipe_id[]'),
+                                                         request.form.getlist('count[]'),
+                                                         request.form.getlist('production_date[]'))
+        ]
+
+    try:
+        entries = parse_batch_entries(entries, options.get('production_date'))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    if not entries:
+        return jsonify({'success': False, 'error': '印刷するラベルがありません'}), 400
+
+    # 対象レシピ・材料・アレルゲンをまとめて取得
+    recipe_ids = {entry['recipe_id'] for entry in entries}
+    recipes = Recipe.query.options(*load_profile('label'))\
+        .filter(Recipe.id.in_(recipe_ids), Recipe.store_id == current_user.id).all()
+    if len(recipes) != len(recipe_ids):
+        return jsonify({'success': False, 'error': '存在しないレシピが含まれています'}), 404
+
+    costs = store_context(current_user.id).price(recipes, use_loaded=True)
+    contents = {recipe.id: build_label_content(recipe, costs[recipe.id]) for recipe in recipes}
+
+    flags = {
+        'show_cost': _is_checked(options.get('show_cost')),
+        'show_price': _is_checked(options.get('show_price')),
+        'show_consume_message': _is_checked(options.get('show_consume_message')),
+    }
+    runs = [
+        dict(flags,
+             content=contents[entry['recipe_id']],
+             count=entry['count'],
+             production_date=entry['production_date'],
+             lot_prefix='',
+             lot_start=None)
+        for entry in entries
+    ]
+    geometry = label_geometry_from_form(options)
+    filename = f"labels_batch_{datetime.now().strftime('%Y%m%d')}.pdf"
+
+    return respond_label_pdf(runs, geometry, filename)
+
+
+def respond_label_pdf(runs, geometry, filename):
+    """
+    ラベルPDFを返す
+
+    同じ内容のPDFを生成済みであればキャッシュから返し（ETagによる304応答にも対応）、
+    枚数が多い場合はバックグラウンドのジョブとして登録する。
+    """
+    app = current_app._get_current_object()
+    font_name = label_font()
+
+    if not app.config['LABEL_CACHE_MAX_BYTES']:
+        if sum(run['count'] for run in runs) >= app.config['LABEL_ASYNC_THRESHOLD']:
+            return enqueue_label_job(runs, geometry, filename)
+
+        # 大きなPDFでもメモリを使い切らないよう、一定サイズを超えたら一時ファイルに書き出す
+        output = tempfile.SpooledTemporaryFile(max_size=BATCH_SPOOL_SIZE)
+        render_label_pdf(output, runs, geometry, font_name)
+        output.seek(0)
+        return send_file(output,
+                        mimetype='application/pdf',
+                        as_attachment=True,
+                        download_name=filename)
+
+    key = label_cache.cache_key(runs, geometry, font_name)
+
+    # 印刷は POST のため Werkzeug の条件付き応答は使えず、ETag の一致をここで確認する
+    if key in request.if_none_match:
+        response = app.response_class(status=304)
+        response.set_etag(key)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+    path = label_cache.get_cached(app, key)
+    if path is None:
+        # 枚数が多い場合はバックグラウンドで生成する
+        if sum(run['count'] for run in runs) >= app.config['LABEL_ASYNC_THRESHOLD']:
+            return enqueue_label_job(runs, geometry, filename,
+                                     cache_path=label_cache.cache_path(app, key))
+        path = label_cache.store(app, key, lambda f: render_label_pdf(f, runs, geometry, font_name))
+
+    response = send_file(path,
+                         mimetype='application/pdf',
+                         as_attachment=True,
+                         download_name=filename,
+                         etag=key,
+                         conditional=True)
+    response.cache_control.private = True
+    return response
+
+
+def enqueue_label_job(runs, geometry, filename, cache_path=None):
+    """ラベル生成ジョブを登録し、ジョブIDを返す（JSON以外の要求には進捗ページを返す）"""
+    job_id = label_jobs.submit_job(current_app._get_current_object(), current_user.id,
+                                   runs, geometry, filename, cache_path=cache_path)
+    status_url = url_for('labels.job_status', job_id=job_id)
+
+    if request.is_json or request.accept_mimetypes.best == 'application/json':
+        return jsonify({'success': True, 'job_id': job_id, 'status_url': status_url}), 202
+
+    return render_template('labels/job.html', job_id=job_id, status_url=status_url), 202
+
+
+@bp.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """ラベル生成ジョブの状態(JSON)"""
+    status = label_jobs.get_job(current_app, job_id, current_user.id)
+    if status is None:
+        abort(404)
+
+    response = {
+        'job_id': job_id,
+        'status': status['status'],
+        'total_labels': status['total_labels'],
+    }
+    if status['status'] == 'done':
+        response['download_url'] = url_for('labels.job_download', job_id=job_id)
+    elif status['status'] == 'failed':
+        response['error'] = status.get('error')
+    return jsonify(response)
+
+
+@bp.route('/jobs/<job_id>/download')
+@login_required
+def job_download(job_id):
+    """生成済みのラベルPDFをダウンロード"""
+    status = label_jobs.get_job(current_app, job_id, current_user.id)
+    if status is None or status['status'] != 'done':
+        abort(404)
+
+    return send_file(label_jobs.job_pdf_path(current_app, job_id),
+                    mimetype='application/pdf',
+                    as_attachment=True,
+                    download_name=status['filename'])
+
+
+def _is_checked(value):
+    """チェックボックス(フォーム)または真偽値(JSON)の判定"""
+    return value is True or value == 'on'
+
 
+def parse_batch_entries(entries, default_date=None):
+    """
+    一括印刷の指定を検証する
+
+    Returns:
+        list: [{'recipe_id': int, 'count': int, 'production_date': 'YYYY-MM-DD'}]（枚数0の行は除く）
+    """
+    default_date = default_date or datetime.now().strftime('%Y-%m-%d')
+    parsed = []
+    for entry in entries:
+        try:
+            recipe_id = int(entry['recipe_id'])
+            count = int(entry.get('count') or 0)
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('レシピIDと枚数は数値で指定してください')
+        if count < 0:
+            raise ValueError('枚数は0以上で指定してください')
+        if count == 0:
+            continue
+
+        production_date = entry.get('production_date') or default_date
+        try:
+            datetime.strptime(production_date, '%Y-%m-%d')
+        except (TypeError, ValueError):
+            raise ValueError(f'製造日の形式が正しくありません: {production_date}')
+
+        parsed.append({'recipe_id': recipe_id, 'count': count, 'production_date': production_date})
+    return parsed
+
+
+def build_label_content(recipe, cost):
+    """
+    ラベルに印字する内容をまとめる
+
+    描画中にデータベースへアクセスしないよう、材料名・アレルゲン・価格などを事前に取り出す。
+
+    Args:
+        recipe: Recipeオブジェクト
+        cost: StoreCostEngineで計算したRecipeCost（材料の明細を含むもの）
+    """
+    ingredient_names = []
+    allergens = []
+    for _ri, ingredient, _usage_unit_price, _line_cost in cost.lines:
+        ingredient_names.append(ingredient.name)
+        if ingredient.is_allergen and ingredient.allergen_type:
+            if ingredient.allergen_type not in allergens:
+                allergens.append(ingredient.allergen_type)
+
+    return {
+        'product_name': recipe.product_name,
+        'ingredient_names': ingredient_names,
+        'allergens': allergens,
+        'shelf_life_days': recipe.shelf_life_days,
+        'unit_cost': cost.unit_cost,
+        'selling_price': cost.selling_price if cost.cost_setting else 0,
+        'store_name': recipe.store.store_name,
+    }
+
+
+def label_run_from_form(form, content):
+    """フォームの値から印刷内容（同じラベルを続けて印刷する単位）を作る"""
+    lot_start = form.get('lot_start', type=int)
+    return {
+        'content': content,
+        'count': int(form.get('label_count', 1)),
+        'production_date': form.get('production_date', datetime.now().strftime('%Y-%m-%d')),
+        'show_cost': form.get('show_cost') == 'on',
+        'show_price': form.get('show_price') == 'on',
+        'show_consume_message': form.get('show_consume_message') == 'on',
+        'lot_prefix': form.get('lot_prefix', '') if lot_start is not None else '',
+        'lot_start': lot_start,
+    }
+
+
+def label_geometry_from_form(form):
+    """フォームの値からラベルの配置（ポイント単位）を求める"""
     # ラベルサイズ設定の取得
-    label_preset = request.form.get('label_preset', 'custom')
+    label_preset = form.get('label_preset', 'custom')
 
     # プリセットまたはカスタムサイズの取得
     if label_preset == 'custom':
         # カスタムサイズ
-        label_width = float(request.form.get('custom_width', 90)) * mm
-        label_height = float(request.form.get('custom_height', 60)) * mm
-        cols = int(request.form.get('custom_cols', 2))
-        rows = int(request.form.get('custom_rows', 4))
-        margin_left = float(request.form.get('custom_margin_left', 15)) * mm
-        margin_top = float(request.form.get('custom_margin_top', 20)) * mm
-        gap_x = float(request.form.get('custom_gap_x', 10)) * mm
-        gap_y = float(request.form.get('custom_gap_y', 8)) * mm
-    else:
-        # プリセット使用
-        preset = LABEL_PRESETS.get(label_preset, LABEL_PRESETS['custom'])
-        label_width = preset['width'] * mm
-        label_height = preset['height'] * mm
-        cols = preset['cols']
-        rows = preset['rows']
-        margin_left = preset['margin_left'] * mm
-        margin_top = preset['margin_top'] * mm
-        gap_x = preset['gap_x'] * mm
-        gap_y = preset['gap_y'] * mm
-
-    # PDF生成
-    buffer = io.BytesIO()
-    font_name = register_fonts()
+        return {
+            'width': float(form.get('custom_width', 90)) * mm,
+            'height': float(form.get('custom_height', 60)) * mm,
+            'cols': int(form.get('custom_cols', 2)),
+            'rows': int(form.get('custom_rows', 4)),
+            'margin_left': float(form.get('custom_margin_left', 15)) * mm,
+            'margin_top': float(form.get('custom_margin_top', 20)) * mm,
+            'gap_x': float(form.get('custom_gap_x', 10)) * mm,
+            'gap_y': float(form.get('custom_gap_y', 8)) * mm,
+        }
+
+    # プリセット使用
+    preset = LABEL_PRESETS.get(label_preset, LABEL_PRESETS['custom'])
+    return {
+        'width': preset['width'] * mm,
+        'height': preset['height'] * mm,
+        'cols': preset['cols'],
+        'rows': preset['rows'],
+        'margin_left': preset['margin_left'] * mm,
+        'margin_top': preset['margin_top'] * mm,
+        'gap_x': preset['gap_x'] * mm,
+        'gap_y': preset['gap_y'] * mm,
+    }
+
+
+def render_label_pdf(buffer, runs, geometry, font_name):
+    """
+    ラベルをA4用紙に連続して配置したPDFを生成
+
+    同じ内容のラベルは1回だけPDFのフォーム(XObject)として描画し、各位置ではそれを参照するだけにする。
+    ロット番号のようにラベルごとに変わる値はフォームの上に重ねて描画する。
+
+    Args:
+        buffer: 書き込み先のバイナリストリーム
+        runs: 印刷内容のリスト（label_run_from_form の戻り値と同じ形式）
+        geometry: ラベルの配置（label_geometry_from_form の戻り値と同じ形式）
+        font_name: 登録済みのフォント名
+    """
+    width = geometry['width']
+    height = geometry['height']
+    cols = geometry['cols']
+    labels_per_page = cols * geometry['rows']
 
     # A4サイズ (210mm x 297mm)
     page_width, page_height = A4
 
     c = canvas.Canvas(buffer, pagesize=A4)
 
+    # 印刷内容ごとにラベルを1回だけ描画する
+    # （はみ出した文字が切れないよう、フォームの範囲はラベルより広く取る）
+    for index, run in enumerate(runs):
+        c.beginForm(f'label{index}', lowerx=-width, lowery=-height, upperx=2 * width, uppery=2 * height)
+        draw_label(c, 0, 0, width, height, run['content'],
+                   run['show_cost'], run['show_price'], run['show_consume_message'],
+                   run['production_date'], font_name)
+        c.endForm()
+
     labels_drawn = 0
-    for i in range(label_count):
-        if labels_drawn > 0 and labels_drawn % (cols * rows) == 0:
-            c.showPage()
+    for index, run in enumerate(runs):
+        for i in range(run['count']):
+            if labels_drawn > 0 and labels_drawn % labels_per_page == 0:
+                c.showPage()
+
+            col = (labels_drawn % labels_per_page) % cols
+            row = (labels_drawn % labels_per_page) // cols
 
-        col = (labels_drawn % (cols * rows)) % cols
-        row = (labels_drawn % (cols * rows)) // cols
+            x = geometry['margin_left'] + col * (width + geometry['gap_x'])
+            y = page_height - geometry['margin_top'] - (row + 1) * height - row * geometry['gap_y']
 
-        x = margin_left + col * (label_width + gap_x)
-        y = page_height - margin_top - (row + 1) * label_height - row * gap_y
+            # ラベル描画（フォームを配置）
+            c.saveState()
+            c.translate(x, y)
+            c.doForm(f'label{index}')
+            c.restoreState()
 
-        # ラベル描画
-        draw_label(c, x, y, label_width, label_height, recipe, cost_setting,
-                  show_cost, show_price, show_consume_message, production_date, font_name)
+            # ラベルごとに変わる値
+            if run['lot_start'] is not None:
+                draw_lot_number(c, x, y, width, f"{run['lot_prefix']}{run['lot_start'] + i}", font_name)
 
-        labels_drawn += 1
+            labels_drawn += 1
 
     c.save()
-    buffer.seek(0)
 
-    # ファイル名
-    filename = f"label_{recipe.product_name}_{datetime.now().strftime('%Y%m%d')}.pdf"
 
-    return send_file(buffer,
-                    mimetype='application/pdf',
-                    as_attachment=True,
-                    download_name=filename)
+def draw_lot_number(c, x, y, width, lot_number, font_name):
+    """ロット番号をラベル左下に重ねて描画"""
+    c.setFont(font_name, 5)
+    c.drawString(x + 3 * mm, y + 1.2 * mm, f"Lot: {lot_number}")
 
 
-def draw_label(c, x, y, width, height, recipe, cost_setting,
+def draw_label(c, x, y, width, height, content,
               show_cost, show_price, show_consume_message, production_date, font_name):
     """ラベルを描画"""
     padding = 3 * mm
@@ -395,7 +772,7 @@ def draw_label(c, x, y, width, height, recipe, cost_setting,
 
     # 商品名を折り返し（最大3行まで）
     max_width = width - 2 * padding
-    product_lines = split_text_by_width(c, recipe.product_name, font_name, product_name_font_size, max_width)
+    product_lines = split_text_by_width(c, content['product_name'], font_name, product_name_font_size, max_width)
 
     for line in product_lines[:3]:  # 最大3行
         c.drawString(x + padding, current_y, line)
@@ -407,7 +784,7 @@ def draw_label(c, x, y, width, height, recipe, cost_setting,
     current_y -= 4 * mm
 
     # 材料一覧
-    ingredients_text = "、".join([ri.ingredient.name for ri in recipe.recipe_ingredients])
+    ingredients_text = "、".join(content['ingredient_names'])
     if not ingredients_text:
         ingredients_text = "材料未設定"
 
@@ -442,7 +819,7 @@ def draw_label(c, x, y, width, height, recipe, cost_setting,
     current_y -= 2 * mm
 
     # アレルゲン情報
-    allergens = recipe.get_allergens()
+    allergens = content['allergens']
     if allergens:
         c.setFont(font_name, 7)
         allergen_text = f"アレルゲン: {', '.join(allergens)}"
@@ -455,8 +832,8 @@ def draw_label(c, x, y, width, height, recipe, cost_setting,
     c.drawString(x + padding, current_y, f"製造日: {prod_date.strftime('%Y年%m月%d日')}")
     current_y -= 3 * mm
 
-    if recipe.shelf_life_days:
-        exp_date = prod_date + timedelta(days=recipe.shelf_life_days)
+    if content['shelf_life_days']:
+        exp_date = prod_date + timedelta(days=content['shelf_life_days'])
         c.drawString(x + padding, current_y, f"賞味期限: {exp_date.strftime('%Y年%m月%d日')}")
         current_y -= 3 * mm
 
@@ -480,13 +857,13 @@ def draw_label(c, x, y, width, height, recipe, cost_setting,
         current_y -= 3 * mm
 
     if show_cost:
-        unit_cost = recipe.calculate_unit_cost(cost_setting)
-        c.drawString(x + padding, current_y, f"原価: {unit_cost:.0f}円")
+        unit_cost = content['unit_cost']
+        c.drawString(x + padding, current_y, f"原価: {format_yen(unit_cost)}円")
         current_y -= 3 * mm
 
     # 店舗名の準備（販売価格と同じ行に表示するため先に準備）
     c.setFont(font_name, 6)
-    store_name = recipe.store.store_name
+    store_name = content['store_name']
     store_text_width = c.stringWidth(store_name, font_name, 6)
 
     # ラベルの幅を超えないように調整
@@ -502,8 +879,8 @@ def draw_label(c, x, y, width, height, recipe, cost_setting,
     if show_price:
         # 販売価格を表示
         c.setFont(font_name, 7)
-        selling_price = recipe.get_selling_price(cost_setting) if cost_setting else 0
-        c.drawString(x + padding, current_y, f"販売価格: {selling_price:.0f}円")
+        selling_price = content['selling_price']
+        c.drawString(x + padding, current_y, f"販売価格: {format_yen(selling_price)}円")
 
         # 店舗名を同じ行の右端に表示
         c.setFont(font_name, 6)
@@ -1,6 +1,8 @@
 from flask import Blueprint, render_template
 from flask_login import login_required, current_user
 from app.models import Recipe, Ingredient, CostSetting
+from app.costing import store_context
+from app.loading import load_profile
 
 bp = Blueprint('main', __name__)
 
@@ -14,13 +16,14 @@ def index():
     total_ingredients = Ingredient.query.filter_by(store_id=current_user.id).count()
 
     # 最近のレシピ
-    recent_recipes = Recipe.query.filter_by(store_id=current_user.id)\
+    recent_recipes = Recipe.query.options(*load_profile('listing'))\
+        .filter_by(store_id=current_user.id)\
         .order_by(Recipe.updated_at.desc())\
         .limit(5)\
         .all()
 
     # 原価計算設定
-    cost_setting = CostSetting.query.filter_by(store_id=current_user.id).first()
+    cost_setting = store_context(current_user.id).cost_setting
 
     return render_template('main/index.html',
                          total_recipes=total_recipes,
@@ -36,6 +39,7 @@ def settings():
     from app.forms import CostSettingForm
     from app.models import db
 
+    # 変更するためキャッシュの複製ではなくセッション上のオブジェクトを読み込む
     cost_setting = CostSetting.query.filter_by(store_id=current_user.id).first()
 
     if not cost_setting:
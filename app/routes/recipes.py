@@ -1,10 +1,34 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+import sys
+from datetime import datetime
+import click
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, Response, stream_with_context, current_app
 from flask_login import login_required, current_user
-from app.models import db, Recipe, Ingredient, RecipeIngredient, CostSetting
+from app.models import db, Recipe, Ingredient, Store
 from app.forms import RecipeForm
+from app.costing import store_context, refresh_cost_snapshots
+from app.recipe_export import EXPORT_FORMATS, iter_export
+from app.pagination import keyset_paginate
+from app.search import apply_search
+from app.recipe_lines import parse_submitted_lines, save_recipe_lines
+from app.loading import load_profile
+from app.simulation import parse_changes, simulate_price_shock
 
 bp = Blueprint('recipes', __name__, url_prefix='/recipes')
 
+# 一覧の並び順（原価スナップショット列でSQL上で並べ替える）
+# スナップショットが未計算(NULL)のレシピは、データベースによらず最後に並べる（NULLの既定の位置はSQLiteとPostgreSQLで逆）
+SORT_ORDERS = {
+    'updated': (Recipe.updated_at.desc(), Recipe.id.desc()),
+    'unit_cost_asc': (Recipe.cost_unit.asc().nulls_last(), Recipe.id.asc()),
+    'unit_cost_desc': (Recipe.cost_unit.desc().nulls_last(), Recipe.id.desc()),
+    'price_desc': (Recipe.cost_suggested_price.desc().nulls_last(), Recipe.id.desc()),
+}
+
+# キーセット方式のページネーションに対応する並び順（値がNULLにならない列のみ）
+KEYSET_SORTS = {
+    'updated': [(Recipe.updated_at, True), (Recipe.id, True)],
+}
+
 
 @bp.route('/')
 @login_required
@@ -13,26 +37,102 @@ def index():
     page = request.args.get('page', 1, type=int)
     search = request.args.get('search', '', type=str)
     category = request.args.get('category', '', type=str)
+    sort = request.args.get('sort', 'updated', type=str)
+    max_unit_cost = request.args.get('max_unit_cost', type=float)
+    cursor = request.args.get('cursor', type=str)
+
+    if sort not in SORT_ORDERS:
+        sort = 'updated'
 
-    query = Recipe.query.filter_by(store_id=current_user.id)
+    query = Recipe.query.options(*load_profile('listing')).filter_by(store_id=current_user.id)
 
     if search:
-        query = query.filter(Recipe.product_name.like(f'%{search}%'))
+        query = apply_search(query, Recipe, search)
 
     if category:
         query = query.filter_by(category=category)
 
-    recipes = query.order_by(Recipe.updated_at.desc())\
-        .paginate(page=page, per_page=20, error_out=False)
-
-    # 原価計算設定の取得
-    cost_setting = CostSetting.query.filter_by(store_id=current_user.id).first()
+    if max_unit_cost is not None:
+        query = query.filter(Recipe.cost_unit <= max_unit_cost)
+
+    # cursor 指定時（または設定でキーセット方式を既定にした場合）は深いページでも1ページ分だけ読む
+    keyset = sort in KEYSET_SORTS and (
+        cursor is not None or current_app.config['LISTING_PAGINATION'] == 'keyset')
+    if keyset:
+        try:
+            recipes = keyset_paginate(query, KEYSET_SORTS[sort], cursor or None, per_page=20)
+        except ValueError:
+            recipes = keyset_paginate(query, KEYSET_SORTS[sort], None, per_page=20)
+    else:
+        recipes = query.order_by(*SORT_ORDERS[sort])\
+            .paginate(page=page, per_page=20, error_out=False)
+
+    # ページ内のレシピの原価は保存済みのスナップショットから取得
+    engine = store_context(current_user.id)
+    costs = engine.price_snapshots(recipes.items)
 
     return render_template('recipes/index.html',
                          recipes=recipes,
-                         cost_setting=cost_setting,
+                         costs=costs,
+                         cost_setting=engine.cost_setting,
                          search=search,
-                         category=category)
+                         category=category,
+                         sort=sort,
+                         max_unit_cost=max_unit_cost,
+                         keyset=keyset)
+
+
+@bp.route('/export')
+@login_required
+def export():
+    """レシピ原価の一括エクスポート(CSV / JSON Lines)"""
+    export_format = request.args.get('format', 'csv', type=str)
+    if export_format not in EXPORT_FORMATS:
+        export_format = 'csv'
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"recipes_{datetime.now().strftime('%Y%m%d')}.{extension}"
+
+    # レシピ数に関係なくメモリ使用量が一定になるよう、生成しながら送信する
+    body = stream_with_context(iter_export(current_user.id, export_format))
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+@bp.cli.command('export')
+@click.argument('login_id')
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv',
+              help='出力形式')
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='出力先ファイル（省略時は標準出力）')
+def export_command(login_id, export_format, output):
+    """店舗の全レシピの原価をCSV / JSON Linesで出力する"""
+    store = Store.query.filter_by(login_id=login_id).first()
+    if not store:
+        raise click.ClickException(f'店舗が見つかりません: {login_id}')
+
+    stream = open(output, 'w', encoding='utf-8', newline='') if output else sys.stdout
+    try:
+        for chunk in iter_export(store.id, export_format):
+            stream.write(chunk)
+    finally:
+        if output:
+            stream.close()
+
+
+@bp.cli.command('refresh-costs')
+@click.option('--login-id', help='対象の店舗（省略時は全店舗）')
+def refresh_costs_command(login_id):
+    """原価スナップショットを再計算する（マイグレーション後・一括登録後に実行）"""
+    query = db.session.query(Store.id)
+    if login_id:
+        query = query.filter(Store.login_id == login_id)
+    store_ids = [row[0] for row in query.all()]
+    if login_id and not store_ids:
+        raise click.ClickException(f'店舗が見つかりません: {login_id}')
+
+    results = refresh_cost_snapshots(store_ids=store_ids)
+    db.session.commit()
+    click.echo(f'{len(store_ids)}店舗・{len(results)}件のレシピの原価スナップショットを保存しました')
 
 
 @bp.route('/create', methods=['GET', 'POST'])
@@ -87,31 +187,24 @@ def edit(id):
 @login_required
 def detail(id):
     """レシピ詳細"""
-    from app.models import CustomCostItem
-
-    recipe = Recipe.query.filter_by(id=id, store_id=current_user.id).first_or_404()
-    cost_setting = CostSetting.query.filter_by(store_id=current_user.id).first()
+    recipe = Recipe.query.options(*load_profile('detail'))\
+        .filter_by(id=id, store_id=current_user.id).first_or_404()
 
-    # 原価計算
-    material_cost = recipe.calculate_material_cost()
-    total_cost = recipe.calculate_total_cost(cost_setting)
-    unit_cost = recipe.calculate_unit_cost(cost_setting)
-    suggested_price = recipe.get_selling_price(cost_setting) if cost_setting else unit_cost
-
-    # カスタム原価項目の取得
-    custom_cost_items = CustomCostItem.query.filter_by(
-        store_id=current_user.id,
-        is_active=True
-    ).order_by(CustomCostItem.display_order).all()
+    # 原価計算（材料行は読み込み済みのものを使う）
+    engine = store_context(current_user.id)
+    cost = engine.price_one(recipe, use_loaded=True)
+    cost_setting = engine.cost_setting
+    suggested_price = cost.display_price
 
     return render_template('recipes/detail.html',
                          recipe=recipe,
+                         cost=cost,
                          cost_setting=cost_setting,
-                         material_cost=material_cost,
-                         total_cost=total_cost,
-                         unit_cost=unit_cost,
+                         material_cost=cost.material_cost,
+                         total_cost=cost.total_cost,
+                         unit_cost=cost.unit_cost,
                          suggested_price=suggested_price,
-                         custom_cost_items=custom_cost_items)
+                         custom_costs=cost.custom_costs)
 
 
 @bp.route('/<int:id>/delete', methods=['POST'])
@@ -132,44 +225,71 @@ def delete(id):
 @login_required
 def edit_ingredients(id):
     """レシピ材料編集"""
-    recipe = Recipe.query.filter_by(id=id, store_id=current_user.id).first_or_404()
-    ingredients = Ingredient.query.filter_by(store_id=current_user.id)\
-        .order_by(Ingredient.name).all()
+    recipe = Recipe.query.options(*load_profile('detail'))\
+        .filter_by(id=id, store_id=current_user.id).first_or_404()
 
     if request.method == 'POST':
-        # 既存の材料関連を削除
-        RecipeIngredient.query.filter_by(recipe_id=recipe.id).delete()
-
-        # 新しい材料を追加
-        ingredient_ids = request.form.getlist('ingredient_id[]')
-        quantities = request.form.getlist('quantity[]')
-
-        for ingredient_id, quantity in zip(ingredient_ids, quantities):
-            if ingredient_id and quantity:
-                try:
-                    recipe_ingredient = RecipeIngredient(
-                        recipe_id=recipe.id,
-                        ingredient_id=int(ingredient_id),
-                        quantity=float(quantity)
-                    )
-                    db.session.add(recipe_ingredient)
-                except (ValueError, TypeError):
-                    continue
+        lines = parse_submitted_lines(request.form.getlist('ingredient_id[]'),
+                                      request.form.getlist('quantity[]'))
+        wants_json = request.accept_mimetypes.best == 'application/json'
+
+        try:
+            changes = save_recipe_lines(recipe, lines)
+        except ValueError as e:
+            db.session.rollback()
+            if wants_json:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            flash(str(e), 'danger')
+            return redirect(url_for('recipes.edit_ingredients', id=recipe.id))
 
         db.session.commit()
-        flash('材料を更新しました', 'success')
+
+        if wants_json:
+            return jsonify(dict(changes.to_dict(), success=True))
+
+        if changes.changed:
+            flash(f'材料を更新しました（追加 {len(changes.inserted)}件・変更 {len(changes.updated)}件・'
+                  f'削除 {len(changes.deleted)}件）', 'success')
+        else:
+            flash('材料に変更はありませんでした', 'info')
         return redirect(url_for('recipes.detail', id=recipe.id))
 
+    # 材料の候補は画面から ingredients.lookup で必要な分だけ取得する
+    has_ingredients = db.session.query(
+        Ingredient.query.filter_by(store_id=current_user.id).exists()
+    ).scalar()
+
     return render_template('recipes/edit_ingredients.html',
                          recipe=recipe,
-                         ingredients=ingredients)
+                         has_ingredients=has_ingredients)
+
+
+@bp.route('/simulate', methods=['POST'])
+@login_required
+def simulate():
+    """
+    価格ショックの試算API(JSON、データベースは変更しない)
+
+    {"ingredients": {"材料ID": 価格の倍率}, "custom_costs": {"カスタム原価項目ID": 変更後の金額}}
+    全レシピの原価・推奨価格・利益率の変化を、利益率の低下が大きい順に返す
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        result = simulate_price_shock(store_context(current_user.id),
+                                      parse_changes(payload.get('ingredients'), '材料の倍率'),
+                                      parse_changes(payload.get('custom_costs'), 'カスタム原価項目の金額'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(result)
 
 
 @bp.route('/<int:id>/ingredients/api', methods=['GET'])
 @login_required
 def get_ingredients_api(id):
     """レシピ材料取得API(JSON)"""
-    recipe = Recipe.query.filter_by(id=id, store_id=current_user.id).first_or_404()
+    recipe = Recipe.query.options(*load_profile('detail'))\
+        .filter_by(id=id, store_id=current_user.id).first_or_404()
 
     ingredients_data = []
     for ri in recipe.recipe_ingredients:
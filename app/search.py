@@ -0,0 +1,166 @@
+"""
+商品名・材料名・店舗名の部分一致検索
+
+名前を正規化した検索用の列(search_name)を書き込み時に保存し、データベースに応じた索引で検索します。
+  - PostgreSQL: pg_trgm の GIN インデックス（LIKE '%語%' をそのまま索引で検索）
+  - SQLite: FTS5 の trigram トークナイザを使った外部コンテンツ表（トリガーで元の表と同期）
+どちらも使えない環境では従来どおり LIKE で検索します。
+
+正規化では全角/半角（英数字・カタカナ）をそろえ、カタカナをひらがなに、英字を小文字にし、空白を除きます。
+そのため「ﾊﾞﾀｰ」「バター」「ばたー」はいずれも同じ材料に一致します。
+"""
+import logging
+import unicodedata
+from flask import current_app
+from sqlalchemy import event, inspect, select, table, column, text
+from app.models import db, Store, Ingredient, Recipe
+
+logger = logging.getLogger(__name__)
+
+# 検索対象（表名, 元の列名）
+SEARCH_TABLES = {
+    'stores': 'store_name',
+    'ingredients': 'name',
+    'recipes': 'product_name',
+}
+
+# trigram索引は3文字以上の語でのみ使える
+TRIGRAM_MIN_LENGTH = 3
+
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(0x30A1, 0x30F7)}
+
+
+def search_key(value):
+    """検索用に文字列を正規化する"""
+    if not value:
+        return ''
+    normalized = unicodedata.normalize('NFKC', value).translate(_KATAKANA_TO_HIRAGANA).casefold()
+    return ''.join(normalized.split())
+
+
+def _set_search_name(source_attribute):
+    def listener(_mapper, _connection, target):
+        target.search_name = search_key(getattr(target, source_attribute))
+    return listener
+
+
+for _model, _attribute in ((Store, 'store_name'), (Ingredient, 'name'), (Recipe, 'product_name')):
+    event.listen(_model, 'before_insert', _set_search_name(_attribute))
+    event.listen(_model, 'before_update', _set_search_name(_attribute))
+
+
+def _sqlite_statements(table_name):
+    fts = f'{table_name}_fts'
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"search_name, content='{table_name}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} BEGIN "
+        f"INSERT INTO {fts}(rowid, search_name) VALUES (new.id, new.search_name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, search_name) VALUES ('delete', old.id, old.search_name); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF search_name ON {table_name} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, search_name) VALUES ('delete', old.id, old.search_name); "
+        f"INSERT INTO {fts}(rowid, search_name) VALUES (new.id, new.search_name); END",
+    ]
+
+
+def _postgresql_statements(table_name):
+    return [
+        f"CREATE INDEX IF NOT EXISTS ix_{table_name}_search_name_trgm "
+        f"ON {table_name} USING gin (search_name gin_trgm_ops)",
+    ]
+
+
+def install_search_index(engine, rebuild=False):
+    """
+    検索用の索引を作成する（作成済みの場合は何もしない）
+
+    Args:
+        engine: SQLAlchemyエンジン
+        rebuild: Trueの場合はSQLiteのFTS索引を元の表から作り直す（既存データの取り込み時）
+
+    Returns:
+        str: 使用する検索方式 'pg_trgm' / 'fts5' / 'like'
+    """
+    dialect = engine.dialect.name
+    try:
+        # search_name列の追加前（マイグレーション前）はトリガーを作らない
+        inspector = inspect(engine)
+        for table_name in SEARCH_TABLES:
+            if 'search_name' not in [col['name'] for col in inspector.get_columns(table_name)]:
+                logger.warning('%s.search_name is missing; run migrate_add_search_index.py', table_name)
+                return 'like'
+
+        with engine.begin() as connection:
+            if dialect == 'postgresql':
+                connection.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+                for table_name in SEARCH_TABLES:
+                    for statement in _postgresql_statements(table_name):
+                        connection.execute(text(statement))
+                return 'pg_trgm'
+
+            if dialect == 'sqlite':
+                for table_name in SEARCH_TABLES:
+                    for statement in _sqlite_statements(table_name):
+                        connection.execute(text(statement))
+                    if rebuild:
+                        connection.execute(text(
+                            f"INSERT INTO {table_name}_fts({table_name}_fts) VALUES ('rebuild')"))
+                return 'fts5'
+    except Exception as e:
+        # 拡張機能の権限がない・SQLiteが古い（trigram非対応）など
+        logger.warning('Search index is not available, falling back to LIKE: %s', e)
+    return 'like'
+
+
+def init_search(app):
+    """アプリケーション起動時に検索用の索引を用意し、使用する検索方式を記録する"""
+    with app.app_context():
+        app.extensions['search_backend'] = install_search_index(db.engine)
+
+
+def escape_like(value):
+    """LIKEの特殊文字をエスケープする（エスケープ文字は \\）"""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def apply_search(query, model, term):
+    """
+    クエリに名前の部分一致検索の条件を追加する
+
+    Args:
+        query: 絞り込むクエリ（Store / Ingredient / Recipe）
+        model: 検索対象のモデルクラス
+        term: 利用者が入力した検索語
+    """
+    key = search_key(term)
+    if not key:
+        return query
+
+    backend = current_app.extensions.get('search_backend', 'like')
+    if backend == 'fts5' and len(key) >= TRIGRAM_MIN_LENGTH:
+        fts = table(f'{model.__tablename__}_fts', column('rowid'))
+        phrase = '"' + key.replace('"', '""') + '"'
+        matches = select(fts.c.rowid).where(text(f'{fts.name} MATCH :search_phrase')
+                                             .bindparams(search_phrase=phrase))
+        return query.filter(model.id.in_(matches))
+
+    # pg_trgm は LIKE をそのまま索引で検索できる。SQLiteで2文字以下の語は trigram 索引を使えないため LIKE で検索する
+    return query.filter(model.search_name.like(f'%{escape_like(key)}%', escape='\\'))
+
+
+def apply_prefix_search(query, model, term):
+    """
+    クエリに名前の前方一致検索の条件を追加する（入力候補の表示用）
+
+    範囲条件で (store_id, search_name) の索引を使い、LIKEで前方一致を確定する。
+    範囲の上限は文字コード順を前提とするため、Ingredient.search_name はPostgreSQLでも
+    COLLATE "C" で定義している（言語別の照合順序では前方一致する値が範囲外になることがある）。
+    """
+    key = search_key(term)
+    if not key:
+        return query
+
+    return query.filter(model.search_name >= key,
+                        model.search_name < key + '\U0010ffff',
+                        model.search_name.like(f'{escape_like(key)}%', escape='\\'))
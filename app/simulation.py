@@ -0,0 +1,291 @@
+"""
+価格ショックの試算（店舗の全レシピをまとめて再計算、データベースは変更しない）
+
+材料の価格の倍率（例: バター 1.2倍）やカスタム原価項目の金額の変更を受け取り、
+全レシピの1個あたり原価・推奨価格・利益率の低下を返します。
+
+レシピ×材料の使用量を疎行列（座標形式の配列 rows, cols, quantities）として読み込み、
+材料費は「使用量 × 使用単位あたり単価」をレシピごとに np.bincount で合計して求めます
+（疎行列とベクトルの積）。カスタム原価項目は計算方法ごとの基準（1・製造個数・製造時間）に
+金額を掛けて加算します。数千件のレシピでも計算自体は数ミリ秒です。
+
+店舗ごとの配列はワーカープロセス内にキャッシュし（件数上限つきLRU）、レシピの件数・
+原価スナップショットの版番号(cost_version)の合計・更新日時の最大値が変わったときだけ読み込み直します。
+材料・レシピ材料・カスタム原価項目・利益率を変更すると原価スナップショットが再計算されて
+版番号が上がるため、確認は1回の集計クエリで済みます。
+
+計算は浮動小数点のため、app.money の整数計算（原価スナップショット）とは
+サブ円単位の端数の範囲で異なることがあります。
+"""
+import math
+import threading
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import func, select
+from app.models import db, Ingredient, Recipe, RecipeIngredient
+from app import money
+
+# 利益率の低下をこの値(%ポイント)より大きいレシピを「影響あり」として数える
+EROSION_TOLERANCE = 0.005
+
+# キャッシュする店舗数（ワーカーごと）
+MATRIX_CACHE_SIZE = 16
+
+_cache = OrderedDict()  # {store_id: (キャッシュのキー, CostMatrix)}
+_cache_lock = threading.Lock()
+
+
+class CostMatrix:
+    """店舗の全レシピの原価を計算するための配列"""
+
+    def __init__(self, recipes, lines, ingredients, cost_setting, custom_items):
+        """
+        Args:
+            recipes: [(id, 商品名, 製造個数, 製造時間, 個別利益率, 販売価格)]（id順）
+            lines: [(recipe_id, ingredient_id, 使用量)]
+            ingredients: [(id, 使用単位あたり単価)]（id順）
+            cost_setting: 原価計算設定（Noneの場合はカスタム原価項目を加算しない）
+            custom_items: 有効なカスタム原価項目
+        """
+        self.recipe_ids = np.array([row[0] for row in recipes], dtype=np.int64)
+        self.product_names = [row[1] for row in recipes]
+        self.production_quantity = np.array([row[2] or 0 for row in recipes], dtype=np.float64)
+        production_time = np.array([row[3] or 0 for row in recipes], dtype=np.float64)
+
+        default_margin = float(cost_setting.profit_margin) if cost_setting else 0.0
+        self.profit_margin = np.array(
+            [float(row[4]) if row[4] is not None else default_margin for row in recipes], dtype=np.float64)
+        self.selling_price = np.array(
+            [float(row[5]) if row[5] is not None else np.nan for row in recipes], dtype=np.float64)
+
+        self.ingredient_ids = np.array([row[0] for row in ingredients], dtype=np.int64)
+        self.unit_prices = np.array([row[1] for row in ingredients], dtype=np.float64)
+
+        # 材料行 → (レシピの位置, 材料の位置, 使用量)
+        self.rows = np.searchsorted(self.recipe_ids, np.array([row[0] for row in lines], dtype=np.int64))
+        self.cols = np.searchsorted(self.ingredient_ids, np.array([row[1] for row in lines], dtype=np.int64))
+        self.quantities = np.array([float(row[2]) for row in lines], dtype=np.float64)
+
+        # カスタム原価項目: 金額 × 基準（固定費は1、個数単位は製造個数、時間単位は製造時間）
+        self.custom_item_ids = [item.id for item in custom_items] if cost_setting else []
+        self.custom_amounts = np.array([float(item.amount) for item in custom_items] if cost_setting else [],
+                                       dtype=np.float64)
+        bases = {
+            'fixed': np.ones(len(recipes)),
+            'per_unit': self.production_quantity,
+            'per_time': np.where(production_time > 0, production_time, 0.0),
+        }
+        self.custom_bases = np.array(
+            [bases.get(item.calculation_type, np.zeros(len(recipes))) for item in custom_items] if cost_setting
+            else [], dtype=np.float64).reshape(len(self.custom_item_ids), len(recipes))
+
+    @classmethod
+    def for_store(cls, store_id, cost_setting, custom_items):
+        """店舗のレシピ・材料行・材料を3回のクエリで読み込む（列の値だけを取得）"""
+        recipes = db.session.query(
+            Recipe.id, Recipe.product_name, Recipe.production_quantity, Recipe.production_time,
+            Recipe.custom_profit_margin, Recipe.selling_price
+        ).filter(Recipe.store_id == store_id).order_by(Recipe.id).all()
+
+        lines = db.session.query(RecipeIngredient.recipe_id, RecipeIngredient.ingredient_id,
+                                 RecipeIngredient.quantity)\
+            .join(Recipe, Recipe.id == RecipeIngredient.recipe_id)\
+            .filter(Recipe.store_id == store_id)\
+            .all()
+
+        used = select(RecipeIngredient.ingredient_id)\
+            .join(Recipe, Recipe.id == RecipeIngredient.recipe_id)\
+            .where(Recipe.store_id == store_id)
+        ingredient_rows = db.session.query(
+            Ingredient.id, Ingredient.usage_price, Ingredient.purchase_price, Ingredient.purchase_quantity,
+            Ingredient.purchase_unit, Ingredient.usage_unit, Ingredient.density, Ingredient.unit_price
+        ).filter(Ingredient.id.in_(used)).order_by(Ingredient.id).all()
+
+        # 保存済みの単価がない材料だけ購入情報から求める（Ingredient.get_usage_price と同じ）
+        ingredients = [
+            (row.id, money.price_to_float(row.usage_price if row.usage_price is not None else money.usage_price(
+                row.purchase_price, row.purchase_quantity, row.purchase_unit, row.usage_unit,
+                row.density, row.unit_price)))
+            for row in ingredient_rows
+        ]
+        return cls(recipes, lines, ingredients, cost_setting, custom_items)
+
+    def evaluate(self, unit_prices, custom_amounts):
+        """
+        全レシピの原価を計算する
+
+        Returns:
+            tuple: (1個あたり原価, 推奨価格) のndarray
+        """
+        material = np.bincount(self.rows, weights=self.quantities * unit_prices[self.cols],
+                               minlength=len(self.recipe_ids))
+        total = material + custom_amounts @ self.custom_bases
+
+        quantity = self.production_quantity
+        unit = np.divide(total, quantity, out=np.zeros_like(total), where=quantity > 0)
+        suggested = np.where(self.profit_margin > 0, unit * (1 + self.profit_margin / 100), unit)
+        return unit, suggested
+
+    def ingredient_prices(self, multipliers):
+        """材料ごとの倍率を掛けた使用単位あたり単価"""
+        prices = self.unit_prices.copy()
+        for ingredient_id, multiplier in multipliers.items():
+            position = np.searchsorted(self.ingredient_ids, ingredient_id)
+            if position < len(self.ingredient_ids) and self.ingredient_ids[position] == ingredient_id:
+                prices[position] *= multiplier
+        return prices
+
+    def custom_cost_amounts(self, amounts):
+        """金額を差し替えたカスタム原価項目の金額"""
+        values = self.custom_amounts.copy()
+        for position, item_id in enumerate(self.custom_item_ids):
+            if item_id in amounts:
+                values[position] = amounts[item_id]
+        return values
+
+
+def _cache_key(store_id, cost_setting, custom_items):
+    count, versions, last_updated = db.session.query(
+        func.count(Recipe.id), func.sum(Recipe.cost_version), func.max(Recipe.updated_at)
+    ).filter(Recipe.store_id == store_id).one()
+    return (count, versions, last_updated,
+            cost_setting.profit_margin if cost_setting else None,
+            tuple((item.id, item.calculation_type, item.amount) for item in custom_items))
+
+
+def load_cost_matrix(store_id, cost_setting, custom_items):
+    """店舗の CostMatrix を取得（変更がなければワーカーごとのキャッシュから）"""
+    key = _cache_key(store_id, cost_setting, custom_items)
+    with _cache_lock:
+        cached = _cache.get(store_id)
+        if cached is not None and cached[0] == key:
+            _cache.move_to_end(store_id)
+            return cached[1]
+
+    matrix = CostMatrix.for_store(store_id, cost_setting, custom_items)
+    with _cache_lock:
+        _cache[store_id] = (key, matrix)
+        _cache.move_to_end(store_id)
+        while len(_cache) > MATRIX_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return matrix
+
+
+def clear_cache():
+    """キャッシュした配列をすべて破棄する"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def _margin(selling, unit):
+    """販売価格に対する利益率(%)（販売価格が0以下の場合はNaN）"""
+    return np.divide((selling - unit) * 100, selling, out=np.full_like(unit, np.nan), where=selling > 0)
+
+
+def _number(value):
+    value = float(value)
+    return round(value, 2) if math.isfinite(value) else None
+
+
+def _numbers(values):
+    """ndarrayを小数2桁のリストにする（NaNはNone）"""
+    return [None if math.isnan(value) else value for value in np.round(values, 2).tolist()]
+
+
+def parse_changes(values, label):
+    """
+    {ID: 0以上の数値} の入力を検証する（JSONのキーは文字列のため整数に変換）
+
+    Raises:
+        ValueError: IDや値が不正な場合
+    """
+    if values is None:
+        return {}
+    if not isinstance(values, dict):
+        raise ValueError(f'{label}は {{ID: 値}} の形式で指定してください')
+
+    changes = {}
+    for key, value in values.items():
+        if isinstance(value, bool):
+            raise ValueError(f'{label}の値が不正です: {key}')
+        try:
+            number = float(value)
+            changes[int(key)] = number
+        except (TypeError, ValueError):
+            raise ValueError(f'{label}のIDまたは値が不正です: {key}')
+        if not math.isfinite(number) or number < 0:
+            raise ValueError(f'{label}の値が不正です: {key}')
+    return changes
+
+
+def simulate_price_shock(engine, ingredient_multipliers=None, custom_cost_amounts=None):
+    """
+    材料価格の倍率・カスタム原価項目の金額の変更を全レシピに適用した場合の原価を試算
+
+    Args:
+        engine: 店舗の原価計算エンジン（store_context / StoreCostEngine.for_store）
+        ingredient_multipliers: {ingredient_id: 倍率} 例: {12: 1.2} でバター20%値上げ
+        custom_cost_amounts: {custom_cost_item_id: 変更後の金額}（有効な項目のみ）
+
+    Returns:
+        dict: 'recipes'（利益率の低下が大きい順）と 'summary'
+
+    Raises:
+        ValueError: 店舗の材料・有効なカスタム原価項目でないIDを指定した場合
+    """
+    ingredient_multipliers = ingredient_multipliers or {}
+    custom_cost_amounts = custom_cost_amounts or {}
+
+    if ingredient_multipliers:
+        found = db.session.query(Ingredient.id).filter(
+            Ingredient.id.in_(list(ingredient_multipliers)),
+            Ingredient.store_id == engine.store_id
+        ).all()
+        unknown = set(ingredient_multipliers) - {row[0] for row in found}
+        if unknown:
+            raise ValueError(f'材料が見つかりません: {", ".join(map(str, sorted(unknown)))}')
+    unknown = set(custom_cost_amounts) - {item.id for item in engine.custom_items}
+    if unknown:
+        raise ValueError(f'有効なカスタム原価項目が見つかりません: {", ".join(map(str, sorted(unknown)))}')
+
+    matrix = load_cost_matrix(engine.store_id, engine.cost_setting, engine.custom_items)
+
+    unit_before, suggested_before = matrix.evaluate(matrix.unit_prices, matrix.custom_amounts)
+    unit_after, suggested_after = matrix.evaluate(matrix.ingredient_prices(ingredient_multipliers),
+                                                  matrix.custom_cost_amounts(custom_cost_amounts))
+
+    # 販売価格は据え置き（手動設定がなければ現在の推奨価格で販売している）として利益率を比べる
+    selling = np.where(np.isnan(matrix.selling_price), suggested_before, matrix.selling_price)
+    margin_before = _margin(selling, unit_before)
+    margin_after = _margin(selling, unit_after)
+    erosion = margin_before - margin_after
+
+    order = np.argsort(-np.nan_to_num(erosion, nan=-np.inf), kind='stable')
+    columns = {
+        'unit_cost_before': unit_before,
+        'unit_cost_after': unit_after,
+        'suggested_price_before': suggested_before,
+        'suggested_price_after': suggested_after,
+        'selling_price': selling,
+        'margin_before': margin_before,
+        'margin_after': margin_after,
+        'margin_erosion': erosion,
+    }
+    values = {name: _numbers(column[order]) for name, column in columns.items()}
+    recipes = [
+        dict({'recipe_id': recipe_id, 'product_name': matrix.product_names[i]},
+             **{name: values[name][position] for name in columns})
+        for position, (i, recipe_id) in enumerate(zip(order.tolist(), matrix.recipe_ids[order].tolist()))
+    ]
+
+    affected = np.nan_to_num(erosion) > EROSION_TOLERANCE
+    return {
+        'recipes': recipes,
+        'summary': {
+            'recipe_count': len(recipes),
+            'affected_count': int(affected.sum()),
+            'negative_margin_count': int((np.nan_to_num(margin_after, nan=0.0) < 0).sum()),
+            'max_margin_erosion': _number(np.nanmax(erosion)) if not np.isnan(erosion).all() else None,
+            'mean_margin_erosion': _number(erosion[affected].mean()) if affected.any() else 0.0,
+        },
+    }
@@ -0,0 +1,144 @@
+"""
+店舗の原価設定のプロセス内キャッシュ
+
+原価設定(CostSetting)と有効なカスタム原価項目(CustomCostItem)はほとんど変更されないため、
+ワーカープロセスごとに店舗単位でキャッシュします（件数上限つきLRU＋有効期限）。
+
+無効化には店舗テーブルの版番号(stores.config_version)を使います。
+原価設定・カスタム原価項目が変更されると同じトランザクション内で版番号を1つ上げるため、
+他のgunicornワーカーも次のリクエストで読み込む店舗の版番号から変更を検知できます。
+ログイン中の店舗の版番号は Flask-Login が毎リクエスト読み込む Store から取得するため、
+確認のための追加のクエリは発生しません。
+
+キャッシュした原価設定・原価項目はセッションに属さない複製です。変更には使わないでください。
+"""
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm.attributes import set_committed_value
+from app.models import db, CostSetting, CustomCostItem, Store
+
+DEFAULT_CACHE_SIZE = 256
+DEFAULT_CACHE_TTL = 300  # 秒（版番号の確認に加えた安全策）
+
+_cache = OrderedDict()  # {store_id: (版番号, 読み込み時刻, 原価設定, 原価項目)}
+_cache_lock = threading.Lock()
+
+
+def _config(key, default):
+    if has_app_context():
+        return current_app.config.get(key, default)
+    return default
+
+
+def _detached_copy(obj):
+    """列の値だけを持つセッション外の複製"""
+    if obj is None:
+        return None
+    values = {attr.key: getattr(obj, attr.key) for attr in db.inspect(type(obj)).column_attrs}
+    return type(obj)(**values)
+
+
+def current_config_version(store_id):
+    """店舗の原価設定の版番号"""
+    # ログイン中の店舗はリクエストごとに読み込み済みのStoreを使う
+    store = db.session.identity_map.get(db.inspect(Store).identity_key_from_primary_key((store_id,)))
+    if store is not None and 'config_version' in store.__dict__:
+        return store.config_version
+    return db.session.execute(
+        db.select(Store.config_version).where(Store.id == store_id)
+    ).scalar()
+
+
+def load_store_config(store_id):
+    """
+    店舗の原価設定と有効なカスタム原価項目を返す（キャッシュがあればキャッシュから）
+
+    Returns:
+        (CostSetting or None, [CustomCostItem]) セッション外の複製
+    """
+    version = current_config_version(store_id)
+    ttl = _config('STORE_CONFIG_CACHE_TTL', DEFAULT_CACHE_TTL)
+    now = time.monotonic()
+
+    with _cache_lock:
+        entry = _cache.get(store_id)
+        if entry is not None and entry[0] == version and now - entry[1] < ttl:
+            _cache.move_to_end(store_id)
+            return entry[2], entry[3]
+
+    cost_setting = _detached_copy(CostSetting.query.filter_by(store_id=store_id).first())
+    custom_items = [_detached_copy(item) for item in CustomCostItem.query.filter_by(
+        store_id=store_id,
+        is_active=True
+    ).order_by(CustomCostItem.display_order, CustomCostItem.id).all()]
+
+    # このセッションで変更中（未コミット）の店舗はキャッシュしない（取り消された場合に備える）
+    if store_id not in db.session.info.get('config_bumped_store_ids', ()):
+        with _cache_lock:
+            _cache[store_id] = (version, now, cost_setting, custom_items)
+            _cache.move_to_end(store_id)
+            while len(_cache) > _config('STORE_CONFIG_CACHE_SIZE', DEFAULT_CACHE_SIZE):
+                _cache.popitem(last=False)
+
+    return cost_setting, custom_items
+
+
+def clear_cache():
+    """キャッシュを空にする"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def bump_config_version(store_ids, connection=None):
+    """
+    店舗の原価設定の版番号を上げる（他のワーカーのキャッシュも次のリクエストで無効になる）
+
+    セッションイベントを通らない一括UPDATEの後に呼び出す。通常の変更はフラッシュ時に自動で上げる。
+    """
+    store_ids = {store_id for store_id in store_ids if store_id is not None}
+    if not store_ids:
+        return
+
+    connection = connection if connection is not None else db.session.connection()
+    connection.execute(
+        Store.__table__.update()
+        .where(Store.__table__.c.id.in_(store_ids))
+        .values(config_version=Store.__table__.c.config_version + 1)
+    )
+    db.session.info.setdefault('config_bumped_store_ids', set()).update(store_ids)
+
+    # 読み込み済みの店舗の版番号も更新（同じリクエスト内で変更後の設定を読み込ませる）
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Store) and obj.id in store_ids and 'config_version' in obj.__dict__:
+            set_committed_value(obj, 'config_version', (obj.config_version or 0) + 1)
+
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_config_changes(session, flush_context, instances):
+    """原価設定・カスタム原価項目が変更された店舗を集める"""
+    pending = session.info.setdefault('config_pending_store_ids', set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (CostSetting, CustomCostItem)) and (obj not in session.dirty or session.is_modified(obj)):
+            pending.add(obj.store_id)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _bump_changed_config_versions(session, flush_context):
+    """変更された店舗の版番号を同じトランザクション内で上げる"""
+    store_ids = session.info.pop('config_pending_store_ids', None)
+    if store_ids:
+        bump_config_version(store_ids, connection=session.connection())
+
+
+@event.listens_for(db.session, 'after_commit')
+def _forget_bumped_stores(session):
+    session.info.pop('config_bumped_store_ids', None)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_config_changes(session):
+    session.info.pop('config_pending_store_ids', None)
+    session.info.pop('config_bumped_store_ids', None)
@@ -0,0 +1,112 @@
+"""
+単位の換算
+
+重さ(g)・体積(ml)・個数(個)の3つの次元ごとに基本単位への換算係数を持つ表を、
+モジュールの読み込み時に1回だけ作ります。表記ゆれ（大文字/小文字・全角/半角・別名）も
+この時点で登録しておくため、換算時は辞書を引くだけです。
+
+材料に密度(g/ml)が設定されている場合は、重さと体積の間（例: 大さじ → g）も換算できます。
+"""
+import unicodedata
+from collections import namedtuple
+from decimal import Decimal
+from functools import lru_cache
+
+MASS = 'mass'
+VOLUME = 'volume'
+COUNT = 'count'
+
+# 次元ごとの基本単位
+BASE_UNITS = {MASS: 'g', VOLUME: 'ml', COUNT: '個'}
+
+Unit = namedtuple('Unit', ['name', 'dimension', 'factor'])  # factor: 基本単位での量(Decimal)
+
+# (単位名, 次元, 基本単位での量, 別名)
+_DEFINITIONS = [
+    ('g', MASS, 1, ('グラム', 'gram', 'grams')),
+    ('kg', MASS, 1000, ('キロ', 'キログラム', 'kilogram', 'kilograms')),
+    ('mg', MASS, '0.001', ('ミリグラム',)),
+    ('ml', VOLUME, 1, ('cc', 'ミリリットル', 'ｍｌ')),
+    ('L', VOLUME, 1000, ('リットル', 'ℓ')),
+    ('大さじ', VOLUME, 15, ('大匙', 'tbsp')),
+    ('小さじ', VOLUME, 5, ('小匙', 'tsp')),
+    ('カップ', VOLUME, 200, ('cup',)),
+    # 個数の単位どうしは従来どおり1対1で換算する
+    ('個', COUNT, 1, ('ヶ', 'ケ', 'コ', 'pc', 'pcs')),
+    ('枚', COUNT, 1, ()),
+    ('本', COUNT, 1, ()),
+]
+
+
+def normalize_unit(name):
+    """単位の表記ゆれをそろえる（全角/半角・大文字/小文字・前後の空白）"""
+    return unicodedata.normalize('NFKC', name).strip().casefold()
+
+
+def _build_registry():
+    registry = {}
+    for name, dimension, factor, aliases in _DEFINITIONS:
+        unit = Unit(name, dimension, Decimal(factor))
+        for alias in (name,) + aliases:
+            registry[alias] = unit
+            registry[normalize_unit(alias)] = unit
+    return registry
+
+
+UNITS = _build_registry()
+
+
+def get_unit(name):
+    """
+    単位名から Unit を返す（登録されていない単位はNone）
+
+    登録済みの表記はそのまま辞書を引き、見つからない場合だけ表記ゆれをそろえて引き直す。
+    """
+    if not name:
+        return None
+    unit = UNITS.get(name)
+    if unit is None:
+        unit = UNITS.get(normalize_unit(name))
+    return unit
+
+
+@lru_cache(maxsize=1024)
+def exact_conversion_factor(from_unit, to_unit, density=None, strict=False):
+    """
+    単位変換係数（from_unit の1単位が to_unit でいくつになるか）をDecimalで返す
+    例: kg -> g なら 1000, L -> ml なら 1000, 大さじ -> 小さじ なら 3
+
+    Args:
+        density: 密度(g/ml)。指定した場合は重さと体積の間も換算する
+        strict: Trueの場合、換算できない組み合わせで ValueError を送出する
+                （Falseの場合は従来どおり同じ単位として1を返す）
+    """
+    if from_unit == to_unit:
+        return Decimal(1)
+
+    source = get_unit(from_unit)
+    target = get_unit(to_unit)
+    if source is not None and target is not None:
+        if source.dimension == target.dimension:
+            return source.factor / target.factor
+
+        if density:
+            density = Decimal(str(density))
+            if source.dimension == VOLUME and target.dimension == MASS:
+                return source.factor * density / target.factor
+            if source.dimension == MASS and target.dimension == VOLUME:
+                return source.factor / density / target.factor
+    elif from_unit and to_unit and normalize_unit(from_unit) == normalize_unit(to_unit):
+        # 登録されていない単位でも表記が同じなら同じ単位
+        return Decimal(1)
+
+    if strict:
+        raise ValueError(f'単位を変換できません: {from_unit} -> {to_unit}')
+    return Decimal(1)
+
+
+@lru_cache(maxsize=1024)
+def conversion_factor(from_unit, to_unit, density=None, strict=False):
+    """単位変換係数（exact_conversion_factor の浮動小数点版）"""
+    return float(exact_conversion_factor(from_unit, to_unit, density, strict))
+
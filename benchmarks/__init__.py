@@ -0,0 +1,15 @@
+"""
+性能測定（ベンチマーク）
+
+一時ファイルのSQLiteで create_app(test_config) を起動し、generator で合成したパン屋のデータに対して
+原価計算・レシピ一覧・ラベルPDF生成の処理時間を測定します。結果はJSONで出力します。
+
+    python -m benchmarks.run --stores 2 --ingredients 300 --recipes 1000 --output bench.json
+    python -m benchmarks.run --compare bench.json        # 前回の結果と比較
+
+loadtest はローカルで gunicorn を起動し、同時に操作する店員を想定した負荷をかけて
+エンドポイントごとのスループットと応答時間(p50/p95/p99)を測定します。
+
+    python -m benchmarks.loadtest --profile baseline --output loadtest.json
+    python -m benchmarks.loadtest --compare loadtest.json
+"""
@@ -0,0 +1,164 @@
+"""
+ベンチマーク用の合成データ
+
+乱数の種(seed)を固定すると同じデータが作られるため、コミット間で結果を比較できます。
+  - 店舗ごとに原価計算設定とカスタム原価項目（包装費・人件費・光熱費・家賃）
+  - 材料は重さ・体積・個数の単位を混ぜ、よく使う材料ほど多くのレシピで使われるよう偏りをつける
+  - レシピの材料数は 3〜18 件（平均 8 件前後）
+
+データは一括INSERTで登録し、最後に原価スナップショットを計算します。
+"""
+import itertools
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import insert
+from app.models import db, Store, CostSetting, Ingredient, Recipe, RecipeIngredient, CustomCostItem
+from app.costing import refresh_cost_snapshots
+from app.search import search_key
+from app.money import usage_price
+
+BENCH_PASSWORD = 'benchmark'
+BATCH_SIZE = 1000
+
+INGREDIENT_NAMES = [
+    '強力粉', '薄力粉', '全粒粉', 'ライ麦粉', '無塩バター', '有塩バター', 'グラニュー糖', '上白糖', 'きび砂糖',
+    '塩', 'ドライイースト', '牛乳', '生クリーム', '卵', '卵黄', 'スキムミルク', 'ショートニング', 'はちみつ',
+    'レーズン', 'くるみ', 'チョコチップ', 'あんこ', 'カスタード', 'ハム', 'チーズ', 'ベーコン', 'コーン',
+    'ツナ', 'カレー', 'ソーセージ', 'オリーブオイル', 'ごま', 'シナモン', '抹茶', 'ココア', 'アーモンド',
+]
+RECIPE_NAMES = [
+    '食パン', 'バターロール', 'クロワッサン', 'メロンパン', 'あんぱん', 'クリームパン', 'カレーパン',
+    'バゲット', 'ベーグル', 'デニッシュ', 'フォカッチャ', 'ハムチーズ', 'チョコパン', 'シナモンロール',
+]
+CATEGORIES = ['食パン', '菓子パン', '惣菜パン', 'ハード系', 'デニッシュ']
+ALLERGENS = {'粉': '小麦', 'バター': '乳', '牛乳': '乳', 'クリーム': '乳', 'チーズ': '乳', '卵': '卵',
+             'くるみ': 'くるみ', 'アーモンド': 'アーモンド', 'ごま': 'ごま'}
+
+# (購入単位, 使用単位, 購入価格の範囲, 購入数量の範囲, 使用量の範囲)
+UNIT_PROFILES = [
+    ('kg', 'g', (300, 1500), (1, 25), (5, 600)),
+    ('g', 'g', (150, 1200), (100, 1000), (5, 300)),
+    ('L', 'ml', (200, 900), (1, 5), (10, 400)),
+    ('個', '個', (200, 600), (10, 30), (1, 6)),
+    ('枚', '枚', (300, 800), (10, 50), (1, 4)),
+    ('本', '本', (200, 700), (5, 20), (1, 3)),
+]
+UNIT_PROFILE_WEIGHTS = [50, 20, 15, 8, 4, 3]
+
+
+def _money(rng, low, high):
+    return Decimal(rng.randint(low * 100, high * 100)) / 100
+
+
+def _line_count(rng):
+    return max(3, min(18, round(rng.triangular(3, 18, 7))))
+
+
+def _flush(model, rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        db.session.execute(insert(model), rows[start:start + BATCH_SIZE])
+
+
+def generate(stores=2, ingredients=300, recipes=1000, seed=42):
+    """
+    合成データを登録する（アプリケーションコンテキスト内で呼び出す、空のデータベースを想定）
+
+    Returns:
+        dict: 登録した件数
+    """
+    rng = random.Random(seed)
+    now = datetime(2025, 1, 1)
+    counts = {'stores': 0, 'ingredients': 0, 'recipes': 0, 'recipe_ingredients': 0, 'custom_cost_items': 0}
+
+    # パスワードのハッシュ化は遅いため全店舗で共通にする
+    template = Store()
+    template.set_password(BENCH_PASSWORD)
+    password_hash = template.password_hash
+
+    ingredient_id = recipe_id = line_id = 0
+    for store_no in range(1, stores + 1):
+        store_name = f'ベンチマークベーカリー{store_no}'
+        db.session.execute(insert(Store), [{
+            'id': store_no, 'login_id': f'bench{store_no}', 'password_hash': password_hash,
+            'store_name': store_name, 'search_name': search_key(store_name),
+        }])
+        db.session.execute(insert(CostSetting), [{'store_id': store_no,
+                                                  'profit_margin': Decimal(rng.choice([25, 30, 35, 40]))}])
+        custom_items = [
+            {'name': '包装費', 'calculation_type': 'per_unit', 'amount': _money(rng, 5, 30)},
+            {'name': '人件費', 'calculation_type': 'per_time', 'amount': _money(rng, 15, 30)},
+            {'name': '光熱費', 'calculation_type': 'per_time', 'amount': _money(rng, 1, 5)},
+            {'name': '家賃', 'calculation_type': 'fixed', 'amount': _money(rng, 100, 500)},
+        ]
+        _flush(CustomCostItem, [dict(item, store_id=store_no, is_active=True, display_order=order)
+                                for order, item in enumerate(custom_items)])
+        counts['stores'] += 1
+        counts['custom_cost_items'] += len(custom_items)
+
+        # 材料（先頭ほどよく使われる）
+        ingredient_rows = []
+        for index in range(ingredients):
+            base = INGREDIENT_NAMES[index % len(INGREDIENT_NAMES)]
+            name = base if index < len(INGREDIENT_NAMES) else f'{base}{index // len(INGREDIENT_NAMES) + 1}'
+            purchase_unit, usage_unit, price_range, quantity_range, _usage_range = \
+                rng.choices(UNIT_PROFILES, weights=UNIT_PROFILE_WEIGHTS)[0]
+            price = _money(rng, *price_range)
+            quantity = Decimal(rng.randint(*quantity_range))
+            allergen = next((value for key, value in ALLERGENS.items() if key in base), None)
+            ingredient_id += 1
+            ingredient_rows.append({
+                'id': ingredient_id, 'store_id': store_no, 'name': name, 'search_name': search_key(name),
+                'purchase_price': price, 'purchase_quantity': quantity,
+                'purchase_unit': purchase_unit, 'usage_unit': usage_unit,
+                'usage_price': usage_price(price, quantity, purchase_unit, usage_unit),
+                'is_allergen': allergen is not None, 'allergen_type': allergen,
+                'created_at': now, 'updated_at': now,
+            })
+        _flush(Ingredient, ingredient_rows)
+        counts['ingredients'] += len(ingredient_rows)
+
+        cum_weights = list(itertools.accumulate(1 / (rank + 1) ** 0.8 for rank in range(len(ingredient_rows))))
+
+        # レシピと材料行
+        recipe_rows = []
+        line_rows = []
+        for index in range(recipes):
+            name = f'{rng.choice(RECIPE_NAMES)}{index + 1}'
+            recipe_id += 1
+            updated = now + timedelta(minutes=rng.randint(0, 60 * 24 * 365))
+            recipe_rows.append({
+                'id': recipe_id, 'store_id': store_no, 'product_name': name, 'search_name': search_key(name),
+                'category': rng.choice(CATEGORIES),
+                'production_quantity': rng.randint(6, 60),
+                'production_time': rng.choice([30, 45, 60, 90, 120, 180, 240]),
+                'shelf_life_days': rng.randint(1, 7),
+                'custom_profit_margin': Decimal(rng.choice([35, 40, 50])) if rng.random() < 0.1 else None,
+                'selling_price': Decimal(rng.randint(15, 50) * 10) if rng.random() < 0.2 else None,
+                'created_at': now, 'updated_at': updated,
+            })
+
+            chosen = set()
+            target = min(_line_count(rng), len(ingredient_rows))
+            while len(chosen) < target:
+                chosen.add(rng.choices(range(len(ingredient_rows)), cum_weights=cum_weights)[0])
+            for position in sorted(chosen):
+                ingredient = ingredient_rows[position]
+                usage_range = next(profile[4] for profile in UNIT_PROFILES
+                                   if profile[1] == ingredient['usage_unit'])
+                line_id += 1
+                line_rows.append({
+                    'id': line_id, 'recipe_id': recipe_id, 'ingredient_id': ingredient['id'],
+                    'quantity': Decimal(rng.randint(usage_range[0] * 10, usage_range[1] * 10)) / 10,
+                })
+        _flush(Recipe, recipe_rows)
+        _flush(RecipeIngredient, line_rows)
+        counts['recipes'] += len(recipe_rows)
+        counts['recipe_ingredients'] += len(line_rows)
+
+    db.session.commit()
+
+    # 一括INSERTはセッションイベントを通らないため、原価スナップショットをまとめて計算する
+    refresh_cost_snapshots(store_ids=range(1, stores + 1))
+    db.session.commit()
+    return counts
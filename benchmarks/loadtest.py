@@ -0,0 +1,374 @@
+"""
+負荷試験（同時に操作する店員を想定したエンドポイントの応答時間）
+
+    python -m benchmarks.loadtest [--profile baseline] [--users 50] [--duration 60] [--workers 4]
+                                  [--output 結果.json] [--compare 前回の結果.json]
+
+一時ディレクトリのSQLiteに generator で合成データを作り、ローカルで gunicorn (run:app) を起動して、
+店舗ごとにログインした仮想の店員（スレッド）が実際の画面・APIへ順にリクエストを送ります。
+  - ダッシュボード、レシピ一覧・詳細、材料の候補検索(ingredients.lookup)
+  - レシピ材料の保存(recipes.edit_ingredients のPOST)、ラベルPDF生成(labels.generate)
+
+店員は応答を待ってすぐ次のリクエストを送ります（--think-time で待ち時間を指定可能）。
+エンドポイントごとにスループット(件/秒)と応答時間の p50 / p95 / p99 をJSONで出力します。
+外部のサービスや負荷試験ツールは使いません（標準ライブラリと gunicorn のみ）。
+
+負荷の条件は PROFILES の名前付きプロファイルで固定しています。同じプロファイル・同じマシンで
+測定した結果どうしを --compare で比較し、p95 が threshold 倍より遅くなったか、スループットが
+1/threshold 未満に下がったエンドポイントがあれば終了コード1で終了します。
+benchmarks/baselines/loadtest-baseline.json は baseline プロファイルの参考値です
+（応答時間はマシンに依存するため、比較には同じマシンで取り直した結果を使ってください）。
+"""
+import argparse
+import http.cookiejar
+import json
+import math
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timezone
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+
+from app import create_app
+from app.models import db, Ingredient, RecipeIngredient
+from benchmarks.generator import BENCH_PASSWORD, generate, INGREDIENT_NAMES
+
+# 名前付きの負荷条件（データ量・同時接続数・時間・gunicornのワーカー数）
+PROFILES = {
+    'baseline': {'stores': 5, 'ingredients': 200, 'recipes': 500, 'users': 50,
+                 'duration': 60, 'warmup': 10, 'workers': 4, 'think_time': 0.0},
+    'smoke': {'stores': 2, 'ingredients': 50, 'recipes': 100, 'users': 5,
+              'duration': 10, 'warmup': 2, 'workers': 2, 'think_time': 0.0},
+}
+
+# 店員の操作の比率（各操作を選ぶ重み）
+ACTION_WEIGHTS = {
+    'main.index': 10,
+    'recipes.index': 20,
+    'recipes.detail': 25,
+    'ingredients.lookup': 25,
+    'recipes.edit_ingredients': 10,
+    'labels.generate': 10,
+}
+
+# ラベル生成で使うシート（プリセット, 枚数）
+LABEL_SHEETS = [('31531', 12), ('31531', 24), ('28765', 65)]
+
+PERCENTILES = (50, 95, 99)
+
+CSRF_PATTERN = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """リダイレクトを追わずに3xxの応答をそのまま返す（1リクエストずつ測定するため）"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Clerk(threading.Thread):
+    """1人の店員（ログインした店舗のセッションで操作を繰り返す）"""
+
+    def __init__(self, number, base_url, store_no, recipe_lines, ingredient_terms, settings, clock):
+        super().__init__(name=f'clerk-{number}', daemon=True)
+        self.base_url = base_url
+        self.store_no = store_no
+        self.recipe_lines = recipe_lines  # {recipe_id: [(ingredient_id, quantity)]}
+        self.recipe_ids = list(recipe_lines)
+        self.ingredient_terms = ingredient_terms
+        self.settings = settings
+        self.clock = clock
+        self.rng = random.Random(number)
+        self.samples = []  # [(操作, 開始時刻, 応答時間(秒), ステータス)]
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, action, path, data=None, headers=None, record=True):
+        body = urllib.parse.urlencode(data, doseq=True).encode('utf-8') if data is not None else None
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers or {})
+        started = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=60) as response:
+                content = response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            content = e.read()
+            status = e.code
+        except OSError:
+            content = b''
+            status = 0  # 接続エラー・タイムアウト
+        elapsed = time.perf_counter() - started
+        if record:
+            self.samples.append((action, started, elapsed, status))
+        return status, content
+
+    def login(self):
+        _status, content = self.request('auth.login', '/auth/login', record=False)
+        match = CSRF_PATTERN.search(content.decode('utf-8'))
+        status, _content = self.request('auth.login', '/auth/login', data={
+            'csrf_token': match.group(1) if match else '',
+            'login_id': f'bench{self.store_no}',
+            'password': BENCH_PASSWORD,
+        }, record=False)
+        if status != 302:
+            raise RuntimeError(f'bench{self.store_no} でログインできません（ステータス {status}）')
+
+    def act(self, action):
+        rng = self.rng
+        if action == 'main.index':
+            return self.request(action, '/')
+        if action == 'recipes.index':
+            return self.request(action, f'/recipes/?page={rng.randint(1, 5)}')
+        if action == 'recipes.detail':
+            return self.request(action, f'/recipes/{rng.choice(self.recipe_ids)}/detail')
+        if action == 'ingredients.lookup':
+            term = rng.choice(self.ingredient_terms)[:rng.randint(1, 2)]
+            return self.request(action, '/ingredients/lookup?' + urllib.parse.urlencode({'q': term}),
+                                headers={'Accept': 'application/json'})
+        if action == 'recipes.edit_ingredients':
+            # 既存の材料の使用量を少しずつ変えて保存する（画面のフォーム送信と同じ形式）
+            recipe_id = rng.choice(self.recipe_ids)
+            lines = self.recipe_lines[recipe_id]
+            return self.request(action, f'/recipes/{recipe_id}/ingredients/edit', data={
+                'ingredient_id[]': [str(ingredient_id) for ingredient_id, _quantity in lines],
+                'quantity[]': [f'{quantity * rng.uniform(0.9, 1.1):.1f}' for _ingredient_id, quantity in lines],
+            })
+        if action == 'labels.generate':
+            preset, count = rng.choice(LABEL_SHEETS)
+            return self.request(action, f'/labels/{rng.choice(self.recipe_ids)}/generate', data={
+                'label_preset': preset,
+                'label_count': str(count),
+                'production_date': f'2025-01-{rng.randint(1, 28):02d}',
+                'show_cost': 'on',
+                'show_price': 'on',
+            })
+        raise ValueError(f'不明な操作です: {action}')
+
+    def run(self):
+        actions = list(ACTION_WEIGHTS)
+        weights = list(ACTION_WEIGHTS.values())
+        while not self.clock['stop'].is_set():
+            self.act(self.rng.choices(actions, weights=weights)[0])
+            if self.settings['think_time']:
+                self.clock['stop'].wait(self.rng.expovariate(1 / self.settings['think_time']))
+
+
+def percentile(sorted_values, p):
+    """パーセンタイル（最近接順位法）"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(samples, window_start, window_end):
+    """測定期間内のリクエストをエンドポイントごとに集計する"""
+    seconds = window_end - window_start
+    grouped = defaultdict(list)
+    for action, started, elapsed, status in samples:
+        if window_start <= started < window_end:
+            grouped[action].append((elapsed, status))
+            grouped['total'].append((elapsed, status))
+
+    endpoints = {}
+    for action in list(ACTION_WEIGHTS) + ['total']:
+        rows = grouped.get(action, [])
+        latencies = sorted(elapsed * 1000 for elapsed, _status in rows)
+        errors = sum(1 for _elapsed, status in rows if status == 0 or status >= 400)
+        result = {
+            'requests': len(rows),
+            'errors': errors,
+            'throughput_rps': round(len(rows) / seconds, 2) if seconds > 0 else 0,
+        }
+        for p in PERCENTILES:
+            value = percentile(latencies, p)
+            result[f'p{p}_ms'] = round(value, 2) if value is not None else None
+        result['max_ms'] = round(latencies[-1], 2) if latencies else None
+        endpoints[action] = result
+    return endpoints
+
+
+def compare(results, previous, threshold):
+    """前回の結果と p95・スループットを比較して表示し、悪化したエンドポイント名のリストを返す"""
+    regressions = []
+    print(f"{'endpoint':<26} {'p95 before':>11} {'p95 after':>10} {'rps before':>11} {'rps after':>10}",
+          file=sys.stderr)
+    for name, result in results['endpoints'].items():
+        before = previous.get('endpoints', {}).get(name)
+        if not before or not before['requests'] or not result['requests']:
+            print(f'{name:<26} {"-":>11} {result["p95_ms"] or "-":>10}', file=sys.stderr)
+            continue
+        slower = result['p95_ms'] > before['p95_ms'] * threshold
+        fewer = result['throughput_rps'] < before['throughput_rps'] / threshold
+        mark = '  <-- worse' if slower or fewer else ''
+        print(f'{name:<26} {before["p95_ms"]:>11.2f} {result["p95_ms"]:>10.2f} '
+              f'{before["throughput_rps"]:>11.2f} {result["throughput_rps"]:>10.2f}{mark}', file=sys.stderr)
+        if slower or fewer:
+            regressions.append(name)
+    return regressions
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_server(base_url, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn が終了しました（終了コード {server.returncode}）')
+        try:
+            urllib.request.urlopen(base_url + '/auth/login', timeout=5).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn が起動しません')
+
+
+def prepare_data(database_url, settings, seed):
+    """合成データを登録し、店舗ごとのレシピの材料行と検索語を返す"""
+    app = create_app({'SQLALCHEMY_DATABASE_URI': database_url})
+    with app.app_context():
+        dataset = generate(settings['stores'], settings['ingredients'], settings['recipes'], seed)
+
+        recipe_lines = defaultdict(lambda: defaultdict(list))
+        rows = db.session.query(Ingredient.store_id, RecipeIngredient.recipe_id,
+                                RecipeIngredient.ingredient_id, RecipeIngredient.quantity)\
+            .join(Ingredient, Ingredient.id == RecipeIngredient.ingredient_id)\
+            .order_by(RecipeIngredient.id)
+        for store_id, recipe_id, ingredient_id, quantity in rows:
+            recipe_lines[store_id][recipe_id].append((ingredient_id, float(quantity)))
+        db.engine.dispose()
+    return dataset, recipe_lines
+
+
+def run(settings, args):
+    workdir = tempfile.mkdtemp(prefix='bakery-loadtest-')
+    server = None
+    try:
+        database_url = args.database_url or f'sqlite:///{os.path.join(workdir, "loadtest.db")}'
+        dataset, recipe_lines = prepare_data(database_url, settings, args.seed)
+
+        port = _free_port()
+        base_url = f'http://127.0.0.1:{port}'
+        env = dict(os.environ,
+                   DATABASE_URL=database_url,
+                   SECRET_KEY='loadtest',
+                   LABEL_CACHE_DIR=os.path.join(workdir, 'label_cache'),
+                   LABEL_JOB_DIR=os.path.join(workdir, 'label_jobs'))
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--workers', str(settings['workers']),
+             '--bind', f'127.0.0.1:{port}', '--log-level', 'warning', 'run:app'],
+            cwd=ROOT, env=env)
+        _wait_for_server(base_url, server)
+
+        clock = {'stop': threading.Event()}
+        clerks = []
+        for number in range(settings['users']):
+            store_no = number % settings['stores'] + 1
+            clerk = Clerk(number, base_url, store_no, recipe_lines[store_no], INGREDIENT_NAMES, settings, clock)
+            clerk.login()
+            clerks.append(clerk)
+
+        started = time.perf_counter()
+        for clerk in clerks:
+            clerk.start()
+        # 準備期間（接続・キャッシュの立ち上がり）の後から測定する
+        window_start = started + settings['warmup']
+        window_end = window_start + settings['duration']
+        time.sleep(max(0, window_end - time.perf_counter()))
+        clock['stop'].set()
+        for clerk in clerks:
+            clerk.join()
+
+        samples = [sample for clerk in clerks for sample in clerk.samples]
+        endpoints = summarize(samples, window_start, window_end)
+        for name, result in endpoints.items():
+            print(f'{name:<26} {result["throughput_rps"]:>8.2f} req/s  p50 {result["p50_ms"] or 0:>8.2f}  '
+                  f'p95 {result["p95_ms"] or 0:>8.2f}  p99 {result["p99_ms"] or 0:>8.2f} ms  '
+                  f'errors {result["errors"]}', file=sys.stderr)
+
+        return {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'profile': args.profile,
+                'settings': settings,
+                'seed': args.seed,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'database': database_url.split(':', 1)[0],
+                'dataset': dataset,
+            },
+            'endpoints': endpoints,
+        }
+    finally:
+        if server is not None and server.poll() is None:
+            server.terminate()
+            try:
+                server.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                server.kill()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='gunicorn を起動してエンドポイントの負荷試験を行う')
+    parser.add_argument('--profile', choices=list(PROFILES), default='baseline', help='負荷条件のプロファイル')
+    for key, kind, help_text in [
+        ('stores', int, '店舗数'), ('ingredients', int, '店舗あたりの材料数'),
+        ('recipes', int, '店舗あたりのレシピ数'), ('users', int, '同時に操作する店員の数'),
+        ('duration', float, '測定時間(秒)'), ('warmup', float, '測定前の準備時間(秒)'),
+        ('workers', int, 'gunicornのワーカー数'), ('think_time', float, '操作の間の平均待ち時間(秒)'),
+    ]:
+        parser.add_argument(f'--{key.replace("_", "-")}', dest=key, type=kind,
+                            help=f'{help_text}（省略時はプロファイルの値）')
+    parser.add_argument('--seed', type=int, default=42, help='乱数の種')
+    parser.add_argument('--database-url', help='使用するデータベース（空のデータベース、省略時は一時ファイルのSQLite）')
+    parser.add_argument('--output', '-o', help='結果のJSONの出力先（省略時は標準出力）')
+    parser.add_argument('--compare', help='比較する前回の結果のJSON')
+    parser.add_argument('--threshold', type=float, default=1.25, help='悪化と判定する比')
+    args = parser.parse_args(argv)
+
+    settings = dict(PROFILES[args.profile])
+    for key in settings:
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+
+    results = run(settings, args)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        if previous.get('meta', {}).get('settings') != settings:
+            print('注意: 前回の結果と負荷条件が異なります', file=sys.stderr)
+        if compare(results, previous, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+"""
+ベンチマークの実行
+
+    python -m benchmarks.run [--stores N] [--ingredients M] [--recipes K] [--seed S]
+                             [--repeat R] [--scenario 名前 ...] [--output 結果.json]
+                             [--compare 前回の結果.json] [--threshold 1.2]
+
+一時ディレクトリのSQLiteにデータを作り、各シナリオを1回の準備実行の後 R 回測定します。
+シナリオごとに処理時間（ミリ秒の最小・中央値・平均・最大）と1回あたりのSQL実行数をJSONで出力します。
+--compare を指定すると前回の結果と中央値を比べ、threshold 倍より遅くなったシナリオがあれば終了コード1で終了します。
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import sqlalchemy
+from sqlalchemy import event
+from app import create_app
+from app.models import db, CostSetting, Recipe
+from app.costing import StoreCostEngine, refresh_cost_snapshots
+from benchmarks.generator import BENCH_PASSWORD, generate
+
+# 一覧画面のシナリオで読み込むページ数
+INDEX_PAGES = 5
+
+CURSOR_PATTERN = re.compile(r'[?&]cursor=([A-Za-z0-9_-]+)')
+
+
+class Context:
+    """シナリオに渡す実行環境"""
+
+    def __init__(self, app, client, store_id, recipe_id):
+        self.app = app
+        self.client = client
+        self.store_id = store_id
+        self.recipe_id = recipe_id
+
+
+def _check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'{response.request.path}: {response.status_code} {response.data[:200]!r}')
+    return response
+
+
+def cost_store_engine(ctx):
+    """店舗の全レシピの原価を StoreCostEngine でまとめて計算"""
+    with ctx.app.app_context():
+        recipes = Recipe.query.filter_by(store_id=ctx.store_id).all()
+        StoreCostEngine.for_store(ctx.store_id).price(recipes)
+
+
+def cost_store_model_methods(ctx):
+    """店舗の全レシピの原価を Recipe.calculate_total_cost で1件ずつ計算（従来の方法）"""
+    with ctx.app.app_context():
+        cost_setting = CostSetting.query.filter_by(store_id=ctx.store_id).first()
+        for recipe in Recipe.query.filter_by(store_id=ctx.store_id).all():
+            recipe.calculate_total_cost(cost_setting)
+
+
+def refresh_store_snapshots(ctx):
+    """店舗全体の原価スナップショットの再計算（保存せずに取り消す）"""
+    with ctx.app.app_context():
+        refresh_cost_snapshots(store_ids=[ctx.store_id])
+        db.session.rollback()
+
+
+def recipes_index(ctx):
+    """レシピ一覧（ページ番号方式）の先頭から INDEX_PAGES ページ"""
+    for page in range(1, INDEX_PAGES + 1):
+        _check(ctx.client.get(f'/recipes/?page={page}'))
+
+
+def recipes_index_keyset(ctx):
+    """レシピ一覧（キーセット方式）の先頭から INDEX_PAGES ページ（「次へ」のカーソルをたどる）"""
+    cursor = ''
+    for _page in range(INDEX_PAGES):
+        response = _check(ctx.client.get('/recipes/', query_string={'cursor': cursor}))
+        cursors = CURSOR_PATTERN.findall(response.get_data(as_text=True))
+        if not cursors:
+            break
+        cursor = cursors[-1]  # 「前へ」「次へ」の順に並んでいる
+
+
+def labels_generate(preset, count):
+    def scenario(ctx):
+        _check(ctx.client.post(f'/labels/{ctx.recipe_id}/generate', data={
+            'label_preset': preset,
+            'label_count': str(count),
+            'production_date': '2025-01-01',
+            'show_cost': 'on',
+            'show_price': 'on',
+        }))
+    scenario.__doc__ = f'ラベルPDF生成（{preset}、{count}枚）'
+    return scenario
+
+
+SCENARIOS = {
+    'cost_store_engine': cost_store_engine,
+    'cost_store_model_methods': cost_store_model_methods,
+    'refresh_store_snapshots': refresh_store_snapshots,
+    'recipes_index': recipes_index,
+    'recipes_index_keyset': recipes_index_keyset,
+    'labels_generate_12up': labels_generate('31531', 12),
+    'labels_generate_65up': labels_generate('28765', 65),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(scenario, ctx, repeat, counter):
+    """準備実行の後 repeat 回測定する"""
+    scenario(ctx)
+
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        counter['n'] = 0
+        started = time.perf_counter()
+        scenario(ctx)
+        timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter['n'])
+
+    return {
+        'description': (scenario.__doc__ or '').strip(),
+        'repeat': repeat,
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': max(queries),
+    }
+
+
+def compare(results, previous, threshold):
+    """前回の結果と中央値を比較して表示し、遅くなったシナリオ名のリストを返す"""
+    regressions = []
+    print(f"{'scenario':<28} {'before':>10} {'after':>10} {'ratio':>7}", file=sys.stderr)
+    for name, result in results['scenarios'].items():
+        before = previous.get('scenarios', {}).get(name)
+        if before is None:
+            print(f'{name:<28} {"-":>10} {result["median_ms"]:>10.2f}', file=sys.stderr)
+            continue
+        ratio = result['median_ms'] / before['median_ms'] if before['median_ms'] else float('inf')
+        mark = '  <-- slower' if ratio > threshold else ''
+        print(f'{name:<28} {before["median_ms"]:>10.2f} {result["median_ms"]:>10.2f} {ratio:>7.2f}{mark}',
+              file=sys.stderr)
+        if ratio > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='bakery-bench-')
+    try:
+        app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(workdir, "bench.db")}',
+            'WTF_CSRF_ENABLED': False,
+            'RAISE_ON_LAZY_LOAD': False,
+            'LABEL_CACHE_MAX_BYTES': 0,  # 毎回PDFを描画する
+            'LABEL_ASYNC_THRESHOLD': 10 ** 9,
+            'LABEL_JOB_DIR': os.path.join(workdir, 'label_jobs'),
+        })
+
+        started = time.perf_counter()
+        with app.app_context():
+            dataset = generate(args.stores, args.ingredients, args.recipes, args.seed)
+            recipe_id = db.session.query(Recipe.id).filter_by(store_id=1).order_by(Recipe.id).first()[0]
+        generate_seconds = time.perf_counter() - started
+
+        counter = {'n': 0}
+        with app.app_context():
+            @event.listens_for(db.engine, 'before_cursor_execute')
+            def _count(*_args, **_kwargs):
+                counter['n'] += 1
+
+        client = app.test_client()
+        if client.post('/auth/login', data={'login_id': 'bench1', 'password': BENCH_PASSWORD}).status_code != 302:
+            raise RuntimeError('ベンチマーク用の店舗でログインできません')
+        ctx = Context(app, client, 1, recipe_id)
+
+        names = args.scenario or list(SCENARIOS)
+        scenarios = {}
+        for name in names:
+            scenarios[name] = measure(SCENARIOS[name], ctx, args.repeat, counter)
+            print(f'{name:<28} median {scenarios[name]["median_ms"]:>10.2f} ms  '
+                  f'queries {scenarios[name]["queries"]}', file=sys.stderr)
+
+        return {
+            'meta': {
+                'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'commit': _git_commit(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'flask': metadata.version('flask'),
+                'sqlalchemy': sqlalchemy.__version__,
+                'params': {'stores': args.stores, 'ingredients': args.ingredients, 'recipes': args.recipes,
+                           'seed': args.seed, 'repeat': args.repeat},
+                'dataset': dataset,
+                'generate_seconds': round(generate_seconds, 3),
+            },
+            'scenarios': scenarios,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='原価計算・一覧・ラベル生成のベンチマーク')
+    parser.add_argument('--stores', type=int, default=2, help='店舗数')
+    parser.add_argument('--ingredients', type=int, default=300, help='店舗あたりの材料数')
+    parser.add_argument('--recipes', type=int, default=1000, help='店舗あたりのレシピ数')
+    parser.add_argument('--seed', type=int, default=42, help='乱数の種')
+    parser.add_argument('--repeat', type=int, default=5, help='測定回数')
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help='実行するシナリオ（複数指定可）')
+    parser.add_argument('--output', '-o', help='結果のJSONの出力先（省略時は標準出力）')
+    parser.add_argument('--compare', help='比較する前回の結果のJSON')
+    parser.add_argument('--threshold', type=float, default=1.2, help='遅くなったと判定する中央値の比')
+    args = parser.parse_args(argv)
+
+    results = run(args)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+        if compare(results, previous, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
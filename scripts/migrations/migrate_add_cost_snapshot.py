@@ -0,0 +1,77 @@
+"""
+データベースマイグレーション: 原価スナップショット列の追加
+レシピテーブルに保存済みの原価（材料費・総原価・1個あたり原価・推奨価格・版番号）を追加します。
+
+既存レシピの原価の計算には後続のマイグレーションで追加する列も必要なため、ここでは行いません。
+すべてのマイグレーションの後に `flask recipes refresh-costs` を実行してください
+（実行順は scripts/migrations/README.md を参照）。
+"""
+import os
+import sys
+from sqlalchemy import create_engine, inspect, text
+
+NEW_COLUMNS = [
+    ('cost_material', 'NUMERIC(12, 4)'),
+    ('cost_total', 'NUMERIC(12, 4)'),
+    ('cost_unit', 'NUMERIC(12, 4)'),
+    ('cost_suggested_price', 'NUMERIC(12, 4)'),
+    ('cost_version', 'INTEGER'),
+]
+
+def migrate_database():
+    """recipesテーブルに原価スナップショットのカラムを追加"""
+
+    # DATABASE_URLの取得
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///instance/bakery.db')
+
+    # RenderのPostgreSQLは postgres:// で始まるが、SQLAlchemyは postgresql:// が必要
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+
+    print("=" * 60)
+    print("データベースマイグレーション: 原価スナップショット追加")
+    print("=" * 60)
+    print(f"データベース接続: {database_url.split('@')[0]}@...")
+    print()
+
+    try:
+        # エンジンを作成
+        engine = create_engine(database_url)
+
+        # テーブルが存在するか確認
+        inspector = inspect(engine)
+        if 'recipes' not in inspector.get_table_names():
+            print("エラー: recipesテーブルが見つかりません。")
+            print("先にアプリケーションを起動してデータベースを初期化してください。")
+            return False
+
+        columns = [col['name'] for col in inspector.get_columns('recipes')]
+
+        with engine.connect() as connection:
+            for name, column_type in NEW_COLUMNS:
+                if name in columns:
+                    print(f"[OK] {name}カラムは既に存在します。")
+                    continue
+                # SQLiteとPostgreSQLで構文が同じなので統一
+                connection.execute(text(f"ALTER TABLE recipes ADD COLUMN {name} {column_type}"))
+                print(f"[OK] {name}カラムを追加しました。")
+
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_recipes_cost_unit ON recipes (cost_unit)"
+            ))
+            connection.commit()
+
+        print()
+        print("[OK] マイグレーションが正常に完了しました。")
+        print("すべてのマイグレーションの後に `flask recipes refresh-costs` で既存レシピの原価を計算してください。")
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] マイグレーション中にエラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == '__main__':
+    success = migrate_database()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,58 @@
+"""
+データベースマイグレーション: 材料→レシピ逆引きインデックスの追加
+材料価格の変更が影響するレシピを素早く特定するため、
+recipe_ingredientsテーブルに (ingredient_id, recipe_id) のインデックスを追加します。
+"""
+import os
+import sys
+from sqlalchemy import create_engine, inspect, text
+
+def migrate_database():
+    """recipe_ingredientsテーブルに逆引きインデックスを追加"""
+
+    # DATABASE_URLの取得
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///instance/bakery.db')
+
+    # RenderのPostgreSQLは postgres:// で始まるが、SQLAlchemyは postgresql:// が必要
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+
+    print("=" * 60)
+    print("データベースマイグレーション: 材料→レシピ逆引きインデックス追加")
+    print("=" * 60)
+    print(f"データベース接続: {database_url.split('@')[0]}@...")
+    print()
+
+    try:
+        # エンジンを作成
+        engine = create_engine(database_url)
+
+        # テーブルが存在するか確認
+        inspector = inspect(engine)
+        if 'recipe_ingredients' not in inspector.get_table_names():
+            print("エラー: recipe_ingredientsテーブルが見つかりません。")
+            print("先にアプリケーションを起動してデータベースを初期化してください。")
+            return False
+
+        print("ix_recipe_ingredients_ingredient_recipeインデックスを作成しています...")
+
+        with engine.connect() as connection:
+            # SQLiteとPostgreSQLで構文が同じなので統一
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_recipe_ingredients_ingredient_recipe "
+                "ON recipe_ingredients (ingredient_id, recipe_id)"
+            ))
+            connection.commit()
+
+        print("[OK] マイグレーションが正常に完了しました。")
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] マイグレーション中にエラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == '__main__':
+    success = migrate_database()
+    sys.exit(0 if success else 1)
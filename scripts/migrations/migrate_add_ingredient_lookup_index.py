@@ -0,0 +1,73 @@
+"""
+データベースマイグレーション: 材料名の前方一致検索用インデックスの追加
+レシピ編集画面の材料候補(ingredients.lookup)を索引で検索できるよう、
+ingredientsテーブルに (store_id, search_name, id) のインデックスを追加します。
+PostgreSQLでは前方一致の範囲条件が文字コード順で比較されるよう、search_name 列を COLLATE "C" に変更します
+（言語別の照合順序では範囲検索で候補が漏れ、LIKEの前方一致にも索引が使えないため）。
+先に migrate_add_search_index.py で search_name 列を追加しておいてください。
+"""
+import os
+import sys
+from sqlalchemy import create_engine, inspect, text
+
+def migrate_database():
+    """ingredientsテーブルに前方一致検索用のインデックスを追加"""
+
+    # DATABASE_URLの取得
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///instance/bakery.db')
+
+    # RenderのPostgreSQLは postgres:// で始まるが、SQLAlchemyは postgresql:// が必要
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+
+    print("=" * 60)
+    print("データベースマイグレーション: 材料名の前方一致検索用インデックス追加")
+    print("=" * 60)
+    print(f"データベース接続: {database_url.split('@')[0]}@...")
+    print()
+
+    try:
+        # エンジンを作成
+        engine = create_engine(database_url)
+
+        # テーブル・列が存在するか確認
+        inspector = inspect(engine)
+        if 'ingredients' not in inspector.get_table_names():
+            print("エラー: ingredientsテーブルが見つかりません。")
+            print("先にアプリケーションを起動してデータベースを初期化してください。")
+            return False
+
+        if 'search_name' not in [col['name'] for col in inspector.get_columns('ingredients')]:
+            print("エラー: ingredients.search_nameカラムが見つかりません。")
+            print("先に migrate_add_search_index.py を実行してください。")
+            return False
+
+        print("ix_ingredients_store_search_nameインデックスを作成しています...")
+
+        with engine.connect() as connection:
+            if engine.dialect.name == 'postgresql':
+                # 列の照合順序を変更すると、この列の索引（pg_trgm を含む）も作り直される
+                connection.execute(text(
+                    'ALTER TABLE ingredients ALTER COLUMN search_name TYPE VARCHAR(100) COLLATE "C"'
+                ))
+                print('[OK] search_nameカラムの照合順序を "C" に変更しました。')
+
+            # SQLiteとPostgreSQLで構文が同じなので統一
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_ingredients_store_search_name "
+                "ON ingredients (store_id, search_name, id)"
+            ))
+            connection.commit()
+
+        print("[OK] マイグレーションが正常に完了しました。")
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] マイグレーション中にエラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == '__main__':
+    success = migrate_database()
+    sys.exit(0 if success else 1)
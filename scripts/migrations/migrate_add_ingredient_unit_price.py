@@ -0,0 +1,95 @@
+"""
+データベースマイグレーション: 材料の密度・使用単位あたり単価の追加
+材料テーブルに密度(density)と使用単位あたりの単価(usage_price、1/10^8円単位の整数)の列を追加し、
+既存の材料の単価を計算して保存します。原価計算では保存済みの単価に使用量を掛けるだけになります。
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from sqlalchemy import bindparam, create_engine, inspect, text
+from app.money import usage_price
+
+BATCH_SIZE = 1000
+
+
+def migrate_database():
+    """ingredientsテーブルにdensity・usage_priceカラムを追加して単価を保存"""
+
+    # DATABASE_URLの取得
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///instance/bakery.db')
+
+    # RenderのPostgreSQLは postgres:// で始まるが、SQLAlchemyは postgresql:// が必要
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+
+    print("=" * 60)
+    print("データベースマイグレーション: 材料の使用単位あたり単価の追加")
+    print("=" * 60)
+    print(f"データベース接続: {database_url.split('@')[0]}@...")
+    print()
+
+    try:
+        # エンジンを作成
+        engine = create_engine(database_url)
+
+        # テーブルが存在するか確認
+        inspector = inspect(engine)
+        if 'ingredients' not in inspector.get_table_names():
+            print("エラー: ingredientsテーブルが見つかりません。")
+            print("先にアプリケーションを起動してデータベースを初期化してください。")
+            return False
+
+        columns = [col['name'] for col in inspector.get_columns('ingredients')]
+
+        with engine.connect() as connection:
+            if 'density' in columns:
+                print("[OK] densityカラムは既に存在します。")
+            else:
+                connection.execute(text("ALTER TABLE ingredients ADD COLUMN density NUMERIC(8, 4)"))
+                print("[OK] densityカラムを追加しました。")
+
+            if 'usage_price' in columns:
+                print("[OK] usage_priceカラムは既に存在します。")
+            else:
+                connection.execute(text("ALTER TABLE ingredients ADD COLUMN usage_price BIGINT"))
+                print("[OK] usage_priceカラムを追加しました。")
+
+            # 既存の材料の使用単位あたり単価を保存（app.money と同じ整数計算）
+            rows = connection.execute(text(
+                "SELECT id, purchase_price, purchase_quantity, purchase_unit, usage_unit, density, unit_price "
+                "FROM ingredients"
+            )).all()
+            statement = text("UPDATE ingredients SET usage_price = :price WHERE id = :row_id")\
+                .bindparams(bindparam('price'), bindparam('row_id'))
+            params = []
+            for row in rows:
+                try:
+                    price = usage_price(row.purchase_price, row.purchase_quantity, row.purchase_unit,
+                                        row.usage_unit, row.density, row.unit_price)
+                except ValueError as e:
+                    # 単価が大きすぎる材料は未計算のまま残す（材料の編集画面で購入情報を直す）
+                    print(f"[WARN] 材料ID {row.id}: {e}")
+                    continue
+                params.append({'row_id': row.id, 'price': price})
+            for start in range(0, len(params), BATCH_SIZE):
+                connection.execute(statement, params[start:start + BATCH_SIZE])
+            print(f"[OK] {len(params)}件の材料の単価を保存しました。")
+
+            connection.commit()
+
+        print()
+        print("[OK] マイグレーションが正常に完了しました。")
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] マイグレーション中にエラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+if __name__ == '__main__':
+    success = migrate_database()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,70 @@
+"""
+データベースマイグレーション: 一覧表示用の複合インデックスと外部キーのインデックスの追加
+店舗ごとのレシピ・材料一覧（更新日・登録日順、キーセット方式のページネーション）用の
+(store_id, updated_at, id) / (store_id, created_at, id) インデックスと、
+インデックスのなかった外部キー列のインデックスを追加します。
+"""
+import os
+import sys
+from sqlalchemy import create_engine, inspect, text
+
+# (インデックス名, テーブル名, 列)
+INDEXES = [
+    ('ix_recipes_store_updated', 'recipes', 'store_id, updated_at, id'),
+    ('ix_recipes_store_created', 'recipes', 'store_id, created_at, id'),
+    ('ix_ingredients_store_created', 'ingredients', 'store_id, created_at, id'),
+    ('ix_ingredients_store_updated', 'ingredients', 'store_id, updated_at, id'),
+    ('ix_recipe_ingredients_recipe_id', 'recipe_ingredients', 'recipe_id'),
+    ('ix_custom_cost_items_store_id', 'custom_cost_items', 'store_id'),
+]
+
+def migrate_database():
+    """一覧表示用の複合インデックスと外部キーのインデックスを追加"""
+
+    # DATABASE_URLの取得
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///instance/bakery.db')
+
+    # RenderのPostgreSQLは postgres:// で始まるが、SQLAlchemyは postgresql:// が必要
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+
+    print("=" * 60)
+    print("データベースマイグレーション: 一覧表示用インデックス追加")
+    print("=" * 60)
+    print(f"データベース接続: {database_url.split('@')[0]}@...")
+    print()
+
+    try:
+        # エンジンを作成
+        engine = create_engine(database_url)
+
+        # テーブルが存在するか確認
+        inspector = inspect(engine)
+        table_names = inspector.get_table_names()
+        missing = sorted({table for _name, table, _columns in INDEXES} - set(table_names))
+        if missing:
+            print(f"エラー: テーブルが見つかりません: {', '.join(missing)}")
+            print("先にアプリケーションを起動してデータベースを初期化してください。")
+            return False
+
+        with engine.connect() as connection:
+            for name, table, columns in INDEXES:
+                print(f"{name}インデックスを作成しています...")
+                # SQLiteとPostgreSQLで構文が同じなので統一
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"
+                ))
+            connection.commit()
+
+        print("[OK] マイグレーションが正常に完了しました。")
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] マイグレーション中にエラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == '__main__':
+    success = migrate_database()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,71 @@
+"""
+データベースマイグレーション: 名前検索用の列と索引の追加
+店舗・材料・レシピのテーブルに正規化した名前(search_name)の列を追加して既存データを埋め、
+PostgreSQLでは pg_trgm の GIN インデックス、SQLiteでは FTS5(trigram) の索引とトリガーを作成します。
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from sqlalchemy import bindparam, inspect, text
+from app import create_app
+from app.models import db
+from app.search import SEARCH_TABLES, install_search_index, search_key
+
+BATCH_SIZE = 1000
+
+
+def migrate_database():
+    """search_name列を追加して既存データを正規化し、検索用の索引を作成"""
+    app = create_app()
+
+    print("=" * 60)
+    print("データベースマイグレーション: 名前検索用の列と索引の追加")
+    print("=" * 60)
+
+    with app.app_context():
+        try:
+            inspector = inspect(db.engine)
+
+            with db.engine.connect() as connection:
+                for table_name, source_column in SEARCH_TABLES.items():
+                    columns = [col['name'] for col in inspector.get_columns(table_name)]
+                    if 'search_name' in columns:
+                        print(f"[OK] {table_name}.search_nameカラムは既に存在します。")
+                    else:
+                        connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN search_name VARCHAR(100)"))
+                        print(f"[OK] {table_name}.search_nameカラムを追加しました。")
+
+                    # 既存データの正規化した名前を保存
+                    rows = connection.execute(text(f"SELECT id, {source_column} FROM {table_name}")).all()
+                    statement = text(f"UPDATE {table_name} SET search_name = :search_name WHERE id = :row_id")\
+                        .bindparams(bindparam('search_name'), bindparam('row_id'))
+                    params = [{'row_id': row_id, 'search_name': search_key(name)} for row_id, name in rows]
+                    for start in range(0, len(params), BATCH_SIZE):
+                        connection.execute(statement, params[start:start + BATCH_SIZE])
+                    print(f"[OK] {table_name}: {len(params)}件の検索用の名前を保存しました。")
+
+                connection.commit()
+
+            backend = install_search_index(db.engine, rebuild=True)
+            if backend == 'like':
+                print("[WARN] 検索用の索引を作成できませんでした。LIKEによる検索を使用します。")
+            else:
+                print(f"[OK] 検索用の索引を作成しました（{backend}）。")
+
+            print()
+            print("[OK] マイグレーションが正常に完了しました。")
+            return True
+
+        except Exception as e:
+            print(f"[ERROR] マイグレーション中にエラーが発生しました: {e}")
+            db.session.rollback()
+            import traceback
+            traceback.print_exc()
+            return False
+
+
+if __name__ == '__main__':
+    success = migrate_database()
+    sys.exit(0 if success else 1)
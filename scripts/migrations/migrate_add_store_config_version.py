@@ -0,0 +1,62 @@
+"""
+データベースマイグレーション: 店舗の原価設定の版番号の追加
+店舗テーブルに config_version 列を追加します。
+原価設定・カスタム原価項目の変更時に版番号が上がり、各ワーカーの原価設定のキャッシュが無効になります。
+"""
+import os
+import sys
+from sqlalchemy import create_engine, inspect, text
+
+def migrate_database():
+    """storesテーブルにconfig_versionカラムを追加"""
+
+    # DATABASE_URLの取得
+    database_url = os.environ.get('DATABASE_URL', 'sqlite:///instance/bakery.db')
+
+    # RenderのPostgreSQLは postgres:// で始まるが、SQLAlchemyは postgresql:// が必要
+    if database_url.startswith('postgres://'):
+        database_url = database_url.replace('postgres://', 'postgresql://', 1)
+
+    print("=" * 60)
+    print("データベースマイグレーション: 原価設定の版番号追加")
+    print("=" * 60)
+    print(f"データベース接続: {database_url.split('@')[0]}@...")
+    print()
+
+    try:
+        # エンジンを作成
+        engine = create_engine(database_url)
+
+        # テーブルが存在するか確認
+        inspector = inspect(engine)
+        if 'stores' not in inspector.get_table_names():
+            print("エラー: storesテーブルが見つかりません。")
+            print("先にアプリケーションを起動してデータベースを初期化してください。")
+            return False
+
+        columns = [col['name'] for col in inspector.get_columns('stores')]
+        if 'config_version' in columns:
+            print("[OK] config_versionカラムは既に存在します。マイグレーション不要です。")
+            return True
+
+        print("config_versionカラムを追加しています...")
+
+        with engine.connect() as connection:
+            # SQLiteとPostgreSQLで構文が同じなので統一
+            connection.execute(text(
+                "ALTER TABLE stores ADD COLUMN config_version INTEGER NOT NULL DEFAULT 0"
+            ))
+            connection.commit()
+
+        print("[OK] マイグレーションが正常に完了しました。")
+        return True
+
+    except Exception as e:
+        print(f"[ERROR] マイグレーション中にエラーが発生しました: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+if __name__ == '__main__':
+    success = migrate_database()
+    sys.exit(0 if success else 1)
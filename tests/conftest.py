@@ -0,0 +1,71 @@
+import pytest
+from app import create_app, store_config
+from app.models import db, Store, CostSetting, Ingredient, Recipe, RecipeIngredient, CustomCostItem
+
+
+@pytest.fixture
+def app_config():
+    """テストごとに追加する設定（モジュールで上書きする）"""
+    return {}
+
+
+@pytest.fixture
+def app(tmp_path, app_config):
+    """テスト用のアプリケーション（SQLiteのメモリDB、遅延ロードはエラー）"""
+    store_config.clear_cache()
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+        'WTF_CSRF_ENABLED': False,
+        'LABEL_FONT_WARMUP': False,
+        'LABEL_CACHE_DIR': str(tmp_path / 'label_cache'),
+        'LABEL_JOB_DIR': str(tmp_path / 'label_jobs'),
+        **app_config,
+    })
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+    store_config.clear_cache()
+
+
+@pytest.fixture
+def store(app):
+    """原価設定・材料・レシピ・カスタム原価項目を登録した店舗"""
+    with app.app_context():
+        shop = Store(login_id='shop1', store_name='テストベーカリー')
+        shop.set_password('password1')
+        db.session.add(shop)
+        db.session.flush()
+        db.session.add(CostSetting(store_id=shop.id, profit_margin=30))
+
+        flour = Ingredient(store_id=shop.id, name='強力粉', purchase_price=500, purchase_quantity=2,
+                           purchase_unit='kg', usage_unit='g', is_allergen=True, allergen_type='小麦')
+        butter = Ingredient(store_id=shop.id, name='バター', purchase_price=800, purchase_quantity=450,
+                            purchase_unit='g', usage_unit='g', is_allergen=True, allergen_type='乳')
+        egg = Ingredient(store_id=shop.id, name='卵', purchase_price=300, purchase_quantity=10,
+                         purchase_unit='個', usage_unit='個', is_allergen=True, allergen_type='卵')
+        db.session.add_all([flour, butter, egg])
+        db.session.flush()
+
+        for index in range(25):
+            recipe = Recipe(store_id=shop.id, product_name=f'食パン{index}', category='食パン',
+                            production_quantity=10, production_time=60, shelf_life_days=3)
+            db.session.add(recipe)
+            db.session.flush()
+            db.session.add(RecipeIngredient(recipe_id=recipe.id, ingredient_id=flour.id, quantity=250))
+            db.session.add(RecipeIngredient(recipe_id=recipe.id, ingredient_id=butter.id, quantity=30 + index))
+
+        db.session.add(CustomCostItem(store_id=shop.id, name='包装費', calculation_type='per_unit', amount=10))
+        db.session.add(CustomCostItem(store_id=shop.id, name='人件費', calculation_type='per_time', amount=20))
+        db.session.commit()
+        return shop.id
+
+
+@pytest.fixture
+def client(app, store):
+    """ログイン済みのテストクライアント"""
+    client = app.test_client()
+    response = client.post('/auth/login', data={'login_id': 'shop1', 'password': 'password1'})
+    assert response.status_code == 302
+    return client
@@ -0,0 +1,32 @@
+from decimal import Decimal
+from app.costing import StoreCostEngine, preview_price_changes
+from app.models import db, Ingredient, Recipe
+
+
+def test_model_methods_engine_and_snapshot_agree(app, store):
+    with app.app_context():
+        engine = StoreCostEngine.for_store(store)
+        recipes = Recipe.query.filter_by(store_id=store).all()
+        costs = engine.price(recipes)
+        for recipe in recipes:
+            cost = costs[recipe.id]
+            assert recipe.calculate_material_cost() == cost.material_cost
+            assert recipe.calculate_total_cost(engine.cost_setting) == cost.total_cost
+            assert recipe.calculate_unit_cost(engine.cost_setting) == cost.unit_cost == float(recipe.cost_unit)
+            assert recipe.calculate_suggested_price(engine.cost_setting) == cost.suggested_price \
+                == float(recipe.cost_suggested_price)
+
+
+def test_preview_matches_the_saved_snapshot(app, store):
+    with app.app_context():
+        butter = Ingredient.query.filter_by(store_id=store, name='バター').one()
+        deltas = preview_price_changes(store, {butter.id: {'purchase_price': Decimal('777')}})
+        assert len(deltas) == 25
+
+        butter.purchase_price = Decimal('777')
+        db.session.commit()
+        assert isinstance(butter.usage_price, int)
+        for delta in deltas:
+            recipe = db.session.get(Recipe, delta.recipe.id)
+            assert delta.cost.unit_cost == float(recipe.cost_unit)
+            assert delta.cost.suggested_price == float(recipe.cost_suggested_price)
@@ -0,0 +1,46 @@
+from decimal import Decimal
+from app import money
+from app.models import db, Ingredient
+
+FORM = {
+    'name': '金箔',
+    'purchase_price': '20000',
+    'purchase_quantity': '0.001',
+    'purchase_unit': '個',
+    'usage_unit': '個',
+}
+
+
+def test_smallest_purchase_quantity_is_saved(app, client):
+    response = client.post('/ingredients/create', data=FORM)
+    assert response.status_code == 302
+    with app.app_context():
+        ingredient = Ingredient.query.filter_by(name='金箔').one()
+        assert ingredient.usage_price == 20000000 * money.PRICE_SCALE
+        assert ingredient.get_usage_unit_price() == 20000000.0
+
+
+def test_usage_price_over_the_column_range_is_a_form_error(app, client):
+    data = dict(FORM, purchase_price='99999999.99', purchase_unit='ml', usage_unit='kg', density='0.001')
+    response = client.post('/ingredients/create', data=data)
+    assert response.status_code == 200
+    assert '単価が大きすぎます' in response.get_data(as_text=True)
+    with app.app_context():
+        assert Ingredient.query.filter_by(name='金箔').count() == 0
+
+
+def test_price_over_the_column_precision_is_a_form_error(client):
+    response = client.post('/ingredients/create', data=dict(FORM, purchase_price='100000000'))
+    assert response.status_code == 200
+    assert '99,999,999.99以下' in response.get_data(as_text=True)
+
+
+def test_unit_prices_use_the_display_rounding(app, client):
+    # 0.125円/g は四捨五入で 0.13円（"%.2f" では 0.12円になる）
+    client.post('/ingredients/create', data=dict(FORM, name='砂糖', purchase_price='125',
+                                                 purchase_quantity='1', purchase_unit='kg', usage_unit='g'))
+    page = client.get('/ingredients/').get_data(as_text=True)
+    assert '0.13円/g' in page
+
+    response = client.get('/ingredients/lookup?q=砂')
+    assert response.json['items'][0]['unit_price_label'] == '0.13'
@@ -0,0 +1,53 @@
+import pytest
+from app.instrumentation import QueryBudgetExceeded, metrics
+
+
+@pytest.fixture
+def app_config():
+    return {
+        'INSTRUMENTATION_ENABLED': True,
+        'METRICS_TOKEN': 'secret',
+        'QUERY_BUDGETS': {'recipes': 10, 'recipes.index': 1},
+        'QUERY_BUDGET_ACTION': 'raise',
+    }
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+def test_request_over_budget_raises(client):
+    with pytest.raises(QueryBudgetExceeded) as info:
+        client.get('/recipes/')
+    assert info.value.endpoint == 'recipes.index'
+    assert info.value.budget == 1
+    assert info.value.queries > 1
+
+
+def test_request_within_budget_passes(client):
+    response = client.get('/recipes/1/detail')
+    assert response.status_code == 200
+    assert 'db;dur=' in response.headers['Server-Timing']
+
+
+def test_budget_is_logged_unless_raise(app, client, caplog):
+    app.config['QUERY_BUDGET_ACTION'] = 'log'
+    assert client.get('/recipes/').status_code == 200
+    assert 'Query budget exceeded: recipes.index' in caplog.text
+    assert 'bakery_query_budget_exceeded_total{endpoint="recipes.index"} 1' in metrics.render()
+
+
+def test_metrics_require_the_token(client):
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+
+def test_metrics_are_hidden_without_a_token(app, client):
+    app.config['METRICS_TOKEN'] = None
+    assert client.get('/metrics').status_code == 404
@@ -0,0 +1,63 @@
+import os
+import time
+from app import label_jobs
+
+
+def _write(path, size, age=0):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+    if age:
+        past = time.time() - age
+        os.utime(path, (past, past))
+
+
+def test_job_result_copied_to_the_cache_is_evicted_down_to_the_limit(tmp_path):
+    cache = tmp_path / 'cache'
+    cache.mkdir()
+    for index in range(3):
+        _write(cache / f'old{index}.pdf', 400, age=100 - index)
+    pdf = tmp_path / 'job.pdf'
+    _write(pdf, 600)
+
+    target = str(cache / 'new.pdf')
+    label_jobs._copy_to_cache(str(pdf), target, max_bytes=1000)
+
+    names = sorted(os.listdir(cache))
+    assert 'new.pdf' in names
+    assert not [name for name in names if name.endswith('.tmp')]
+    assert sum(os.path.getsize(cache / name) for name in names) <= 1000
+
+
+def _job(directory, job_id, status, age, **extra):
+    label_jobs._write_status(str(directory), job_id, dict(job_id=job_id, status=status, **extra))
+    _write(directory / f'{job_id}.pdf', 10, age=age)
+    past = time.time() - age
+    os.utime(directory / f'{job_id}.json', (past, past))
+
+
+def test_cleanup_keeps_running_jobs_and_measures_age_from_finish(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(label_jobs, '_last_cleanup', 0.0)
+    app.config['LABEL_JOB_TTL'] = 3600
+    directory = tmp_path / 'label_jobs'
+    directory.mkdir(exist_ok=True)
+    now = time.time()
+    _job(directory, 'a' * 32, 'running', age=7200)
+    _job(directory, 'b' * 32, 'queued', age=7200)
+    _job(directory, 'c' * 32, 'done', age=7200, finished_at=now - 60)
+    _job(directory, 'd' * 32, 'done', age=7200, finished_at=now - 7200)
+    _job(directory, 'e' * 32, 'running', age=label_jobs.STALE_JOB_AGE + 60)
+
+    label_jobs.cleanup_expired(app)
+
+    remaining = {name.split('.', 1)[0] for name in os.listdir(directory)}
+    assert remaining == {'a' * 32, 'b' * 32, 'c' * 32}
+
+
+def test_cleanup_is_throttled(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(label_jobs, '_last_cleanup', time.time())
+    directory = tmp_path / 'label_jobs'
+    directory.mkdir(exist_ok=True)
+    _job(directory, 'd' * 32, 'done', age=7200, finished_at=0)
+
+    label_jobs.cleanup_expired(app)
+    assert os.path.exists(directory / f'{"d" * 32}.json')
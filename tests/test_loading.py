@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy.exc import InvalidRequestError
+from app.loading import load_profile
+from app.models import Recipe
+
+LABEL_FORM = {
+    'label_preset': '28765',
+    'label_count': '1',
+    'production_date': '2026-10-18',
+    'show_cost': 'on',
+    'show_price': 'on',
+}
+
+
+def test_pages_render_under_the_lazy_load_guard(client):
+    # TESTING では想定外の遅延ロードがエラーになるため、画面が表示できればプロファイルで足りている
+    assert client.get('/recipes/').status_code == 200
+    assert client.get('/recipes/?page=2').status_code == 200
+    assert client.get('/recipes/1/detail').status_code == 200
+    assert client.get('/labels/1').status_code == 200
+
+    response = client.post('/labels/1/generate', data=LABEL_FORM)
+    assert response.status_code == 200
+    assert response.data[:4] == b'%PDF'
+
+
+def test_guard_rejects_relationships_outside_the_profile(app, store):
+    with app.app_context():
+        recipe = Recipe.query.options(*load_profile('listing')).filter_by(store_id=store).first()
+        with pytest.raises(InvalidRequestError):
+            recipe.recipe_ingredients
+
+
+def test_guard_is_off_unless_enabled(app, store):
+    app.config['RAISE_ON_LAZY_LOAD'] = False
+    with app.app_context():
+        recipe = Recipe.query.options(*load_profile('listing')).filter_by(store_id=store).first()
+        assert len(recipe.recipe_ingredients) == 2
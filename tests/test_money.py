@@ -0,0 +1,52 @@
+from decimal import Decimal
+import pytest
+from app import money
+
+
+def test_divide_rounds_half_to_even():
+    assert money.divide(5, 2) == 2
+    assert money.divide(7, 2) == 4
+    assert money.divide(-5, 2) == -2
+    assert money.divide(5, -2) == -2
+    assert money.divide(10, 3) == 3
+    assert money.divide(11, 3) == 4
+
+
+def test_round_yen_rounds_half_up():
+    assert money.round_yen(Decimal('2.5')) == Decimal('3')
+    assert money.round_yen(Decimal('3.5')) == Decimal('4')
+    assert money.round_yen(Decimal('1.005'), 2) == Decimal('1.01')
+    assert money.round_yen(2.675, 2) == Decimal('2.68')
+    assert money.round_yen(None) is None
+
+
+def test_format_yen():
+    assert money.format_yen(Decimal('2.5')) == '3'
+    assert money.format_yen(Decimal('-0.4')) == '0'
+    assert money.format_yen(None) == ''
+
+
+def test_usage_price_is_exact():
+    # 800円/450g は割り切れないため 1/10^8 円単位で持つ
+    price = money.usage_price(Decimal('800'), Decimal('450'), 'g', 'g')
+    assert price == 177777778
+    # 450g 使うと 800円 ちょうどになる
+    assert money.line_cost(price, Decimal('450')) == 800 * money.SUBUNITS
+
+
+def test_usage_price_converts_units_and_falls_back_to_legacy_price():
+    assert money.usage_price(Decimal('500'), Decimal('2'), 'kg', 'g') == money.PRICE_SCALE // 4
+    assert money.usage_price(None, None, None, None, legacy_unit_price=Decimal('1.5')) == \
+        money.PRICE_SCALE * 3 // 2
+    assert money.usage_price(None, None, None, None) == 0
+
+
+def test_usage_price_fits_bigint_at_the_form_limits():
+    # 購入数量 0.001・個→個 でも保存できる
+    assert money.usage_price(Decimal('20000'), Decimal('0.001'), '個', '個') == 20000000 * money.PRICE_SCALE
+    assert money.usage_price(Decimal('9200000'), Decimal('0.001'), 'g', 'g') <= money.MAX_USAGE_PRICE
+    # 上限（約922億円）を超える組み合わせは保存前にエラー
+    with pytest.raises(ValueError):
+        money.usage_price(Decimal('99999999.99'), Decimal('0.001'), 'g', 'g')
+    with pytest.raises(ValueError):
+        money.usage_price(Decimal('99999999.99'), Decimal('0.001'), 'ml', 'kg', Decimal('0.001'))
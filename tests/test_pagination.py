@@ -0,0 +1,46 @@
+from datetime import datetime
+from decimal import Decimal
+import pytest
+from app.pagination import decode_cursor, encode_cursor, keyset_paginate
+from app.models import Recipe
+
+
+def test_cursor_round_trip():
+    values = [datetime(2026, 10, 18, 9, 30, 15, 123456), Decimal('12.3400'), 42, 'あんぱん']
+    cursor = encode_cursor(values, 'prev')
+    assert decode_cursor(cursor, len(values)) == (values, 'prev')
+
+
+@pytest.mark.parametrize('cursor', [
+    'not-a-cursor!!',
+    encode_cursor([1, 2], 'sideways'),
+    encode_cursor([1], 'next'),
+    encode_cursor([{'x': 1}, 2], 'next'),
+    encode_cursor([1, 2, 3], 'next'),
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 2)
+
+
+def test_keyset_pages_cover_every_row(app, store):
+    order_by = [(Recipe.updated_at, True), (Recipe.id, True)]
+    with app.app_context():
+        query = Recipe.query.filter_by(store_id=store)
+        seen = []
+        cursor = None
+        while True:
+            page = keyset_paginate(query, order_by, cursor, per_page=10)
+            seen.extend(recipe.id for recipe in page.items)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        assert len(seen) == len(set(seen)) == 25
+
+        back = keyset_paginate(query, order_by, page.prev_cursor, per_page=10)
+        assert [recipe.id for recipe in back.items] == seen[10:20]
+
+
+def test_listing_ignores_a_tampered_cursor(client):
+    response = client.get('/recipes/?cursor=tampered')
+    assert response.status_code == 200
@@ -0,0 +1,48 @@
+import io
+from decimal import Decimal
+from app.models import db, Ingredient
+from app.price_list import import_price_list
+
+
+def _import(store_id, text, **kwargs):
+    return import_price_list(store_id, io.BytesIO(text.encode('utf-8')), 'prices.csv', **kwargs)
+
+
+def test_supplier_miss_falls_back_to_the_ingredient_without_a_supplier(app, store):
+    with app.app_context():
+        result = _import(store, '材料名,仕入先,購入価格\n強力粉,山田製粉,600\n')
+        assert (result.updated, result.created, result.errors) == (1, 0, [])
+        flours = Ingredient.query.filter_by(store_id=store, name='強力粉').all()
+        assert len(flours) == 1
+        assert flours[0].purchase_price == Decimal('600.00')
+
+
+def test_supplier_miss_against_another_supplier_is_a_row_error(app, store):
+    with app.app_context():
+        butter = Ingredient.query.filter_by(store_id=store, name='バター').one()
+        butter.supplier = '北海道乳業'
+        db.session.commit()
+
+        result = _import(store, '材料名,仕入先,購入価格\nバター,東京商事,900\n')
+        assert (result.updated, result.created) == (0, 0)
+        assert len(result.errors) == 1 and '北海道乳業' in result.errors[0][1]
+        assert Ingredient.query.filter_by(store_id=store, name='バター').count() == 1
+
+
+def test_values_beyond_the_column_precision_are_row_errors(app, store):
+    with app.app_context():
+        result = _import(store, '材料名,購入価格,購入数量\n'
+                                '強力粉,100000000,1\n'
+                                '卵,300,10000000\n'
+                                'バター,99999999.99,450\n')
+        assert [line for line, _message in result.errors] == [2, 3]
+        assert result.updated == 1
+        assert Ingredient.query.filter_by(store_id=store, name='バター').one().purchase_price == \
+            Decimal('99999999.99')
+
+
+def test_usage_price_over_the_limit_is_a_row_error(app, store):
+    with app.app_context():
+        result = _import(store, '材料名,購入価格,購入数量\n卵,99999999.99,0.001\n')
+        assert result.updated == 0
+        assert '単価が大きすぎます' in result.errors[0][1]
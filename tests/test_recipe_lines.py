@@ -0,0 +1,63 @@
+from decimal import Decimal
+import pytest
+from app.models import db, Store, Ingredient, Recipe, RecipeIngredient
+from app.recipe_lines import save_recipe_lines
+
+
+def _lines(recipe_id):
+    return [(ri.ingredient_id, ri.quantity) for ri in
+            RecipeIngredient.query.filter_by(recipe_id=recipe_id).order_by(RecipeIngredient.id)]
+
+
+def test_inserts_updates_and_deletes_only_the_difference(app, store):
+    with app.app_context():
+        recipe = Recipe.query.filter_by(store_id=store).order_by(Recipe.id).first()
+        flour, butter, egg = Ingredient.query.filter_by(store_id=store).order_by(Ingredient.id).all()
+        flour_row_id = RecipeIngredient.query.filter_by(recipe_id=recipe.id, ingredient_id=flour.id).one().id
+        old_cost = recipe.cost_unit
+
+        changes = save_recipe_lines(recipe, [(flour.id, Decimal('250.000')), (egg.id, Decimal('2.000'))])
+        db.session.commit()
+
+        assert changes.inserted == [(egg.id, Decimal('2.000'))]
+        assert changes.updated == []
+        assert changes.deleted == [(butter.id, Decimal('30.000'))]
+        assert _lines(recipe.id) == [(flour.id, Decimal('250.000')), (egg.id, Decimal('2.000'))]
+        # 変更のない行はそのまま残る
+        assert RecipeIngredient.query.filter_by(recipe_id=recipe.id, ingredient_id=flour.id).one().id == flour_row_id
+        # 原価スナップショットも再計算される
+        assert changes.cost_delta is not None
+        assert db.session.get(Recipe, recipe.id).cost_unit != old_cost
+
+        changes = save_recipe_lines(recipe, [(flour.id, Decimal('300.000')), (egg.id, Decimal('2.000'))])
+        db.session.commit()
+        assert changes.updated == [(flour.id, Decimal('250.000'), Decimal('300.000'))]
+        assert not changes.inserted and not changes.deleted
+
+
+def test_unchanged_lines_write_nothing(app, store):
+    with app.app_context():
+        recipe = Recipe.query.filter_by(store_id=store).order_by(Recipe.id).first()
+        changes = save_recipe_lines(recipe, _lines(recipe.id))
+        assert not changes.changed
+        assert changes.cost_delta is None
+
+
+def test_rejects_ingredients_of_another_store(app, store):
+    with app.app_context():
+        other = Store(login_id='shop2', store_name='別の店')
+        other.set_password('password2')
+        db.session.add(other)
+        db.session.flush()
+        foreign = Ingredient(store_id=other.id, name='強力粉', purchase_price=100, purchase_quantity=1,
+                             purchase_unit='kg', usage_unit='g')
+        db.session.add(foreign)
+        db.session.commit()
+
+        recipe = Recipe.query.filter_by(store_id=store).order_by(Recipe.id).first()
+        before = _lines(recipe.id)
+        with pytest.raises(ValueError):
+            save_recipe_lines(recipe, [(foreign.id, Decimal('1.000'))])
+        with pytest.raises(ValueError):
+            save_recipe_lines(recipe, [(foreign.id + 100, Decimal('1.000'))])
+        assert _lines(recipe.id) == before
@@ -0,0 +1,17 @@
+import pytest
+from app.search import search_key
+
+
+@pytest.mark.parametrize('value', ['バター', 'ﾊﾞﾀｰ', 'ばたー', ' バ ター '])
+def test_kana_width_and_spaces_are_normalised(value):
+    assert search_key(value) == 'ばたー'
+
+
+def test_latin_letters_are_folded():
+    assert search_key('ＣＲＯＩＳＳＡＮＴ Ａ') == 'croissanta'
+    assert search_key('Straße') == 'strasse'
+
+
+def test_empty_values():
+    assert search_key(None) == ''
+    assert search_key('') == ''